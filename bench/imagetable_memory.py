@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Compare memory used by fully parsed image data held as lists of
+# ddicts and as an ImageTable.
+#
+# usage: bench/imagetable_memory.py [copies]
+#
+# The selectdata fixture is repeated "copies" times (default 10) in
+# separate directories to make a larger trip.
+
+import json
+import os
+import sys
+import time
+
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+benchDirectory = os.path.dirname(os.path.realpath(sys.argv[0]))
+gpspixtraxDirectory = os.path.dirname(benchDirectory)
+sys.path[0:0] = [gpspixtraxDirectory]
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import imagetable
+
+def deepsize(obj, seen):
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deepsize(k, seen) + deepsize(v, seen)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deepsize(x, seen) for x in obj)
+    elif isinstance(obj, (imagetable.ImageTable, imagetable.Column)):
+        size += deepsize(obj.__dict__, seen)
+    return size
+
+def records(copies):
+    fixture = os.path.join(gpspixtraxDirectory, 'unit_test', 'data',
+                           'selectdata.json.xz')
+    data = json.loads(lzma.open(fixture).read().decode('utf-8'))
+    for copy in range(copies):
+        for record in data:
+            record = dict(record)
+            record['SourceFile'] = '%d/%s' %(copy, record['SourceFile'])
+            yield record
+
+def measure(name, imagedata, keep):
+    start = time.time()
+    gpspixtrax.GPSPixTrax(imagedata).parse()
+    elapsed = time.time() - start
+    size = deepsize(keep, set())
+    images = sum(len(x) for x in imagedata)
+    print('%-10s %8d images %10.1f MiB %6d bytes/image %7.2f s parse' %(
+        name, images, size / 1048576.0, size // images, elapsed))
+
+def main(argv):
+    copies = int(argv[1]) if len(argv) > 1 else 10
+    imagedata = list(exiftool.sliceimages(records(copies)))
+    measure('ddict', imagedata, imagedata)
+    del imagedata
+    table = imagetable.ImageTable.fromrecords(records(copies))
+    measure('ImageTable', table.slices, table)
+
+if __name__ == '__main__':
+    main(sys.argv)
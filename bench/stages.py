@@ -0,0 +1,218 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Time each stage of processing a synthetic trip, and the memory it
+# allocates, and compare them with a baseline saved from an earlier run.
+#
+# usage: bench/stages.py [--images N] [--days N] [--seed N]
+#                        [--save baseline.json] [--baseline baseline.json]
+#                        [--tolerance 0.25] [--no-memory] [--processes N]
+#
+# The exiftool output for the trip is generated in memory first, so the
+# fetchdata stage measures reading exiftool's JSON into slices, but not
+# exiftool itself.  Memory is measured with tracemalloc, where there is
+# one, in a second run, so that tracing does not slow the timed run.
+# With --processes, pass2 and pass3 run in a pool of that many processes
+# through parallel.ParallelGPSPixTrax, to compare with the serial passes.
+# Exits with status 1 if any stage is slower, or allocates more at its
+# peak, than the baseline by more than the tolerance.
+
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import time
+
+benchDirectory = os.path.dirname(os.path.realpath(sys.argv[0]))
+gpspixtraxDirectory = os.path.dirname(benchDirectory)
+sys.path[0:0] = [gpspixtraxDirectory]
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import kml
+from gpspixtrax import parallel
+from gpspixtrax import synthetic
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+STAGES = ('fetchdata', 'parsetime', 'sortslices', 'offsets', 'pass2', 'pass3',
+          'kml')
+
+# differences smaller than this are noise, whatever the ratio
+MINSECONDS = 0.05
+MINBYTES = 1048576
+
+clock = getattr(time, 'perf_counter', time.time)
+cpuclock = getattr(time, 'process_time', None) or time.clock
+
+class Output(list):
+    write = list.append
+
+def exiftooljson(args):
+    output = Output()
+    records = synthetic.trip(images=args.images, days=args.days,
+                             seed=args.seed)
+    synthetic.dump(records, output)
+    return ''.join(output)
+
+def writekml(imagedata):
+    for i, slice in enumerate(imagedata):
+        kml.KMLPaths(slice).writeKMLPaths(io.BytesIO(), str(i))
+
+def stages(text, processes=None):
+    'generate (name, function) for each stage, in order'
+    state = {}
+    def fetchdata():
+        # exiftool's output is already in hand
+        invoke = exiftool.invoke_exiftool
+        exiftool.invoke_exiftool = lambda filelist: text
+        try:
+            imagedata = exiftool.fetchdata([])
+            if processes:
+                state['G'] = parallel.ParallelGPSPixTrax(
+                    imagedata, processes=processes)
+            else:
+                state['G'] = gpspixtrax.GPSPixTrax(imagedata)
+        finally:
+            exiftool.invoke_exiftool = invoke
+    yield 'fetchdata', fetchdata
+    for name in STAGES[1:-1]:
+        yield name, lambda name=name: getattr(state['G'], name)()
+    yield 'kml', lambda: writekml(state['G'].imagedata)
+
+def maxrss():
+    'high water mark of the resident set size in bytes'
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+def timed(text, processes=None):
+    results = {}
+    for name, function in stages(text, processes):
+        start = clock()
+        cpu = cpuclock()
+        function()
+        results[name] = {
+            'seconds': clock() - start,
+            'cpu': cpuclock() - cpu,
+            'maxrss': maxrss(),
+        }
+    return results
+
+def traced(text, results, processes=None):
+    tracemalloc.start()
+    try:
+        for name, function in stages(text, processes):
+            current, _ = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.clear_traces()
+            function()
+            _, peak = tracemalloc.get_traced_memory()
+            results[name]['peak'] = max(0, peak - current)
+    finally:
+        tracemalloc.stop()
+
+def regressions(results, baseline, tolerance):
+    'list of (stage, measure, value, baseline value) worse than baseline'
+    worse = []
+    for name in STAGES:
+        old = baseline['stages'].get(name)
+        if old is None:
+            continue
+        for measure, noise in (('seconds', MINSECONDS), ('peak', MINBYTES)):
+            if measure not in old or measure not in results[name]:
+                continue
+            value = results[name][measure]
+            if (value > old[measure] * (1 + tolerance) and
+                value - old[measure] > noise):
+                worse.append((name, measure, value, old[measure]))
+    return worse
+
+def report(results, images, baseline):
+    print('%-10s %9s %9s %9s %10s %10s' %(
+        'stage', 'seconds', 'us/image', 'peak MiB', 'maxrss MiB',
+        'baseline'))
+    for name in STAGES:
+        r = results[name]
+        old = ''
+        if baseline and name in baseline['stages']:
+            old = '%.3f s' %baseline['stages'][name]['seconds']
+        peak = '-'
+        if 'peak' in r:
+            peak = '%.1f' %(r['peak'] / 1048576.0)
+        print('%-10s %9.3f %9.1f %9s %10.1f %10s' %(
+            name, r['seconds'], r['seconds'] * 1e6 / images, peak,
+            r['maxrss'] / 1048576.0, old))
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='benchmark each processing stage on a synthetic trip')
+    parser.add_argument('--images', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='write the results as a baseline')
+    parser.add_argument('--baseline', help='compare with this baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='fraction worse than the baseline allowed')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the tracemalloc run')
+    parser.add_argument('--processes', type=int,
+                        help='run pass2 and pass3 in this many processes')
+    args = parser.parse_args(argv[1:])
+
+    baseline = None
+    if args.baseline:
+        baseline = json.load(open(args.baseline))
+        trip = dict(images=args.images, days=args.days, seed=args.seed)
+        if baseline['trip'] != trip:
+            parser.error('baseline is for a different trip: %r'
+                         %baseline['trip'])
+
+    start = clock()
+    text = exiftooljson(args)
+    print('generated %d images in %.1f s' %(args.images, clock() - start))
+    results = timed(text, args.processes)
+    if args.memory and tracemalloc is not None:
+        traced(text, results, args.processes)
+    report(results, args.images, baseline)
+
+    if args.save:
+        f = open(args.save, 'w')
+        json.dump({'trip': dict(images=args.images, days=args.days,
+                                seed=args.seed),
+                   'python': sys.version.split()[0],
+                   'stages': results}, f, indent=1, sort_keys=True)
+        f.close()
+    if baseline:
+        worse = regressions(results, baseline, args.tolerance)
+        for name, measure, value, old in worse:
+            print('REGRESSION %s %s: %r, baseline %r' %(name, measure, value,
+                                                        old))
+        if worse:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,240 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# exiftool for asyncio programs, python 3.6 and later only.  The same
+# -stay_open protocol as exiftool.ExifToolWorker, but driven through
+# asyncio.subprocess so that nothing blocks the event loop:
+#
+#   async with aioexiftool.AsyncExifToolPool(workers=4) as pool:
+#       async for images in aioexiftool.iterdata(filelist, pool):
+#           ...
+#
+# Batches of files wait in a bounded queue for a worker, so a producer
+# submitting faster than exiftool can read is made to wait in submit().
+# No more batches than the queue holds are outstanding for one iterfetch
+# at a time, so results waiting behind a slow batch stay bounded too.  A
+# batch that takes longer than timeout seconds has its exiftool killed,
+# and an exiftool that exits is restarted; either way the batch it was
+# working on is tried again up to retries times, then fails with
+# ExifToolError.
+
+import asyncio
+import collections
+import json
+import os
+
+from . import ddict
+from . import exiftool
+
+ExifToolError = exiftool.ExifToolError
+
+# exiftool -j lines are short, but a tag holding binary data need not be
+LINELIMIT = 1 << 20
+
+class AsyncExifToolWorker(object):
+    'one long-lived exiftool -stay_open process'
+    def __init__(self, program=None):
+        if program is None:
+            program = str(exiftool.exiftool.executable)
+        self.program = program
+        self.sequence = 0
+        self.process = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            self.program, '-stay_open', 'True', '-@', '-',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            limit=LINELIMIT)
+
+    async def execute(self, *args):
+        'run one exiftool command, returning its stdout'
+        if self.process is None:
+            await self.start()
+        self.sequence += 1
+        ready = '{ready%d}' %self.sequence
+        lines = list(args) + ['-execute%d' %self.sequence]
+        self.process.stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+        try:
+            await self.process.stdin.drain()
+        except ConnectionError:
+            raise ExifToolError('exiftool exited while processing command')
+        output = []
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise ExifToolError('exiftool exited while processing command')
+            line = line.decode('utf-8')
+            if line.rstrip() == ready:
+                return ''.join(output)
+            output.append(line)
+
+    async def fetch(self, filelist):
+        'return list of parsed exiftool records for filelist'
+        output = await self.execute('-n', '-j', *(exiftool.TAGS +
+                                                  tuple(filelist)))
+        if not output.strip():
+            # no readable files in this batch
+            return []
+        return json.loads(output)
+
+    def kill(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.kill()
+
+    async def close(self):
+        if self.process is None:
+            return
+        if self.process.returncode is None:
+            try:
+                self.process.stdin.write(b'-stay_open\nFalse\n')
+                await self.process.stdin.drain()
+                self.process.stdin.close()
+            except ConnectionError:
+                pass
+        await self.process.wait()
+        self.process = None
+
+class AsyncExifToolPool(object):
+    'pool of persistent exiftool workers fed batches from a bounded queue'
+    def __init__(self, workers=None, batchsize=500, queuesize=None,
+                 timeout=300.0, retries=1, program=None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.size = workers
+        self.batchsize = batchsize
+        # batches waiting for a worker before submit() waits too
+        self.queuesize = queuesize or workers * 2
+        self.timeout = timeout
+        self.retries = retries
+        self.program = program
+        self.queue = None
+        self.tasks = []
+        self.workers = []
+
+    async def start(self):
+        self.queue = asyncio.Queue(self.queuesize)
+        for _ in range(self.size):
+            worker = AsyncExifToolWorker(self.program)
+            self.workers.append(worker)
+            self.tasks.append(asyncio.ensure_future(self.serve(worker)))
+
+    async def serve(self, worker):
+        while True:
+            batch, future = await self.queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                records = await self.attempt(worker, batch)
+                if not future.cancelled():
+                    future.set_result(records)
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+    async def attempt(self, worker, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.wait_for(worker.fetch(batch),
+                                              self.timeout)
+            except asyncio.TimeoutError:
+                # exiftool may be stuck on a file; a fresh one is needed
+                await self.restart(worker)
+                if attempt == self.retries:
+                    raise ExifToolError('exiftool took more than %s s for %d '
+                                        'files' %(self.timeout, len(batch)))
+            except ExifToolError:
+                await self.restart(worker)
+                if attempt == self.retries:
+                    raise
+
+    async def restart(self, worker):
+        worker.kill()
+        await worker.close()
+
+    def batches(self, filelist):
+        'split filelist into batches, spreading small lists across all workers'
+        filelist = list(filelist)
+        size = -(-len(filelist) // self.size)
+        size = max(1, min(size, self.batchsize))
+        return [filelist[i:i+size] for i in range(0, len(filelist), size)]
+
+    async def submit(self, batch):
+        '''future for the records of batch; waits while the queue is full'''
+        if self.queue is None:
+            await self.start()
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((batch, future))
+        return future
+
+    async def iterfetch(self, filelist):
+        'yield parsed exiftool records in filelist order as batches complete'
+        pending = collections.deque()
+        for batch in self.batches(filelist):
+            if len(pending) >= self.queuesize:
+                # wait for the oldest rather than pile up results behind it
+                for record in await pending.popleft():
+                    yield record
+            pending.append(await self.submit(batch))
+            while pending and pending[0].done():
+                for record in pending.popleft().result():
+                    yield record
+        while pending:
+            for record in await pending.popleft():
+                yield record
+
+    async def fetch(self, filelist):
+        'return list of parsed exiftool records in the same order as filelist'
+        return [x async for x in self.iterfetch(filelist)]
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        for worker in self.workers:
+            await worker.close()
+        self.workers = []
+        self.queue = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+async def iterdata(filelist, pool):
+    '''yield list of images per directory specified in grouped filelist as
+    soon as exiftool has finished with each directory'''
+    currentslice = []
+    lastDir = None
+    async for record in pool.iterfetch(filelist):
+        image = ddict.ddict(record)
+        thisDir = os.path.dirname(image.SourceFile)
+        if currentslice and lastDir != thisDir:
+            yield currentslice
+            currentslice = []
+        currentslice.append(image)
+        lastDir = thisDir
+    if currentslice:
+        yield currentslice
+
+async def fetchdata(filelist, pool):
+    'return list of lists of images per directory specified in filelist'
+    return exiftool.groupimages(await pool.fetch(filelist))
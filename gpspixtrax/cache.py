@@ -0,0 +1,190 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+# kinds of record: as exiftool reports them, or as fetchnative reads
+# them, without the tags that only exiftool can read
+EXIFTOOL = 'exiftool'
+NATIVE = 'native'
+
+def defaultpath():
+    cachedir = os.environ.get('XDG_CACHE_HOME',
+                              os.path.expanduser('~/.cache'))
+    return os.path.join(cachedir, 'gpspixtrax', 'exiftool.sqlite')
+
+def filekey(path):
+    'return (size, mtime_ns, inode) for path, or None if it cannot be read'
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    mtime = getattr(st, 'st_mtime_ns', None)
+    if mtime is None:
+        mtime = int(st.st_mtime * 1000000000)
+    return (st.st_size, mtime, st.st_ino)
+
+class MetadataCache(object):
+    '''persistent cache of parsed exiftool records keyed by path, size,
+    mtime and inode, and by the kind of record, as records read natively
+    lack some tags that exiftool reports'''
+    def __init__(self, path=None, maxentries=1000000):
+        if path is None:
+            path = defaultpath()
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.path = path
+        self.maxentries = maxentries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        columns = [x[1] for x in
+                   self.db.execute('PRAGMA table_info(records)').fetchall()]
+        if columns and 'kind' not in columns:
+            # from before records had kinds; nothing says which they are
+            self.db.execute('DROP TABLE records')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS records (
+                               path TEXT,
+                               kind TEXT,
+                               size INTEGER,
+                               mtime INTEGER,
+                               inode INTEGER,
+                               used REAL,
+                               record TEXT,
+                               PRIMARY KEY (path, kind))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS records_used ON records (used)')
+        self.db.commit()
+
+    def lookup(self, filelist, kind=EXIFTOOL):
+        '''return (dict of cached records of kind by file, list of files
+        not cached)'''
+        found = {}
+        misses = []
+        used = []
+        for filename in filelist:
+            key = filekey(filename)
+            path = os.path.abspath(filename)
+            row = self.db.execute(
+                'SELECT size, mtime, inode, record FROM records '
+                'WHERE path = ? AND kind = ?', (path, kind)).fetchone()
+            if key is None or row is None or tuple(row[0:3]) != key:
+                misses.append(filename)
+                continue
+            record = json.loads(row[3])
+            # same file may have been named differently last time
+            record['SourceFile'] = filename
+            found[filename] = record
+            used.append(path)
+        self.hits += len(found)
+        self.misses += len(misses)
+        if used:
+            now = time.time()
+            self.db.executemany(
+                'UPDATE records SET used = ? WHERE path = ? AND kind = ?',
+                ((now, x, kind) for x in used))
+            self.db.commit()
+        return found, misses
+
+    def update(self, records, kind=EXIFTOOL):
+        '''store exiftool records of kind, evicting least recently used
+        entries if full'''
+        now = time.time()
+        rows = []
+        for record in records:
+            key = filekey(record['SourceFile'])
+            if key is None:
+                continue
+            rows.append((os.path.abspath(record['SourceFile']), kind) + key +
+                        (now, json.dumps(record)))
+        self.db.executemany(
+            'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        self.evict()
+        self.db.commit()
+
+    def evict(self):
+        excess = len(self) - self.maxentries
+        if excess > 0:
+            self.db.execute('''DELETE FROM records WHERE rowid IN (
+                                   SELECT rowid FROM records
+                                   ORDER BY used LIMIT ?)''', (excess,))
+
+    def fetch(self, filelist, fetcher, kind=EXIFTOOL):
+        '''return records of kind for filelist in order, calling fetcher
+        with the list of files that are not cached'''
+        filelist = list(filelist)
+        found, misses = self.lookup(filelist, kind)
+        if misses:
+            fetched = fetcher(misses)
+            self.update(fetched, kind)
+            for record in fetched:
+                found[record['SourceFile']] = record
+        return [found[x] for x in filelist if x in found]
+
+    def invalidate(self, filelist=None):
+        'forget cached records for filelist, or for all files'
+        if filelist is None:
+            self.db.execute('DELETE FROM records')
+        else:
+            self.db.executemany('DELETE FROM records WHERE path = ?',
+                                ((os.path.abspath(x),) for x in filelist))
+        self.db.commit()
+
+    def vacuum(self):
+        'drop records for files that have changed or gone away, then compact'
+        stale = [(path,) for path, size, mtime, inode in self.db.execute(
+                     'SELECT path, size, mtime, inode FROM records').fetchall()
+                 if filekey(path) != (size, mtime, inode)]
+        self.db.executemany('DELETE FROM records WHERE path = ?', stale)
+        self.db.commit()
+        self.db.execute('VACUUM')
+        return len(stale)
+
+    def stats(self):
+        return {'entries': len(self), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+def main(argv):
+    'usage: cache.py [--cache path] stats|vacuum|invalidate [file...]'
+    path = None
+    if argv[1:2] == ['--cache']:
+        path = argv[2]
+        argv = argv[0:1] + argv[3:]
+    if len(argv) < 2 or argv[1] not in ('stats', 'vacuum', 'invalidate'):
+        sys.stderr.write(main.__doc__ + '\n')
+        return 1
+    cache = MetadataCache(path)
+    if argv[1] == 'stats':
+        print('%d entries in %s' %(len(cache), cache.path))
+    elif argv[1] == 'vacuum':
+        print('removed %d stale entries' %cache.vacuum())
+    else:
+        cache.invalidate(argv[2:] or None)
+    cache.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -18,6 +18,9 @@
 class ddict(dict):
     def __getattr__(self, key):
         # allow . for fetch for easier reading
+        if key.startswith('__'):
+            # special methods looked up by copy and pickle are not keys
+            raise AttributeError(key)
         return self[key]
     def __setattr__(self, key, value):
         # add keys only explicitly by [] to avoid bugs
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Finding the images under import roots.  Directories are listed by a
+# pool of threads, a level of the tree at a time, so that the latency of
+# each listing on a network filesystem overlaps with the others rather
+# than adding up.  Files are grouped by the directory they are in, each
+# group ordered by filename number as imagecmp orders them, and the
+# groups ordered by directory, so that the list fetchdata is given has
+# every directory together however the listings came back.
+#
+# Whole subtrees can be left out: with dates, a directory named for a
+# date (20130607, 2013-06-07, 2013_06_07-2, ...) outside the range, and
+# with newer, a directory not modified since then.  A directory's mtime
+# changes only when entries are added to or removed from it, not its
+# subdirectories, so newer suits archives where each import gets a
+# directory of its own.
+
+import datetime
+from multiprocessing.pool import ThreadPool
+import os
+import re
+
+from . import gpspixtrax
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+EXTENSIONS = set(('.jpg', '.jpeg', '.arw', '.cr2', '.cr3', '.nef', '.dng',
+                  '.orf', '.raf', '.rw2', '.tif', '.tiff', '.heic'))
+
+DATENAME = re.compile(r'(?<!\d)(\d{4})[-_]?(\d{2})[-_]?(\d{2})(?!\d)')
+
+# listings in flight; they wait on the server, not the CPU
+WORKERS = 16
+
+def isimage(path):
+    return os.path.splitext(path)[1].lower() in EXTENSIONS
+
+def namedate(name):
+    'date a directory is named for, or None'
+    match = DATENAME.search(name)
+    if match is None:
+        return None
+    try:
+        return datetime.date(*[int(x) for x in match.groups()])
+    except ValueError:
+        return None
+
+def listdirectory(directory):
+    'list of (name, isdirectory, mtime) in directory; mtime only for directories'
+    entries = []
+    if scandir is not None:
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+                entries.append((entry.name, True, mtime))
+            else:
+                entries.append((entry.name, False, None))
+        return entries
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            entries.append((name, True, os.lstat(path).st_mtime))
+        else:
+            entries.append((name, False, None))
+    return entries
+
+def filekey(name):
+    return gpspixtrax.namekey(name) + (name,)
+
+class Discovery(object):
+    '''images under roots as (directory, files) for every directory listed,
+    including those with no images'''
+    def __init__(self, roots, workers=WORKERS, dates=None, newer=None,
+                 extensions=EXTENSIONS, onerror=None):
+        self.roots = list(roots)
+        self.workers = workers
+        # (first, last) datetime.date, either None for no limit
+        self.dates = dates
+        # seconds since the epoch
+        self.newer = newer
+        self.extensions = extensions
+        # called with the OSError for a directory that cannot be listed,
+        # which is then left out, as for os.walk
+        self.onerror = onerror
+
+    def prune(self, name, mtime):
+        'whether to leave out the subdirectory name modified at mtime'
+        if self.newer is not None and mtime < self.newer:
+            return True
+        if self.dates is not None:
+            date = namedate(name)
+            if date is not None:
+                first, last = self.dates
+                if first is not None and date < first:
+                    return True
+                if last is not None and date > last:
+                    return True
+        return False
+
+    def list(self, directory):
+        try:
+            return directory, listdirectory(directory)
+        except OSError as e:
+            if self.onerror is not None:
+                self.onerror(e)
+            return directory, None
+
+    def groups(self):
+        groups = {}
+        threads = ThreadPool(self.workers)
+        try:
+            level = self.roots
+            while level:
+                subdirectories = []
+                for directory, entries in threads.imap_unordered(self.list,
+                                                                 level):
+                    if entries is None:
+                        continue
+                    names = []
+                    for name, isdirectory, mtime in entries:
+                        if isdirectory:
+                            if not self.prune(name, mtime):
+                                subdirectories.append(
+                                    os.path.join(directory, name))
+                        elif os.path.splitext(name)[1].lower() in self.extensions:
+                            names.append(name)
+                    names.sort(key=filekey)
+                    groups[directory] = [os.path.join(directory, x)
+                                         for x in names]
+                level = subdirectories
+        finally:
+            threads.close()
+            threads.join()
+        return sorted(groups.items())
+
+def discover(roots, **kwargs):
+    'list of (directory, files) for roots; see Discovery for kwargs'
+    return Discovery(roots, **kwargs).groups()
+
+def filelist(groups):
+    'every file in groups, in order, for fetchdata'
+    return [x for _, files in groups for x in files]
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import calendar
+from datetime import datetime
+import re
+
+from dateutil import parser as dateparser
+from dateutil import tz
+
+UTC = tz.tzutc()
+
+# YYYY:MM:DD HH:MM:SS[.ffffff][Z] as written by exiftool, also accepting
+# the ISO 8601 separators used in GPX files
+TIMESTAMP = re.compile(
+    r'(\d{4})[:-](\d\d)[:-](\d\d)[ T](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?(Z?)$')
+
+def iso8601(datestring):
+    'convert EXIF date string to iso8601 or close enough to parse'
+    return datestring.replace(':', '-', 2).replace(' ', 'T', 1)
+
+def epoch(dt):
+    'seconds since 1970 for an aware datetime, or a naive one taken as UTC'
+    return calendar.timegm(dt.utctimetuple()) + dt.microsecond * 0.000001
+
+class TimestampParser(object):
+    '''parse EXIF and GPS timestamps into the same datetimes dateutil would
+    return, only using dateutil for strings not in the expected format'''
+    def __init__(self):
+        self.fallbacks = 0
+
+    def fields(self, datestring):
+        'return datetime constructor arguments, or None if not fixed-format'
+        match = TIMESTAMP.match(datestring)
+        if match is None:
+            return None
+        (year, month, day, hour, minute, second,
+         fraction, zulu) = match.groups()
+        microsecond = 0
+        if fraction:
+            microsecond = int(fraction.ljust(6, '0'))
+        return (int(year), int(month), int(day), int(hour), int(minute),
+                int(second), microsecond, zulu and UTC or None)
+
+    def parse(self, datestring):
+        'return datetime, aware only if datestring has a time zone'
+        fields = self.fields(datestring)
+        if fields is not None:
+            try:
+                return datetime(*fields)
+            except ValueError:
+                # out of range, like 0000:00:00 00:00:00; let dateutil decide
+                pass
+        self.fallbacks += 1
+        return dateparser.parse(iso8601(datestring))
+
+    def epoch(self, datestring):
+        'return seconds since 1970, taking naive timestamps as UTC'
+        return epoch(self.parse(datestring))
@@ -15,45 +15,292 @@
 #  limitations under the License.
 #
 
+import collections
+import itertools
 import json
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import os
+import subprocess
+import threading
 
 from plumbum.cmd import exiftool
 
-import ddict
+from . import ddict
+from . import jpegexif
+
+TAGS = (
+    '-GPSDateTime',
+    '-GPSAltitude',
+    '-GPSLatitude',
+    '-GPSLongitude',
+    '-GPSSpeed',
+    '-GPSStatus',
+    '-GPSTrack',
+    '-GPSMeasureMode',
+    '-DateTimeOriginal',
+    '-ShotNumberSincePowerUp',
+)
+
+# tags read without exiftool; nothing reads the shot number, which lives
+# in vendor MakerNotes that jpegexif leaves to exiftool, so native records
+# lack it and are cached apart from exiftool's
+NATIVETAGS = tuple(x[1:] for x in TAGS if x != '-ShotNumberSincePowerUp')
+
+class ExifToolError(Exception):
+    pass
 
 def invoke_exiftool(filelist):
-    return exiftool(
-        '-n', '-j',
-        '-GPSDateTime',
-        '-GPSAltitude',
-        '-GPSLatitude',
-        '-GPSLongitude',
-        '-GPSSpeed',
-        '-GPSStatus',
-        '-GPSTrack',
-        '-GPSMeasureMode',
-        '-DateTimeOriginal',
-        '-ShotNumberSincePowerUp',
-        *filelist)
-
-def fetchdata(filelist):
-    'return list of lists of images per directory specified in assumed-sorted filelist'
-    imagelist = [ddict.ddict(x)
-                 for x in json.loads(invoke_exiftool(filelist))]
-    imagedata = []
+    return exiftool('-n', '-j', *(TAGS + tuple(filelist)))
+
+def iterjson(stream):
+    'yield each object of the JSON array written by exiftool -j as it is read'
+    decoder = json.JSONDecoder()
+    pending = ''
+    for line in iter(stream.readline, ''):
+        pending += line
+        if '}' not in line:
+            # exiftool records never end mid-line
+            continue
+        while True:
+            pending = pending.lstrip(' \t\r\n,[]')
+            if not pending:
+                break
+            try:
+                record, end = decoder.raw_decode(pending)
+            except ValueError:
+                # record not complete yet
+                break
+            yield record
+            pending = pending[end:]
+    if pending.strip(' \t\r\n,[]'):
+        raise ExifToolError('truncated JSON output from exiftool')
+
+def iterexiftool(filelist):
+    'yield exiftool records for filelist as exiftool writes them'
+    process = exiftool.popen(('-n', '-j') + TAGS + tuple(filelist),
+                             stdout=subprocess.PIPE,
+                             stderr=None,
+                             universal_newlines=True)
+    try:
+        for record in iterjson(process.stdout):
+            yield record
+    finally:
+        process.stdout.close()
+        process.wait()
+
+class ExifToolWorker(object):
+    'one long-lived exiftool -stay_open process reading arguments from stdin'
+    def __init__(self):
+        self.sequence = 0
+        self.process = exiftool.popen(('-stay_open', 'True', '-@', '-'),
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=None,
+                                      universal_newlines=True)
+
+    def execute(self, *args):
+        'run one exiftool command, returning its stdout'
+        return self.executemany([args])[0]
+
+    def executemany(self, commands):
+        'run a list of exiftool commands, returning the stdout of each'
+        # all written at once, so that exiftool never waits on us between
+        # commands; each command writes only a line or two of output
+        lines = []
+        readies = []
+        for args in commands:
+            self.sequence += 1
+            lines.extend(args)
+            lines.append('-execute%d' %self.sequence)
+            readies.append('{ready%d}' %self.sequence)
+        self.process.stdin.write('\n'.join(lines) + '\n')
+        self.process.stdin.flush()
+        outputs = []
+        for ready in readies:
+            output = []
+            while True:
+                line = self.process.stdout.readline()
+                if not line:
+                    raise ExifToolError('exiftool exited while processing command')
+                if line.rstrip() == ready:
+                    break
+                output.append(line)
+            outputs.append(''.join(output))
+        return outputs
+
+    def fetch(self, filelist):
+        'return list of parsed exiftool records for filelist'
+        output = self.execute('-n', '-j', *(TAGS + tuple(filelist)))
+        if not output.strip():
+            # no readable files in this batch
+            return []
+        return json.loads(output)
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.write('-stay_open\nFalse\n')
+            self.process.stdin.flush()
+            self.process.stdin.close()
+            self.process.wait()
+
+class ExifToolPool(object):
+    'pool of persistent exiftool workers each fed batches of files'
+    def __init__(self, workers=None, batchsize=500):
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.size = workers
+        self.batchsize = batchsize
+        self.workers = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.threads = ThreadPool(workers)
+
+    def worker(self):
+        # each pool thread owns exactly one exiftool process
+        worker = getattr(self.local, 'worker', None)
+        if worker is None:
+            worker = ExifToolWorker()
+            self.local.worker = worker
+            with self.lock:
+                self.workers.append(worker)
+        return worker
+
+    def _fetch(self, batch):
+        return self.worker().fetch(batch)
+
+    def _executemany(self, commands):
+        return self.worker().executemany(commands)
+
+    def batches(self, filelist):
+        'split filelist into batches, spreading small lists across all workers'
+        filelist = list(filelist)
+        size = -(-len(filelist) // self.size)
+        size = max(1, min(size, self.batchsize))
+        return [filelist[i:i+size] for i in range(0, len(filelist), size)]
+
+    def iterfetch(self, filelist):
+        'yield parsed exiftool records in filelist order as batches complete'
+        batches = self.batches(filelist)
+        # keep only a few batches in flight so that memory stays bounded
+        window = self.size * 2
+        for i in range(0, len(batches), window):
+            for batch in self.threads.imap(self._fetch, batches[i:i+window]):
+                for record in batch:
+                    yield record
+
+    def fetch(self, filelist):
+        'return list of parsed exiftool records in the same order as filelist'
+        return list(self.iterfetch(filelist))
+
+    def iterbatches(self, commands):
+        '''yield a list of the stdout of each command for each batch of the
+        list of exiftool commands, in order, as the workers finish them'''
+        batches = self.batches(commands)
+        window = self.size * 2
+        for i in range(0, len(batches), window):
+            for outputs in self.threads.imap(self._executemany,
+                                             batches[i:i+window]):
+                yield outputs
+
+    def iterexecute(self, commands):
+        '''yield the stdout of each of the list of exiftool commands, in
+        order, running them in batches across the workers'''
+        for outputs in self.iterbatches(commands):
+            for output in outputs:
+                yield output
+
+    def close(self):
+        self.threads.close()
+        self.threads.join()
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+            self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def fetchnative(filelist, pool=None):
+    '''return list of records for filelist read without exiftool where
+    possible, passing only the files that cannot be read natively to exiftool'''
+    filelist = list(filelist)
+    records = [jpegexif.readexif(x, NATIVETAGS) for x in filelist]
+    misses = [x for x, record in zip(filelist, records) if record is None]
+    if misses:
+        fetched = dict((x['SourceFile'], x) for x in fetchrecords(misses, pool))
+        records = [record or fetched.get(x)
+                   for x, record in zip(filelist, records)]
+    return [x for x in records if x is not None]
+
+def fetchrecords(filelist, pool=None, native=False):
+    'return list of parsed exiftool records for filelist'
+    if native:
+        return fetchnative(filelist, pool)
+    if pool is None:
+        return json.loads(invoke_exiftool(filelist))
+    return pool.fetch(filelist)
+
+def fetchcached(filelist, pool=None, cache=None, native=False):
+    'return list of records for filelist, using cache if provided'
+    if cache is None:
+        return fetchrecords(filelist, pool, native)
+    # only files missing from the cache are read at all, and records read
+    # natively are never served to a run reading with exiftool
+    return cache.fetch(filelist, lambda x: fetchrecords(x, pool, native),
+                       'native' if native else 'exiftool')
+
+def iterchunks(filelist, chunksize, fetch):
+    filelist = iter(filelist)
+    while True:
+        chunk = list(itertools.islice(filelist, chunksize))
+        if not chunk:
+            return
+        for record in fetch(chunk):
+            yield record
+
+def iterrecords(filelist, pool=None, cache=None, native=False, chunksize=1000):
+    'return iterator over records for filelist that reads them incrementally'
+    if cache is None and not native:
+        if pool is None:
+            return iterexiftool(filelist)
+        return pool.iterfetch(filelist)
+    return iterchunks(filelist, chunksize,
+                      lambda x: fetchcached(x, pool, cache, native))
+
+def sliceimages(records):
+    'yield a list of images for each run of records from the same directory'
     currentslice = []
-    last = imagelist[0]
-    for image in imagelist:
+    lastDir = None
+    for record in records:
+        image = ddict.ddict(record)
         thisDir = os.path.dirname(image.SourceFile)
-        if not currentslice:
-            currentslice.append(image)
-        else:
-            if lastDir == thisDir:
-                currentslice.append(image)
-            else:
-                imagedata.append(currentslice)
-                currentslice = [image]
+        if currentslice and lastDir != thisDir:
+            yield currentslice
+            currentslice = []
+        currentslice.append(image)
         lastDir = thisDir
-    imagedata.append(currentslice)
-    return imagedata
+    if currentslice:
+        yield currentslice
+
+def iterdata(filelist, pool=None, cache=None, native=False):
+    '''yield list of images per directory specified in assumed-sorted filelist
+    as soon as exiftool has finished with each directory'''
+    return sliceimages(iterrecords(filelist, pool, cache, native))
+
+def groupimages(records):
+    '''return a list of images for each directory of records, in the order
+    each directory is first seen, however its records are spread out'''
+    slices = collections.OrderedDict()
+    for record in records:
+        image = ddict.ddict(record)
+        thisDir = os.path.dirname(image.SourceFile)
+        slices.setdefault(thisDir, []).append(image)
+    return list(slices.values())
+
+def fetchdata(filelist, pool=None, cache=None, native=False):
+    'return list of lists of images per directory specified in filelist'
+    return groupimages(fetchcached(filelist, pool, cache, native))
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Index of the verified (GPSStatus 'A') fixes in processed image data by
+# GPS time, answering nearest-fix and time window queries by bisection.
+# Times may be given as datetimes or as seconds since 1970 UTC.
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+from . import exiftime
+
+def seconds(time):
+    if hasattr(time, 'utctimetuple'):
+        return exiftime.epoch(time)
+    return float(time)
+
+class FixIndex(object):
+    'verified fixes from imagedata in GPS time order'
+    def __init__(self, imagedata):
+        fixes = [(exiftime.epoch(image.gpstime), image)
+                 for slice in imagedata for image in slice
+                 if image.GPSStatus == 'A']
+        # stable, so fixes at the same time stay in slice order
+        fixes.sort(key=lambda x: x[0])
+        self.times = array('d', [x[0] for x in fixes])
+        self.fixes = [x[1] for x in fixes]
+
+    def __len__(self):
+        return len(self.fixes)
+
+    def before(self, time):
+        'last fix at or before time, or None'
+        i = bisect_right(self.times, seconds(time))
+        if i:
+            return self.fixes[i-1]
+        return None
+
+    def after(self, time):
+        'first fix at or after time, or None'
+        i = bisect_left(self.times, seconds(time))
+        if i < len(self.fixes):
+            return self.fixes[i]
+        return None
+
+    def bracket(self, time):
+        'return (last fix before time, first fix after time), either None'
+        time = seconds(time)
+        i = bisect_left(self.times, time)
+        j = bisect_right(self.times, time)
+        if i < j:
+            # a fix at exactly time is both
+            return self.fixes[i], self.fixes[j-1]
+        return (self.fixes[i-1] if i else None,
+                self.fixes[i] if i < len(self.fixes) else None)
+
+    def nearest(self, time):
+        'fix closest in time, the earlier one if two are equally close'
+        time = seconds(time)
+        i = bisect_left(self.times, time)
+        if i == len(self.fixes):
+            i -= 1
+        elif i and time - self.times[i-1] <= self.times[i] - time:
+            i -= 1
+        if i < 0:
+            return None
+        return self.fixes[i]
+
+    def window(self, start, end):
+        'list of fixes from start to end inclusive, in time order'
+        return self.fixes[bisect_left(self.times, seconds(start)):
+                          bisect_right(self.times, seconds(end))]
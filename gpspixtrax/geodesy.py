@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Great circle calculations, for single points and for whole arrays of
+# points at once.  The array versions take any mix of sequences and
+# scalars, use numpy when it is installed and the arrays are long enough
+# to be worth it, and otherwise fall back to the scalar formulas.
+#
+# formulas from http://www.movable-type.co.uk/scripts/latlong.html
+
+import itertools
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+R = 6371.0 # km
+
+# below this many points, numpy call overhead costs more than it saves
+MINVECTOR = 32
+
+def haversine(lat1, lon1, lat2, lon2):
+    'distance between points on a circular earth'
+    dLat = math.radians(lat2-lat1)
+    dLon = math.radians(lon2-lon1)
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    a = (math.pow(math.sin(dLat/2), 2) +
+         math.pow(math.sin(dLon/2), 2) * math.cos(lat1) * math.cos(lat2))
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
+
+def bearing(lat1, lon1, lat2, lon2):
+    'initial bearing from location 1 to location 2 on great circle route'
+    dLon = math.radians(lon2-lon1)
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    y = math.sin(dLon) * math.cos(lat2)
+    x = (math.cos(lat1) * math.sin(lat2) -
+         math.sin(lat1) * math.cos(lat2) * math.cos(dLon))
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+def project(lat, lon, bearing, distance):
+    'project lat, lon destination from start point, bearing, distance'
+    dR = distance/R
+    lat = math.radians(lat)
+    lon = math.radians(lon)
+    dlat = math.asin(math.sin(lat) * math.cos(dR) +
+                     math.cos(lat) * math.sin(dR) * math.cos(bearing))
+    dlon = lon + math.atan2(math.sin(bearing) * math.sin(dR) * math.cos(lat),
+                            math.cos(dR) - math.sin(lat) * math.sin(dlat))
+    return (math.degrees(dlat), math.degrees(dlon))
+
+def length(*args):
+    'return length of the sequence arguments, or None if all are scalars'
+    lengths = set(len(x) for x in args if hasattr(x, '__len__'))
+    if len(lengths) > 1:
+        raise ValueError('arrays of different lengths')
+    if lengths:
+        return lengths.pop()
+    return None
+
+def vectorize(n):
+    return numpy is not None and n >= MINVECTOR
+
+def columns(*args):
+    'iterate over the arguments in parallel, repeating scalars'
+    return zip(*[x if hasattr(x, '__len__') else itertools.repeat(x)
+                 for x in args])
+
+def haversines(lat1, lon1, lat2, lon2):
+    'list of haversine distances between corresponding points'
+    n = length(lat1, lon1, lat2, lon2)
+    if n is None:
+        return [haversine(lat1, lon1, lat2, lon2)]
+    if not vectorize(n):
+        return [haversine(*x) for x in columns(lat1, lon1, lat2, lon2)]
+    lat1, lon1, lat2, lon2 = [numpy.asarray(x, dtype=float)
+                              for x in (lat1, lon1, lat2, lon2)]
+    dLat = numpy.radians(lat2-lat1)
+    dLon = numpy.radians(lon2-lon1)
+    a = (numpy.sin(dLat/2) ** 2 + numpy.sin(dLon/2) ** 2 *
+         numpy.cos(numpy.radians(lat1)) * numpy.cos(numpy.radians(lat2)))
+    c = 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1-a))
+    return (R * c).tolist()
+
+def bearings(lat1, lon1, lat2, lon2):
+    'list of initial bearings from points 1 to corresponding points 2'
+    n = length(lat1, lon1, lat2, lon2)
+    if n is None:
+        return [bearing(lat1, lon1, lat2, lon2)]
+    if not vectorize(n):
+        return [bearing(*x) for x in columns(lat1, lon1, lat2, lon2)]
+    lat1, lon1, lat2, lon2 = [numpy.asarray(x, dtype=float)
+                              for x in (lat1, lon1, lat2, lon2)]
+    dLon = numpy.radians(lon2-lon1)
+    lat1 = numpy.radians(lat1)
+    lat2 = numpy.radians(lat2)
+    cosLat2 = numpy.cos(lat2)
+    y = numpy.sin(dLon) * cosLat2
+    x = (numpy.cos(lat1) * numpy.sin(lat2) -
+         numpy.sin(lat1) * cosLat2 * numpy.cos(dLon))
+    return ((numpy.degrees(numpy.arctan2(y, x)) + 360) % 360).tolist()
+
+def projects(lat, lon, bearing, distance):
+    'lists of latitudes and longitudes projected from corresponding points'
+    n = length(lat, lon, bearing, distance)
+    if n is None:
+        lat, lon = project(lat, lon, bearing, distance)
+        return [lat], [lon]
+    if not vectorize(n):
+        points = [project(*x) for x in columns(lat, lon, bearing, distance)]
+        return [x[0] for x in points], [x[1] for x in points]
+    lat, lon, bearing, distance = [numpy.asarray(x, dtype=float)
+                                   for x in (lat, lon, bearing, distance)]
+    dR = distance/R
+    lat = numpy.radians(lat)
+    lon = numpy.radians(lon)
+    sinLat = numpy.sin(lat)
+    cosLat = numpy.cos(lat)
+    sindR = numpy.sin(dR)
+    cosdR = numpy.cos(dR)
+    dlat = numpy.arcsin(sinLat * cosdR + cosLat * sindR * numpy.cos(bearing))
+    dlon = lon + numpy.arctan2(numpy.sin(bearing) * sindR * cosLat,
+                               cosdR - sinLat * numpy.sin(dlat))
+    return numpy.degrees(dlat).tolist(), numpy.degrees(dlon).tolist()
+
+def speeds(distances, seconds):
+    'list of absolute speeds in km/h, 0 where no time has passed'
+    if not vectorize(len(distances)):
+        return [math.fabs(d / (s / 3600.0)) if s else 0
+                for d, s in zip(distances, seconds)]
+    distances = numpy.asarray(distances, dtype=float)
+    seconds = numpy.asarray(seconds, dtype=float)
+    moving = seconds != 0
+    result = numpy.zeros(len(distances))
+    result[moving] = numpy.fabs(distances[moving] / (seconds[moving] / 3600.0))
+    return [x if m else 0 for m, x in zip(moving.tolist(), result.tolist())]
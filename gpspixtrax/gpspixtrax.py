@@ -16,110 +16,68 @@
 #  limitations under the License.
 #
 
-from dateutil import parser as dateparser
-from datetime import datetime
-import math
 import os
+import re
 import sys
 
-import ddict
+from . import ddict
+from . import exiftime
+from . import fixindex
+from . import geodesy
+from . import snapshot
+from . import spatialindex
+from . import tzsolve
+from . import writeback
 
-class GPSPixTrax(object):
-    def __init__(self, imagedata):
-        self.imagedata = imagedata
+NONDIGITS = re.compile(r'\D')
 
-    @staticmethod
-    def haversine(lat1, lon1, lat2, lon2):
-        'distance between points on a circular earth'
-        # formula from http://www.movable-type.co.uk/scripts/latlong.html
-        R = 6371.0 # km
-        dLat = math.radians(lat2-lat1)
-        dLon = math.radians(lon2-lon1)
-        lat1 = math.radians(lat1)
-        lat2 = math.radians(lat2)
-        a = (math.pow(math.sin(dLat/2), 2) +
-             math.pow(math.sin(dLon/2), 2) * math.cos(lat1) * math.cos(lat2))
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        return R * c
+# keys set by pass2 and by pass3 for an image
+PASS2KEYS = ('durationGPS', 'durationLocal', 'deltaDistance',
+             'initialBearing', 'averageSpeed', 'deltaAltitude')
+PASS3KEYS = ('fuzzdistance', 'errSpeed', 'fuzzlat', 'fuzzlon',
+             'fuzzbearing', 'projlat', 'projlon', 'projerr')
+INTERPOLATEDKEYS = PASS3KEYS
 
-    @staticmethod
-    def bearing(lat1, lon1, lat2, lon2):
-        'initial bearing from location 1 to location 2 on great circle route'
-        # formula from http://www.movable-type.co.uk/scripts/latlong.html
-        dLat = math.radians(lat2-lat1)
-        dLon = math.radians(lon2-lon1)
-        lat1 = math.radians(lat1)
-        lat2 = math.radians(lat2)
-        y = math.sin(dLon) * math.cos(lat2)
-        x = (math.cos(lat1) * math.sin(lat2) -
-             math.sin(lat1) * math.cos(lat2) * math.cos(dLon))
-        return (math.degrees(math.atan2(y, x)) + 360) % 360
+STAGES = ('parsetime', 'sortslices', 'offsets', 'pass2', 'pass3')
 
-    @staticmethod
-    def project(lat, lon, bearing, distance):
-        'project lat, lon destination from start point, bearing, distance'
-        # formula from http://www.movable-type.co.uk/scripts/latlong.html
-        R = 6371.0 # km
-        dR = distance/R
-        lat = math.radians(lat)
-        lon = math.radians(lon)
-        dlat = math.asin(math.sin(lat) * math.cos(dR) +
-                         math.cos(lat) * math.sin(dR) * math.cos(bearing))
-        dlon = lon + math.atan2(math.sin(bearing) * math.sin(dR) * math.cos(lat),
-                                math.cos(dR) - math.sin(lat) * math.sin(dlat))
-        return (math.degrees(dlat), math.degrees(dlon))
+def namekey(path):
+    '''(series, number) for the filename of path, the series being its
+    first two characters and the number all of its digits together'''
+    name = os.path.basename(path)
+    number = NONDIGITS.sub('', name)
+    return (name[0:2], int(number) if number else 0)
+
+class GPSPixTrax(object):
+    def __init__(self, imagedata, stats=None):
+        self.imagedata = imagedata
+        self.timeparser = exiftime.TimestampParser()
+        # instrument.Stats to record stages and counters in, if any
+        self.stats = stats
+
+    haversine = staticmethod(geodesy.haversine)
+    bearing = staticmethod(geodesy.bearing)
+    project = staticmethod(geodesy.project)
 
     @staticmethod
     def total_seconds(delta):
         # preserves sign
         return (delta.microseconds * 0.000001) + delta.seconds + delta.days * 24 * 3600
 
-    @staticmethod
-    def iso8601(datestring):
-        'convert EXIF date string to iso8601 or close enough to parse'
-        return datestring.replace(':', '-', 2).replace(' ', 'T', 1)
-
-    def round_offset(self, image):
-        offset = image.gpstime - image.pseudolocaltime
-        offset = int(self.total_seconds(offset))
-        # find closest 30-minute offset and assume it is correct
-        image['tzoffset'] = int(round(offset / 1800.0) * 0.5)
-        image['tzseconds'] = int(image.tzoffset * 3600)
-
-    def match_offset(self, notzImage, image, range):
-        offset = notzImage.localtime - image.localtime
-        if abs(int(self.total_seconds(offset))) <= range:
-            notzImage['tzoffset'] = image.tzoffset
-            notzImage['tzseconds'] = image.tzseconds
-
-    def guess_offset(self, image, epsilon, range):
-        # set offset if timestamps are within ± epsilon seconds of an integer
-        # number of hours apart and within range
-        # 30-minute-off timestamps are relatively unusual; basically, do not
-        # assume a 30-minute-off timestamp without at least one verified fix
-        offset = image.gpstime - image.pseudolocaltime
-        offset = int(self.total_seconds(offset))
-        off = abs(offset)
-        if off < range and (off + epsilon) % 3600 < epsilon * 2:
-            image['tzoffset'] = int(offset / 3600.0)
-            image['tzseconds'] = int(image.tzoffset * 3600)
+    iso8601 = staticmethod(exiftime.iso8601)
 
+    def parsetimeslice(self, images):
+        parse = self.timeparser.parse
+        for image in images:
+            image['gpstime'] = parse(image.GPSDateTime)
+            image['localtime'] = parse(image.DateTimeOriginal)
+            # localtime as if it were UTC to allow datetime math with
+            # offset calculation
+            image['pseudolocaltime'] = image.localtime.replace(
+                microsecond=0, tzinfo=image.gpstime.tzinfo)
 
     def parsetime(self):
         for slice in self.imagedata:
-            for image in slice:
-                image['gpstime'] = dateparser.parse(self.iso8601(image.GPSDateTime))
-                image['localtime'] = dateparser.parse(self.iso8601(image.DateTimeOriginal))
-                # localtime as if it were UTC to allow datetime math with
-                # offset calculation
-                image['pseudolocaltime'] = datetime(
-                    *image.localtime.timetuple()[0:6],
-                    tzinfo=image.gpstime.tzinfo)
-
-                if image.GPSStatus == 'A':
-                    # good enough to pretend the naive camera time is GPS UTC, 
-                    # calculate nearest offset
-                    self.round_offset(image)
+            self.parsetimeslice(slice)
 
     def imagecmp(self, first, second):
         #     Return negative if x<y, zero if x==y, positive if x>y.
@@ -139,112 +97,305 @@ class GPSPixTrax(object):
 
         return 0
 
+    @staticmethod
+    def imagekey(image):
+        '''sort key ordering images as imagecmp does: by GPS time, then by
+        number within a series of filenames sharing a two-character prefix'''
+        return (exiftime.epoch(image.gpstime),) + namekey(image.SourceFile)
+
+    def sortslice(self, slice):
+        keys = [self.imagekey(x) for x in slice]
+        if any(keys[i] > keys[i+1] for i in range(len(keys) - 1)):
+            # most slices come off the card already in order; the rest are
+            # put in order of the keys already made rather than making them
+            # all again in sort
+            order = sorted(range(len(keys)), key=keys.__getitem__)
+            if isinstance(slice, list):
+                slice[:] = [slice[i] for i in order]
+            else:
+                slice.reorder(order)
+
     def sortslices(self):
         for slice in self.imagedata:
-            slice.sort(cmp=self.imagecmp)
+            self.sortslice(slice)
 
-    def pass2(self):
-        missingOffset = []
-        for i in range(len(self.imagedata)):
-            for j in range(len(self.imagedata[i])):
-                image = self.imagedata[i][j]
-
-                if j == 0:
-                    # first in the slice; do not look across slices in this pass
-                    last = image
-                    lastTZimage = None
-
-                if 'tzoffset' in image:
-                    for oldImage in missingOffset:
-                        oldImage['tzoffset'] = image.tzoffset
-                        oldImage['tzseconds'] = image.tzseconds
-                    missingOffset = []
-                    lastTZimage = image
-                else:
-                    missingOffset.append(image)
-
-                image['durationGPS'] = image.gpstime - last.gpstime
-                image['durationLocal'] = image.localtime - last.localtime
-                image['deltaDistance'] = self.haversine(
-                    image.GPSLatitude, image.GPSLongitude,
-                    last.GPSLatitude, last.GPSLongitude)
-                image['initialBearing'] = self.bearing(
-                    image.GPSLatitude, image.GPSLongitude,
-                    last.GPSLatitude, last.GPSLongitude)
-                seconds = self.total_seconds(image.durationGPS)
-                if seconds:
-                    image['averageSpeed'] = math.fabs(image.deltaDistance /
-                                                      (seconds / 3600.0))
-                else:
-                    image['averageSpeed'] = 0
-                image['deltaAltitude'] = image.GPSAltitude - last.GPSAltitude
+    def offsets(self):
+        'set time zone offsets for the whole trip, see tzsolve.solve'
+        images = [x for slice in self.imagedata for x in slice]
+        segments, counts = tzsolve.solve(images)
+        if self.stats is not None:
+            self.stats.count('offsetSegments', len(segments))
+            for how in ('voted', 'guessed', 'nearest', 'unsolved'):
+                self.stats.count(how + 'Offsets', counts[how])
+
+    def slicegeometry(self, images):
+        '''return distances, bearings and speeds from the previous image for
+        each image in one slice, computed for the whole slice at once'''
+        lats = [x.GPSLatitude for x in images]
+        lons = [x.GPSLongitude for x in images]
+        # first in the slice is compared with itself
+        lastlats = lats[0:1] + lats[0:-1]
+        lastlons = lons[0:1] + lons[0:-1]
+        distances = geodesy.haversines(lats, lons, lastlats, lastlons)
+        bearings = geodesy.bearings(lats, lons, lastlats, lastlons)
+        seconds = [self.total_seconds(x.gpstime - y.gpstime)
+                   for x, y in zip(images, images[0:1] + images[0:-1])]
+        return distances, bearings, geodesy.speeds(distances, seconds)
+
+    def pass2slice(self, images):
+        'pass2 for one slice, which does not look across slices'
+        if images:
+            distances, bearings, speeds = self.slicegeometry(images)
+        for j in range(len(images)):
+            image = images[j]
+
+            if j == 0:
+                # first in the slice is compared with itself
                 last = image
 
-            if missingOffset and lastTZimage:
-                for notzImage in missingOffset:
-                    self.match_offset(notzImage, lastTZimage, 28800)
+            image['durationGPS'] = image.gpstime - last.gpstime
+            image['durationLocal'] = image.localtime - last.localtime
+            image['deltaDistance'] = distances[j]
+            image['initialBearing'] = bearings[j]
+            image['averageSpeed'] = speeds[j]
+            image['deltaAltitude'] = image.GPSAltitude - last.GPSAltitude
+            last = image
+
+    def pass2(self):
+        for images in self.imagedata:
+            self.pass2slice(images)
 
+    def pass3slice(self, images, lastAcq, missingGPS, stop=None):
+        '''pass3 for images[0:stop] of one slice, given the last acquired
+        image and the images missing GPS since then; returns them updated'''
+        for j in range(len(images))[0:stop]:
+            image = images[j]
+
+            if j == 0:
+                if image.GPSStatus == 'V':
+                    lastAcq = None
+            if image.GPSStatus == 'V' and lastAcq:
+                missingGPS.append(image)
+
+            if image.GPSStatus == 'A':
+                if lastAcq and missingGPS:
+                    self.interpolate(lastAcq, image, missingGPS)
+                lastAcq = image
+                missingGPS = []
+        return lastAcq, missingGPS
+
+    def interpolate(self, lastAcq, image, missingGPS):
+        '''assign fuzzed and projected locations to the images in missingGPS
+        taken between acquired images lastAcq and image'''
+        interval = self.total_seconds(image.gpstime-lastAcq.gpstime)
+        bearing = self.bearing(lastAcq.GPSLatitude, lastAcq.GPSLongitude,
+                               image.GPSLatitude, image.GPSLongitude)
+        distance = self.haversine(lastAcq.GPSLatitude, lastAcq.GPSLongitude,
+                                  image.GPSLatitude, image.GPSLongitude)
+        plat, plon = self.project(
+            lastAcq.GPSLatitude, lastAcq.GPSLongitude, lastAcq.GPSTrack,
+            interval * lastAcq.GPSSpeed)
+        error = self.haversine(plat, plon, image.GPSLatitude, image.GPSLongitude)
+        errorSpeed = error * (interval/3600.0)
+        # assign locations to intermediate images in missingGPS
+        # based on speed projection
+        # need to use camera clock because GPS clock can stand still
+        # when not at least trying to acquire
+        fints = [self.total_seconds(fuzz.localtime-lastAcq.localtime)
+                 for fuzz in missingGPS]
+        fuzzdistances = [(distance * (fint/interval))
+                         for fint in fints]
+        fuzzlats, fuzzlons = geodesy.projects(
+            lastAcq.GPSLatitude, lastAcq.GPSLongitude,
+            bearing, fuzzdistances)
+        projlats, projlons = geodesy.projects(
+            lastAcq.GPSLatitude, lastAcq.GPSLongitude,
+            lastAcq.GPSTrack,
+            [fint * lastAcq.GPSSpeed for fint in fints])
+        projerrs = geodesy.haversines(
+            projlats, projlons, fuzzlats, fuzzlons)
+        if self.stats is not None:
+            self.stats.count('interpolated', len(missingGPS))
+            self.stats.maximum('longestMissingGPS', len(missingGPS))
+        for k, fuzz in enumerate(missingGPS):
+            fuzz['fuzzdistance'] = fuzzdistances[k]
+            fuzz['errSpeed'] = errorSpeed
+            fuzz['fuzzlat'] = fuzzlats[k]
+            fuzz['fuzzlon'] = fuzzlons[k]
+            fuzz['fuzzbearing'] = bearing
+            fuzz['projlat'] = projlats[k]
+            fuzz['projlon'] = projlons[k]
+            fuzz['projerr'] = projerrs[k]
 
     def pass3(self):
         missingGPS = []
         lastAcq = None
-        for i in range(len(self.imagedata)):
-            for j in range(len(self.imagedata[i])):
-                image = self.imagedata[i][j]
-
-                if j == 0:
-                    if image.GPSStatus == 'V':
-                        lastAcq = None
-                if image.GPSStatus == 'V' and lastAcq:
-                    missingGPS.append(image)
-
-                if not 'tzseconds' in image:
-                    # this only happens if there were no verified fixes in the
-                    # whole slice of pictures being taken...
-                    self.guess_offset(image, 300, 28800)
-
-                if 'tzseconds' in image:
-                    image['gpsStampAge'] = int(
-                        self.total_seconds(image.pseudolocaltime -
-                                           image.gpstime) + image.tzseconds)
-
-                if image.GPSStatus == 'A':
-                    if lastAcq and missingGPS:
-                        interval = self.total_seconds(image.gpstime-lastAcq.gpstime)
-                        bearing = self.bearing(lastAcq.GPSLatitude, lastAcq.GPSLongitude,
-                                               image.GPSLatitude, image.GPSLongitude)
-                        distance = self.haversine(lastAcq.GPSLatitude, lastAcq.GPSLongitude,
-                                                  image.GPSLatitude, image.GPSLongitude)
-                        plat, plon = self.project(
-                            lastAcq.GPSLatitude, lastAcq.GPSLongitude, lastAcq.GPSTrack,
-                            interval * lastAcq.GPSSpeed)
-                        error = self.haversine(plat, plon, image.GPSLatitude, image.GPSLongitude)
-                        errorSpeed = error * (interval/3600.0)
-                        # assign locations to intermediate images in missingGPS
-                        # based on speed projection
-                        for fuzz in missingGPS:
-                            # need to use camera clock because GPS clock can stand still
-                            # when not at least trying to acquire
-                            fint = self.total_seconds(fuzz.localtime-lastAcq.localtime)
-                            fuzzdistance = (distance * (fint/interval))
-                            fuzz['fuzzdistance'] = fuzzdistance
-                            fuzz['errSpeed'] = errorSpeed
-                            fuzz['fuzzlat'], fuzz['fuzzlon'] = self.project(
-                                lastAcq.GPSLatitude, lastAcq.GPSLongitude,
-                                bearing, fuzzdistance)
-                            fuzz['fuzzbearing'] = bearing
-                            fuzz['projlat'], fuzz['projlon'] = self.project(
-                                lastAcq.GPSLatitude, lastAcq.GPSLongitude,
-                                lastAcq.GPSTrack, fint * lastAcq.GPSSpeed)
-                            fuzz['projerr'] = self.haversine(
-                                fuzz.projlat, fuzz.projlon,
-                                fuzz.fuzzlat, fuzz.fuzzlon)
-
-                    lastAcq = image
-                    missingGPS = []
+        for images in self.imagedata:
+            lastAcq, missingGPS = self.pass3slice(images, lastAcq, missingGPS)
+
+    @staticmethod
+    def acquired(images):
+        'index of the first acquired fix in images, or None'
+        for j, image in enumerate(images):
+            if image.GPSStatus == 'A':
+                return j
+        return None
+
+    def pass3state(self, stop):
+        '''(lastAcq, missingGPS, first) as pass3 leaves them after the
+        already processed slices imagedata[0:stop], where first is the
+        index of the slice holding missingGPS[0], or stop if it is empty'''
+        for t in range(stop - 1, -1, -1):
+            images = self.imagedata[t]
+            last = [j for j, x in enumerate(images) if x.GPSStatus == 'A']
+            if last:
+                break
+        else:
+            return None, [], stop
+        lastAcq = images[last[-1]]
+        missingGPS = [x for x in images[last[-1]+1:] if x.GPSStatus == 'V']
+        first = t if missingGPS else stop
+        for u in range(t + 1, stop):
+            images = self.imagedata[u]
+            if images and images[0].GPSStatus == 'V':
+                # pass3 forgets lastAcq at a slice starting with a void fix
+                return None, [], stop
+            void = [x for x in images if x.GPSStatus == 'V']
+            if void and not missingGPS:
+                first = u
+            missingGPS.extend(void)
+        return lastAcq, missingGPS, first
+
+    def update(self, slices, removed=()):
+        '''add new slices of unparsed images to parsed imagedata, replacing
+        any slices from the same directories, and drop the slices from the
+        directories in removed; only the new slices and the neighbours
+        whose results depend on them go through pass2 and pass3 again,
+        though offsets are solved for the whole trip.  Returns the range of
+        slices whose results, other than tzconfidence, may have changed as
+        (start, stop).'''
+        directory = lambda images: os.path.dirname(images[0].SourceFile)
+        new = dict((directory(x), x) for x in slices if x)
+        removed = set(removed)
+        imagedata = []
+        # slices to process again, by id
+        dirty = set()
+        follows = False
+        for images in self.imagedata:
+            name = directory(images) if images else None
+            if name in removed:
+                # the state carried into the slice after it changes
+                follows = True
+                continue
+            if name in new:
+                images = new.pop(name)
+                dirty.add(id(images))
+            elif follows:
+                dirty.add(id(images))
+            follows = False
+            imagedata.append(images)
+        if follows and imagedata:
+            dirty.add(id(imagedata[-1]))
+        for name in sorted(new):
+            images = new[name]
+            position = len(imagedata)
+            for i, x in enumerate(imagedata):
+                if x and directory(x) > name:
+                    position = i
+                    break
+            imagedata.insert(position, images)
+            dirty.add(id(images))
+        self.imagedata = imagedata
+        for images in slices:
+            self.parsetimeslice(images)
+            self.sortslice(images)
+        indexes = [i for i, x in enumerate(imagedata) if id(x) in dirty]
+        if not indexes:
+            return 0, 0
+
+        # on through the slices without an acquired fix, whose void images
+        # may be interpolated towards a later one
+        start = min(indexes)
+        stop = max(indexes) + 1
+        while stop < len(imagedata) and self.acquired(imagedata[stop]) is None:
+            stop += 1
+
+        if self.stats is not None:
+            with self.stats.stage('update', sum(len(x) for x in
+                                                imagedata[start:stop])):
+                changed = self.reoffset()
+                first = self.reprocess(start, stop)
+        else:
+            changed = self.reoffset()
+            first = self.reprocess(start, stop)
+        if changed:
+            first = min(first, changed[0])
+            stop = max(stop, changed[-1] + 1)
+        return first, stop
+
+    def reoffset(self):
+        '''solve the offsets of the whole trip again; returns the indexes
+        of the slices where any image's offset changed'''
+        offsets = lambda images: [x.get('tzseconds') for x in images]
+        before = [offsets(x) for x in self.imagedata]
+        self.offsets()
+        return [i for i, images in enumerate(self.imagedata)
+                if offsets(images) != before[i]]
+
+    def reprocess(self, start, stop):
+        '''redo pass2 and pass3 for imagedata[start:stop], and what depends
+        on it; returns the first slice with images interpolated again'''
+        imagedata = self.imagedata
+        for images in imagedata[start:stop]:
+            for image in images:
+                for key in PASS2KEYS + PASS3KEYS:
+                    if key in image:
+                        del image[key]
+
+        for images in imagedata[start:stop]:
+            self.pass2slice(images)
+
+        lastAcq, missingGPS, first = self.pass3state(start)
+        for image in missingGPS:
+            # from before start, but interpolated towards images after it
+            for key in INTERPOLATEDKEYS:
+                if key in image:
+                    del image[key]
+        for images in imagedata[start:stop]:
+            lastAcq, missingGPS = self.pass3slice(images, lastAcq, missingGPS)
+        if (lastAcq and missingGPS and stop < len(imagedata) and
+            imagedata[stop][0].GPSStatus != 'V'):
+            # interpolated up to the first acquired fix in the next slice
+            self.pass3slice(imagedata[stop], lastAcq, missingGPS,
+                            self.acquired(imagedata[stop]) + 1)
+        return first
+
+    def fixindex(self):
+        'return index of the verified fixes by GPS time'
+        return fixindex.FixIndex(self.imagedata)
+
+    def spatialindex(self, **kwargs):
+        'return grid index of image positions, see spatialindex.GridIndex'
+        return spatialindex.GridIndex(self.imagedata, **kwargs)
+
+    def savesnapshot(self, path):
+        'write the image data to path; reopen it with snapshot.Snapshot'
+        snapshot.write(path, self.imagedata)
+
+    def writeback(self, **kwargs):
+        'return the changes to write to the images, see writeback.WriteBack'
+        return writeback.WriteBack(self.imagedata, **kwargs)
 
     def parse(self):
-        self.parsetime()
-        self.sortslices()
-        self.pass2()
-        self.pass3()
+        if self.stats is None:
+            self.parsetime()
+            self.sortslices()
+            self.offsets()
+            self.pass2()
+            self.pass3()
+            return
+        images = sum(len(x) for x in self.imagedata)
+        for name in STAGES:
+            with self.stats.stage(name, images):
+                getattr(self, name)()
+        self.stats.counters['timestampFallbacks'] = self.timeparser.fallbacks
@@ -0,0 +1,324 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Column-oriented alternative to lists of ddict images.  Each field is
+# stored in one contiguous array for the whole table, and slices are
+# ranges of rows.  ImageSlice and ImageRow present the same interface as
+# the lists of ddicts returned by exiftool.fetchdata, so GPSPixTrax and
+# kml.KMLPaths can be used with either.
+
+from array import array
+from datetime import datetime, timedelta
+import functools
+import os
+
+EPOCH = datetime(1970, 1, 1)
+
+ABSENT = 0
+PRESENT = 1
+INTEGER = 2 # number column value that was an int
+
+NUMBER = 'number'
+DATETIME = 'datetime'
+TIMEDELTA = 'timedelta'
+OBJECT = 'object'
+
+STRINGS = (str, type(u''))
+
+def micro(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+class Column(object):
+    'one field for every row of a table, with a tag byte per row'
+    def __init__(self, kind, length, tzinfo=None):
+        self.kind = kind
+        self.tzinfo = tzinfo
+        self.tags = bytearray(length)
+        self.strings = {}
+        if kind == OBJECT:
+            self.values = [None] * length
+        else:
+            # datetimes and timedeltas as microseconds, exact up to 2**53
+            self.values = array('d', [0.0]) * length
+
+    @staticmethod
+    def forvalue(value, length):
+        'return empty column of the most compact kind that can hold value'
+        if type(value) in (int, float) and abs(value) < 2**53:
+            return Column(NUMBER, length)
+        if type(value) is datetime:
+            return Column(DATETIME, length, value.tzinfo)
+        if type(value) is timedelta:
+            return Column(TIMEDELTA, length)
+        return Column(OBJECT, length)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def has(self, i):
+        return self.tags[i] != ABSENT
+
+    def get(self, i):
+        tag = self.tags[i]
+        if tag == ABSENT:
+            raise KeyError(i)
+        value = self.values[i]
+        if self.kind == NUMBER:
+            if tag == INTEGER:
+                return int(value)
+            return value
+        if self.kind == DATETIME:
+            return (EPOCH + timedelta(microseconds=int(value))).replace(
+                tzinfo=self.tzinfo)
+        if self.kind == TIMEDELTA:
+            return timedelta(microseconds=int(value))
+        return value
+
+    def set(self, i, value):
+        'store value in row i, returning False if this kind cannot hold it'
+        t = type(value)
+        if self.kind == NUMBER:
+            if t not in (int, float) or abs(value) >= 2**53:
+                return False
+            self.values[i] = value
+            self.tags[i] = t is int and INTEGER or PRESENT
+        elif self.kind == DATETIME:
+            if t is not datetime or value.tzinfo != self.tzinfo:
+                return False
+            self.values[i] = micro(value.replace(tzinfo=None) - EPOCH)
+            self.tags[i] = PRESENT
+        elif self.kind == TIMEDELTA:
+            if t is not timedelta:
+                return False
+            self.values[i] = micro(value)
+            self.tags[i] = PRESENT
+        else:
+            if t in STRINGS and len(value) <= 8:
+                # share one copy of short codes like GPSStatus
+                value = self.strings.setdefault(value, value)
+            self.values[i] = value
+            self.tags[i] = PRESENT
+        return True
+
+    def delete(self, i):
+        if self.kind == OBJECT:
+            self.values[i] = None
+        self.tags[i] = ABSENT
+
+    def extend(self, n):
+        self.tags.extend(bytearray(n))
+        if self.kind == OBJECT:
+            self.values.extend([None] * n)
+        else:
+            self.values.extend(array('d', [0.0]) * n)
+
+    def generalize(self):
+        'return an object column holding the same values'
+        column = Column(OBJECT, len(self))
+        for i in range(len(self)):
+            if self.has(i):
+                column.set(i, self.get(i))
+        return column
+
+    def permute(self, start, order):
+        'reorder rows start..start+len(order) so that row start+i was start+order[i]'
+        stop = start + len(order)
+        tags = self.tags[start:stop]
+        self.tags[start:stop] = bytearray(tags[j] for j in order)
+        values = self.values[start:stop]
+        reordered = [values[j] for j in order]
+        if isinstance(values, array):
+            reordered = array(values.typecode, reordered)
+        self.values[start:stop] = reordered
+
+class ImageRow(object):
+    'ddict-like view of one row of an ImageTable'
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table, index):
+        object.__setattr__(self, 'table', table)
+        object.__setattr__(self, 'index', index)
+
+    def __getattr__(self, key):
+        if key.startswith('__'):
+            raise AttributeError(key)
+        return self.table.getvalue(self.index, key)
+
+    def __setattr__(self, key, value):
+        # like ddict, add keys only explicitly by [] to avoid bugs
+        self[key]
+        self[key] = value
+
+    def __getitem__(self, key):
+        return self.table.getvalue(self.index, key)
+
+    def __setitem__(self, key, value):
+        self.table.setvalue(self.index, key, value)
+
+    def __delitem__(self, key):
+        self.table.delvalue(self.index, key)
+
+    def __contains__(self, key):
+        column = self.table.columns.get(key)
+        return column is not None and column.has(self.index)
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return [key for key, column in self.table.columns.items()
+                if column.has(self.index)]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, ImageRow):
+            return self.table is other.table and self.index == other.index
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'ImageRow(%r)' %dict(self.items())
+
+class ImageSlice(object):
+    'list-like view of rows start..stop of an ImageTable'
+    def __init__(self, table, start, stop):
+        self.table = table
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return ImageRow(self.table, self.start + i)
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield ImageRow(self.table, i)
+
+    def sort(self, cmp=None, key=None, reverse=False):
+        'sort the rows of this slice in place in the table'
+        if cmp is not None:
+            key = functools.cmp_to_key(cmp)
+        rows = list(self)
+        if key is None:
+            # rows themselves have no ordering
+            return
+        self.reorder(sorted(range(len(rows)), key=lambda i: key(rows[i]),
+                            reverse=reverse))
+
+    def reorder(self, order):
+        'move row order[i] of this slice to row i, as sorting by index would'
+        if order != list(range(len(self))):
+            self.table.permute(self.start, order)
+
+class ImageTable(object):
+    'images stored as one typed column per field, with slices as row offsets'
+    def __init__(self):
+        self.columns = {}
+        self.length = 0
+        self.offsets = [0]
+
+    @classmethod
+    def fromrecords(cls, records):
+        'build table from exiftool records, starting a slice at each new directory'
+        table = cls()
+        lastDir = None
+        for record in records:
+            thisDir = os.path.dirname(record['SourceFile'])
+            if table.length and thisDir != lastDir:
+                table.endslice()
+            table.append(record)
+            lastDir = thisDir
+        table.endslice()
+        return table
+
+    @classmethod
+    def fromslices(cls, imagedata):
+        'build table from a list of lists of image dictionaries'
+        table = cls()
+        for images in imagedata:
+            for image in images:
+                table.append(image)
+            table.endslice()
+        return table
+
+    def append(self, record):
+        index = self.length
+        self.length += 1
+        for column in self.columns.values():
+            column.extend(1)
+        for key, value in record.items():
+            self.setvalue(index, key, value)
+
+    def endslice(self):
+        if self.offsets[-1] != self.length:
+            self.offsets.append(self.length)
+
+    @property
+    def slices(self):
+        return [ImageSlice(self, self.offsets[i], self.offsets[i+1])
+                for i in range(len(self.offsets) - 1)]
+
+    def __len__(self):
+        return self.length
+
+    def getvalue(self, index, key):
+        try:
+            return self.columns[key].get(index)
+        except KeyError:
+            raise KeyError(key)
+
+    def setvalue(self, index, key, value):
+        column = self.columns.get(key)
+        if column is None:
+            column = Column.forvalue(value, self.length)
+            self.columns[key] = column
+        if not column.set(index, value):
+            column = column.generalize()
+            self.columns[key] = column
+            column.set(index, value)
+
+    def delvalue(self, index, key):
+        self.getvalue(index, key)
+        self.columns[key].delete(index)
+
+    def permute(self, start, order):
+        for column in self.columns.values():
+            column.permute(start, order)
+
+    def todata(self):
+        'return the contents as a list of lists of plain dictionaries'
+        return [[dict(row.items()) for row in images] for images in self.slices]
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Timing and counters for the stages of processing.  A GPSPixTrax given a
+# Stats records each stage of parse() in it, and counts events along the
+# way; without one, parse() runs the stages as it always has, and the
+# only cost left is a test on the rare paths that count something.
+# Other stages, like reading from exiftool, can be recorded by wrapping
+# them in Stats.stage():
+#
+#   stats = instrument.Stats()
+#   with stats.stage('exiftool') as stage:
+#       imagedata = exiftool.fetchdata(filelist)
+#       stage['items'] = len(filelist)
+#   gpspixtrax.GPSPixTrax(imagedata, stats=stats).parse()
+#   json.dump(stats.asdict(), f)
+#
+# Counters are kept in the process that owns the Stats; the worker
+# processes of ParallelGPSPixTrax count into their own and send them back
+# to be merged.
+
+import collections
+import contextlib
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+clock = getattr(time, 'perf_counter', time.time)
+cpuclock = getattr(time, 'process_time', None) or time.clock
+
+# profile entries kept per stage
+PROFILELINES = 20
+
+def maxrss():
+    'peak resident set size of this process (KiB on Linux), or None'
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Stats(object):
+    '''wall and CPU time, peak RSS growth and item count for each stage,
+    and counters; with profile, a cProfile.Profile of each stage, and
+    with trace, its peak traced allocation'''
+    def __init__(self, profile=False, trace=False):
+        self.profile = profile
+        self.trace = trace and tracemalloc is not None
+        self.stages = collections.OrderedDict()
+        self.counters = {}
+        # cProfile.Profile by stage, for pstats
+        self.profiles = {}
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def maximum(self, name, value):
+        if value > self.counters.get(name, value - 1):
+            self.counters[name] = value
+
+    def merge(self, counters, maxima=()):
+        '''add counters, a dict from another Stats, to these, taking the
+        larger of the two for those named in maxima'''
+        for name, value in counters.items():
+            if name in maxima:
+                self.maximum(name, value)
+            else:
+                self.count(name, value)
+
+    @contextlib.contextmanager
+    def stage(self, name, items=None):
+        '''record the stage in the with block; items can be set in the
+        dict it yields when they are not known until the end'''
+        record = {'items': items}
+        profiler = None
+        if self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        tracing = False
+        if self.trace:
+            tracing = not tracemalloc.is_tracing()
+            if tracing:
+                tracemalloc.start()
+            base, _ = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+        rss = maxrss()
+        cpu = cpuclock()
+        start = clock()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['seconds'] = clock() - start
+            record['cpu'] = cpuclock() - cpu
+            if rss is not None:
+                record['maxrss'] = maxrss() - rss
+            if self.trace:
+                _, peak = tracemalloc.get_traced_memory()
+                record['peak'] = max(0, peak - base)
+                if tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                self.profiles[name] = profiler
+                record['profile'] = self.profilelines(profiler)
+            self.stages[name] = record
+
+    @staticmethod
+    def profilelines(profiler):
+        'top functions by cumulative time as [function, calls, tottime, cumtime]'
+        import pstats
+        stats = pstats.Stats(profiler).stats
+        lines = []
+        for (filename, line, function), value in stats.items():
+            calls, _, tottime, cumtime = value[0:4]
+            lines.append(['%s:%d(%s)' %(filename, line, function), calls,
+                          tottime, cumtime])
+        lines.sort(key=lambda x: -x[3])
+        return lines[0:PROFILELINES]
+
+    def asdict(self):
+        return {
+            'stages': self.stages,
+            'counters': self.counters,
+        }
+
+    def json(self):
+        return json.dumps(self.asdict(), indent=1)
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Read the handful of EXIF and GPS tags that gpspixtrax needs directly
+# from JPEG APP1 or TIFF-based raw files, producing the same record that
+# "exiftool -n -j" would.  Anything not understood here returns None so
+# that the caller can fall back to exiftool.
+
+import mmap
+import struct
+
+# TIFF field type: (struct format, size)
+TYPES = {
+    1: ('B', 1),  # BYTE
+    2: ('s', 1),  # ASCII
+    3: ('H', 2),  # SHORT
+    4: ('L', 4),  # LONG
+    5: ('L', 8),  # RATIONAL
+    7: ('s', 1),  # UNDEFINED
+    9: ('l', 4),  # SLONG
+    10: ('l', 8), # SRATIONAL
+}
+
+EXIFIFD = 0x8769
+GPSIFD = 0x8825
+DATETIMEORIGINAL = 0x9003
+MAKERNOTE = 0x927c
+
+GPSLATITUDEREF = 0x01
+GPSLATITUDE = 0x02
+GPSLONGITUDEREF = 0x03
+GPSLONGITUDE = 0x04
+GPSALTITUDEREF = 0x05
+GPSALTITUDE = 0x06
+GPSTIMESTAMP = 0x07
+GPSSTATUS = 0x09
+GPSMEASUREMODE = 0x0a
+GPSSPEED = 0x0d
+GPSTRACK = 0x0f
+GPSDATESTAMP = 0x1d
+
+class UnsupportedFile(Exception):
+    pass
+
+def number(value):
+    'value as exiftool would print it in JSON'
+    s = '%.15g' %value
+    if s.lstrip('-').isdigit():
+        return int(s)
+    return float(s)
+
+class TIFF(object):
+    'minimal reader for the IFD chain of a TIFF structure at offset base'
+    def __init__(self, data, base):
+        self.data = data
+        self.base = base
+        order = data[base:base+2]
+        if order == b'II':
+            self.endian = '<'
+        elif order == b'MM':
+            self.endian = '>'
+        else:
+            raise UnsupportedFile('bad TIFF byte order')
+        magic, self.ifd0 = self.unpack('HL', 2)
+        if magic != 42:
+            raise UnsupportedFile('bad TIFF magic')
+
+    def unpack(self, fmt, offset):
+        return struct.unpack_from(self.endian + fmt, self.data, self.base + offset)
+
+    def ifd(self, offset):
+        'return dict mapping tag to (type, count, value offset) for one IFD'
+        entries = {}
+        count, = self.unpack('H', offset)
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            tag, type, n = self.unpack('HHL', entry)
+            if type not in TYPES:
+                # not needed by anything here; ignore
+                continue
+            size = TYPES[type][1] * n
+            if size > 4:
+                valueoffset, = self.unpack('L', entry + 8)
+            else:
+                valueoffset = entry + 8
+            if self.base + valueoffset + size > len(self.data):
+                raise UnsupportedFile('IFD entry beyond end of file')
+            entries[tag] = (type, n, valueoffset)
+        return entries
+
+    def ascii(self, entry):
+        type, n, offset = entry
+        value, = self.unpack('%ds' %n, offset)
+        return value.split(b'\0', 1)[0].strip().decode('ascii')
+
+    def int(self, entry):
+        type, n, offset = entry
+        if type == 2:
+            return int(self.ascii(entry))
+        return self.unpack(TYPES[type][0], offset)[0]
+
+    def rationals(self, entry):
+        type, n, offset = entry
+        if type not in (5, 10):
+            raise UnsupportedFile('expected rational')
+        values = self.unpack(TYPES[type][0] * (2 * n), offset)
+        result = []
+        for i in range(0, len(values), 2):
+            numerator, denominator = values[i:i+2]
+            if not denominator:
+                raise UnsupportedFile('undefined rational')
+            # exiftool rounds rationals to 10 significant digits
+            result.append(float('%.10g' %(float(numerator) / denominator)))
+        return result
+
+def findtiff(data):
+    'return offset of the TIFF header in a JPEG or TIFF-based file'
+    if data[0:4] in (b'II*\0', b'MM\0*'):
+        return 0
+    if data[0:2] != b'\xff\xd8':
+        raise UnsupportedFile('not JPEG or TIFF')
+    offset = 2
+    while offset + 4 <= len(data):
+        prefix, marker, length = struct.unpack_from('>BBH', data, offset)
+        if prefix != 0xff:
+            raise UnsupportedFile('bad JPEG marker')
+        if marker in (0xda, 0xd9):
+            # start of scan or end of image: metadata is all before this
+            break
+        if marker == 0xe1 and data[offset+4:offset+10] == b'Exif\0\0':
+            return offset + 10
+        offset += 2 + length
+    raise UnsupportedFile('no EXIF data')
+
+def degrees(tiff, entry, refentry, negative):
+    d, m, s = (tiff.rationals(entry) + [0, 0])[0:3]
+    value = d + m / 60.0 + s / 3600.0
+    if refentry is not None and tiff.ascii(refentry) == negative:
+        value = -value
+    return number(value)
+
+def altitude(tiff, entry, refentry):
+    value = tiff.rationals(entry)[0]
+    if refentry is not None and tiff.int(refentry) == 1:
+        # below sea level
+        value = -value
+    return number(value)
+
+def timestamp(h, m, s):
+    seconds = (h * 60 + m) * 60 + s
+    h = int(seconds / 3600)
+    seconds -= h * 3600
+    m = int(seconds / 60)
+    seconds -= m * 60
+    s = int(seconds)
+    fraction = ('%.9f' %(seconds - s))[1:].rstrip('0').rstrip('.')
+    return '%.2d:%.2d:%.2d%s' %(h, m, s, fraction)
+
+def parse(data, path, tags):
+    tiff = TIFF(data, findtiff(data))
+    ifd0 = tiff.ifd(tiff.ifd0)
+    exififd = {}
+    gpsifd = {}
+    if EXIFIFD in ifd0:
+        exififd = tiff.ifd(tiff.int(ifd0[EXIFIFD]))
+    if GPSIFD in ifd0:
+        gpsifd = tiff.ifd(tiff.int(ifd0[GPSIFD]))
+
+    if 'ShotNumberSincePowerUp' in tags and MAKERNOTE in exififd:
+        # lives in (often enciphered) vendor MakerNotes; leave to exiftool
+        raise UnsupportedFile('MakerNote')
+
+    record = {'SourceFile': path}
+    def add(tag, convert, *args):
+        if tag in tags and args[0] in gpsifd:
+            record[tag] = convert(*[gpsifd.get(x) for x in args])
+
+    if ('GPSDateTime' in tags and GPSDATESTAMP in gpsifd
+        and GPSTIMESTAMP in gpsifd):
+        record['GPSDateTime'] = '%s %sZ' %(
+            tiff.ascii(gpsifd[GPSDATESTAMP]),
+            timestamp(*tiff.rationals(gpsifd[GPSTIMESTAMP])))
+    add('GPSAltitude', lambda alt, ref: altitude(tiff, alt, ref),
+        GPSALTITUDE, GPSALTITUDEREF)
+    add('GPSLatitude', lambda lat, ref: degrees(tiff, lat, ref, 'S'),
+        GPSLATITUDE, GPSLATITUDEREF)
+    add('GPSLongitude', lambda lon, ref: degrees(tiff, lon, ref, 'W'),
+        GPSLONGITUDE, GPSLONGITUDEREF)
+    add('GPSSpeed', lambda x: number(tiff.rationals(x)[0]), GPSSPEED)
+    add('GPSStatus', tiff.ascii, GPSSTATUS)
+    add('GPSTrack', lambda x: number(tiff.rationals(x)[0]), GPSTRACK)
+    add('GPSMeasureMode', tiff.int, GPSMEASUREMODE)
+    if 'DateTimeOriginal' in tags and DATETIMEORIGINAL in exififd:
+        record['DateTimeOriginal'] = tiff.ascii(exififd[DATETIMEORIGINAL])
+    return record
+
+def readexif(path, tags):
+    '''return exiftool -n -j style record with the named tags for path,
+    or None if the file needs to be read by exiftool'''
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None
+    try:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # empty or unmappable file
+            return None
+        try:
+            return parse(data, path, tags)
+        except (UnsupportedFile, struct.error, ValueError):
+            return None
+        finally:
+            data.close()
+    finally:
+        f.close()
@@ -15,10 +15,13 @@
 #  limitations under the License.
 #
 
+import collections
+
 from lxml import etree
 from lxml import objectify
 
-import ddict
+from . import ddict
+from . import simplify
 
 MODE = ddict.ddict((
     ('valid', 1),
@@ -28,138 +31,238 @@ MODE = ddict.ddict((
     ('interpolated', 16),
 ))
 
+KMLNS = 'http://www.opengis.net/kml/2.2'
+GXNS = 'http://www.google.com/kml/ext/2.2'
+# ordered so that both writers declare the namespaces the same way
+NSMAP = collections.OrderedDict(((None, KMLNS), ('gx', GXNS)))
+
+# (style id, line color as aabbggrr, mode) for each path in KMLPaths
+STYLES = (
+    ('valid', '7f007f00', MODE.valid),
+    ('gps', '2f117f11', MODE.gps),
+    ('projected', '7f7f007f', MODE.projected),
+    ('interpolated', '227f0000', MODE.interpolated),
+)
+
+# coordinates per write when streaming
+CHUNKSIZE = 1000
+
 class KMLPaths(object):
-    def __init__(self, slice):
+    def __init__(self, slice, tolerance=None, stats=None):
         self.slice = slice
+        # simplify paths to within this many meters, if set
+        self.tolerance = tolerance
+        # (vertices before, after simplification) by modemask
+        self.vertices = {}
+        # instrument.Stats counting pathVertices and keptVertices, if set
+        self.stats = stats
 
-    def coordinateString(self, modemask):
-        matches = []
-        match = None
+    def counted(self, modemask, before, after):
+        'record the vertex counts of the path for modemask'
+        self.vertices[modemask] = (before, after)
+        if self.stats is not None:
+            self.stats.count('pathVertices', before)
+            self.stats.count('keptVertices', after)
+
+    @staticmethod
+    def gpscoord(image):
+        if image.GPSMeasureMode == 3:
+            return (image.GPSLongitude, image.GPSLatitude, image.GPSAltitude)
+        else:
+            return (image.GPSLongitude, image.GPSLatitude)
 
-        def gpscoord(i):
-            if i.GPSMeasureMode == 3:
-                return (i.GPSLongitude, i.GPSLatitude, i.GPSAltitude)
-            else:
-                return (i.GPSLongitude, i.GPSLatitude)
+    @staticmethod
+    def formatCoordinate(coordinate):
+        return ','.join(str(y) for y in coordinate)
 
+    def classify(self, modemasks):
+        '''walk the slice once, generating (modemask, coordinate, string) for
+        each point of the path for each modemask, in slice order'''
+        modemasks = list(modemasks)
+        last = dict((x, None) for x in modemasks)
         for image in self.slice:
-            if image.GPSStatus == 'A':
-                match = gpscoord(image)
-            elif modemask & MODE.validated and 'GPSStatus' in image and matches:
-                match = gpscoord(image)
-            elif modemask & MODE.gps and 'GPSStatus' in image:
-                match = gpscoord(image)
-            elif modemask & MODE.projected and 'projlat' in image:
-                match = (image.projlon, image.projlat)
-            elif modemask & MODE.interpolated and 'fuzzlat' in image:
-                match = (image.fuzzlon, image.fuzzlat)
-            if match and (not matches or match != matches[-1]):
-                matches.append(match)
-        if matches:
-            return ' '.join(','.join(str(y) for y in x) for x in matches)
+            acquired = image.GPSStatus == 'A'
+            status = 'GPSStatus' in image
+            # (tuple, string) for each kind of location, made when first used
+            # and shared by all the modes that use it
+            coordinates = {}
+            for modemask in modemasks:
+                if acquired or status and (
+                        modemask & MODE.validated and last[modemask] or
+                        modemask & MODE.gps):
+                    kind = MODE.gps
+                elif modemask & MODE.projected and 'projlat' in image:
+                    kind = MODE.projected
+                elif modemask & MODE.interpolated and 'fuzzlat' in image:
+                    kind = MODE.interpolated
+                else:
+                    continue
+                coordinate = coordinates.get(kind)
+                if coordinate is None:
+                    if kind == MODE.gps:
+                        match = self.gpscoord(image)
+                    elif kind == MODE.projected:
+                        match = (image.projlon, image.projlat)
+                    else:
+                        match = (image.fuzzlon, image.fuzzlat)
+                    coordinate = [match, None]
+                    coordinates[kind] = coordinate
+                match, string = coordinate
+                if match != last[modemask]:
+                    if string is None:
+                        string = self.formatCoordinate(match)
+                        coordinate[1] = string
+                    last[modemask] = match
+                    yield modemask, match, string
+
+    def coordinateLists(self, modemasks):
+        'return dict of lists of coordinate strings for each of modemasks'
+        lists = dict((x, []) for x in modemasks)
+        for modemask, match, string in self.classify(lists.keys()):
+            lists[modemask].append((match, string))
+        return dict((modemask, self.simplifyPath(modemask, points))
+                    for modemask, points in lists.items())
+
+    def simplifyPath(self, modemask, points):
+        '''return the strings of the (coordinate, string) points left after
+        simplification, and record the vertex counts for modemask'''
+        count = len(points)
+        if self.tolerance:
+            points = [points[i] for i in simplify.simplify(
+                [x[0] for x in points], self.tolerance)]
+        self.counted(modemask, count, len(points))
+        return [x[1] for x in points]
+
+    def coordinateStrings(self, modemasks):
+        'return dict of coordinates element text for each of modemasks'
+        return dict((modemask, ' '.join(strings)) for modemask, strings in
+                    self.coordinateLists(modemasks).items())
+
+    def coordinateString(self, modemask):
+        return self.coordinateStrings((modemask,))[modemask]
+
+    def coordinateChunks(self, modemask, chunksize=CHUNKSIZE):
+        'generate the coordinateString for modemask in pieces'
+        if self.tolerance:
+            # simplification needs the whole path at once
+            strings = self.coordinateLists((modemask,))[modemask]
         else:
-            return ''
+            strings = (x[2] for x in self.classify((modemask,)))
+        count = 0
+        chunk = []
+        separator = ''
+        for string in strings:
+            count += 1
+            chunk.append(string)
+            if len(chunk) == chunksize:
+                yield separator + ' '.join(chunk)
+                separator = ' '
+                chunk = []
+        if chunk:
+            yield separator + ' '.join(chunk)
+        if not self.tolerance:
+            self.counted(modemask, count, count)
 
     @staticmethod
     def KMLBuilder():
         return (objectify.ElementMaker(annotate=False,
-                                       namespace="http://www.opengis.net/kml/2.2",
-                                       nsmap={None : "http://www.opengis.net/kml/2.2",
-                                              'gx' : "http://www.google.com/kml/ext/2.2"}),
+                                       namespace=KMLNS,
+                                       nsmap=NSMAP),
                 objectify.ElementMaker(annotate=False,
-                                       namespace="http://www.google.com/kml/ext/2.2",
-                                       nsmap={None : "http://www.google.com/kml/ext/2.2"}))
+                                       namespace=GXNS,
+                                       nsmap={None : GXNS}))
+
+    @classmethod
+    def KMLLineString(cls, coordinates):
+        E, _ = cls.KMLBuilder()
+        return E.LineString(
+            E.extrude(0),
+            E.tesselate(0),
+            E.altitudeMode("clampToGround"),
+            E.coordinates(coordinates)
+        )
 
     def KMLPath(self, name, modemask):
         E, _ = self.KMLBuilder()
         return E.kml(E.Document(E.Placemark(
             E.name(name),
-            E.LineString(
-                E.extrude(0),
-                E.tesselate(0),
-                E.altitudeMode("clampToGround"),
-                E.coordinates(self.coordinateString(modemask))
-            )
+            self.KMLLineString(self.coordinateString(modemask))
         )))
 
+    @classmethod
+    def KMLStyle(cls, styleid, color):
+        E, G = cls.KMLBuilder()
+        return E.Style(
+            E.LineStyle(
+                E.color(color),
+                E.width(4),
+                G.outerColor('66ffffff'),
+                G.outerWidth(0.5),
+                G.labelVisibility(1)),
+            id=styleid,
+        )
+
+    @classmethod
+    def KMLStyles(cls):
+        return [cls.KMLStyle(styleid, color) for styleid, color, _ in STYLES]
+
     def KMLPaths(self, name):
         E, G = self.KMLBuilder()
-        return E.kml(E.Document(
-            E.name(name),
-            E.Style(
-                E.LineStyle(
-                    E.color('7f007f00'), # aabbggrr
-                    E.width(4),
-                    G.outerColor('66ffffff'),
-                    G.outerWidth(0.5),
-                    G.labelVisibility(1)),
-                id='valid',
-            ),
-            E.Style(
-                E.LineStyle(
-                    E.color('2f117f11'), # aabbggrr
-                    E.width(4),
-                    G.outerColor('66ffffff'),
-                    G.outerWidth(0.5),
-                    G.labelVisibility(1)),
-                id='gps',
-            ),
-            E.Style(
-                E.LineStyle(
-                    E.color('7f7f007f'), # aabbggrr
-                    E.width(4),
-                    G.outerColor('66ffffff'),
-                    G.outerWidth(0.5),
-                    G.labelVisibility(1)),
-                id='projected',
-            ),
-            E.Style(
-                E.LineStyle(
-                    E.color('227f0000'), # aabbggrr
-                    E.width(4),
-                    G.outerColor('66ffffff'),
-                    G.outerWidth(0.5),
-                    G.labelVisibility(1)),
-                id='interpolated',
-            ),
-            E.Placemark(
-                E.name(name + ':valid'),
-                E.styleUrl('#valid'),
-                E.LineString(
-                    E.extrude(0),
-                    E.tesselate(0),
-                    E.altitudeMode("clampToGround"),
-                    E.coordinates(self.coordinateString(MODE.valid))
-                )
-            ),
-            E.Placemark(
-                E.name(name + ':gps'),
-                E.styleUrl('#gps'),
-                E.LineString(
-                    E.extrude(0),
-                    E.tesselate(0),
-                    E.altitudeMode("clampToGround"),
-                    E.coordinates(self.coordinateString(MODE.gps))
-                )
-            ),
-            E.Placemark(
-                E.name(name + ':projected'),
-                E.styleUrl('#projected'),
-                E.LineString(
-                    E.extrude(0),
-                    E.tesselate(0),
-                    E.altitudeMode("clampToGround"),
-                    E.coordinates(self.coordinateString(MODE.projected))
-                )
-            ),
-            E.Placemark(
-                E.name(name + ':interpolated'),
-                E.styleUrl('#interpolated'),
-                E.LineString(
-                    E.extrude(0),
-                    E.tesselate(0),
-                    E.altitudeMode("clampToGround"),
-                    E.coordinates(self.coordinateString(MODE.interpolated))
-                )
-            )
-        ))
+        strings = self.coordinateStrings(mode for _, _, mode in STYLES)
+        return E.kml(E.Document(*(
+            [E.name(name)] +
+            self.KMLStyles() +
+            [E.Placemark(
+                E.name(name + ':' + styleid),
+                E.styleUrl('#' + styleid),
+                self.KMLLineString(strings[mode])
+            ) for styleid, _, mode in STYLES]
+        )))
+
+    # Streaming versions of KMLPath and KMLPaths, writing the same
+    # document to output (a filename or file-like object) without ever
+    # holding all of it in memory
+
+    def writeKMLPath(self, output, name, modemask):
+        with etree.xmlfile(output) as xf:
+            with xf.element('{%s}kml' %KMLNS, nsmap=NSMAP):
+                with xf.element('{%s}Document' %KMLNS):
+                    self.writePlacemark(xf, name, None, modemask)
+
+    def writeKMLPaths(self, output, name):
+        with etree.xmlfile(output) as xf:
+            with xf.element('{%s}kml' %KMLNS, nsmap=NSMAP):
+                with xf.element('{%s}Document' %KMLNS):
+                    self.writeText(xf, 'name', name)
+                    for styleid, color, _ in STYLES:
+                        self.writeStyle(xf, styleid, color)
+                    for styleid, _, mode in STYLES:
+                        self.writePlacemark(xf, name + ':' + styleid,
+                                            styleid, mode)
+
+    @staticmethod
+    def writeText(xf, tag, text, namespace=KMLNS):
+        with xf.element('{%s}%s' %(namespace, tag)):
+            xf.write(text)
+
+    def writeStyle(self, xf, styleid, color):
+        with xf.element('{%s}Style' %KMLNS, id=styleid):
+            with xf.element('{%s}LineStyle' %KMLNS):
+                self.writeText(xf, 'color', color)
+                self.writeText(xf, 'width', '4')
+                self.writeText(xf, 'outerColor', '66ffffff', GXNS)
+                self.writeText(xf, 'outerWidth', '0.5', GXNS)
+                self.writeText(xf, 'labelVisibility', '1', GXNS)
+
+    def writePlacemark(self, xf, name, styleid, modemask):
+        with xf.element('{%s}Placemark' %KMLNS):
+            self.writeText(xf, 'name', name)
+            if styleid is not None:
+                self.writeText(xf, 'styleUrl', '#' + styleid)
+            with xf.element('{%s}LineString' %KMLNS):
+                self.writeText(xf, 'extrude', '0')
+                self.writeText(xf, 'tesselate', '0')
+                self.writeText(xf, 'altitudeMode', 'clampToGround')
+                with xf.element('{%s}coordinates' %KMLNS):
+                    for chunk in self.coordinateChunks(modemask):
+                        xf.write(chunk)
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Regionated KMZ output for archives too large to view as one document.
+# The paths for all the slices are split into a quadtree of tiles.  Each
+# tile is its own KML document with a Region, holding the parts of the
+# paths inside it simplified to about a pixel at the largest size the
+# tile is shown, and NetworkLinks to the four tiles under it, which the
+# viewer loads only when they are on screen and large enough to need
+# more detail.  The tree is written as doc.kml plus one file per tile in
+# a zip-compressed KMZ.
+
+import zipfile
+
+from lxml import etree
+
+from . import geodesy
+from . import kml
+from . import simplify
+
+# a tile is replaced by its children when its region is larger than
+# MAXLODPIXELS on screen, at which point they are MINLODPIXELS across
+MINLODPIXELS = 256
+MAXLODPIXELS = 512
+
+class Tile(object):
+    'one node of the quadtree: its box, and its paths by modemask'
+    def __init__(self, key, north, south, east, west):
+        self.key = key
+        self.north = north
+        self.south = south
+        self.east = east
+        self.west = west
+        self.paths = dict((mode, []) for _, _, mode in kml.STYLES)
+        self.children = []
+
+    @property
+    def filename(self):
+        if not self.key:
+            return 'doc.kml'
+        return 't%s.kml' %self.key
+
+    def size(self):
+        'length of the diagonal of the tile in meters'
+        return 1000 * geodesy.haversine(self.south, self.west,
+                                        self.north, self.east)
+
+    def vertices(self):
+        return sum(len(x) for paths in self.paths.values() for x in paths)
+
+    def quadrant(self, point):
+        'index of the child tile containing (lon, lat, ...) point'
+        lon, lat = point[0:2]
+        return ((lat >= (self.north + self.south) / 2.0) * 2 +
+                (lon >= (self.east + self.west) / 2.0))
+
+    def split(self):
+        'make the four child tiles and share the paths out among them'
+        midlat = (self.north + self.south) / 2.0
+        midlon = (self.east + self.west) / 2.0
+        children = [
+            Tile(self.key + '0', midlat, self.south, midlon, self.west),
+            Tile(self.key + '1', midlat, self.south, self.east, midlon),
+            Tile(self.key + '2', self.north, midlat, midlon, self.west),
+            Tile(self.key + '3', self.north, midlat, self.east, midlon),
+        ]
+        for mode, paths in self.paths.items():
+            for path in paths:
+                for quadrant, run in self.runs(path):
+                    children[quadrant].paths[mode].append(run)
+        self.children = [x for x in children if x.vertices()]
+
+    def runs(self, path):
+        '''split path into runs of points in the same quadrant, each ending
+        with the first point of the next run so the path stays connected'''
+        if not path:
+            return
+        start = 0
+        quadrant = self.quadrant(path[0])
+        for i in range(1, len(path)):
+            q = self.quadrant(path[i])
+            if q != quadrant:
+                yield quadrant, path[start:i+1]
+                start = i
+                quadrant = q
+        if start == 0 or len(path) - start > 1:
+            # a lone point at the end is already joined to the run before
+            yield quadrant, path[start:]
+
+class KMZTiles(object):
+    'quadtree of tiles for the paths of all the slices in imagedata'
+    def __init__(self, imagedata, tolerance=None, maxvertices=1000,
+                 maxdepth=10):
+        # tolerance in meters for the most detailed tiles
+        self.tolerance = tolerance
+        self.maxvertices = maxvertices
+        self.maxdepth = maxdepth
+        self.root = self.build(imagedata)
+
+    def build(self, imagedata):
+        paths = dict((mode, []) for _, _, mode in kml.STYLES)
+        for slice in imagedata:
+            K = kml.KMLPaths(slice)
+            points = dict((mode, []) for mode in paths)
+            for mode, match, _ in K.classify(points.keys()):
+                points[mode].append(match)
+            for mode, path in points.items():
+                if path:
+                    paths[mode].append(path)
+        everywhere = [x for y in paths.values() for z in y for x in z]
+        lons = [x[0] for x in everywhere] or [0]
+        lats = [x[1] for x in everywhere] or [0]
+        # never quite empty, so that the region has some size, and never
+        # beyond the earth, which void fixes sometimes are
+        root = Tile('', min(max(lats) + 1e-5, 90), max(min(lats) - 1e-5, -90),
+                    min(max(lons) + 1e-5, 180), max(min(lons) - 1e-5, -180))
+        root.paths = paths
+        self.divide(root, 0)
+        return root
+
+    def divide(self, tile, depth):
+        if depth < self.maxdepth and tile.vertices() > self.maxvertices:
+            tile.split()
+            for child in tile.children:
+                self.divide(child, depth + 1)
+
+    def tiles(self):
+        'generate every tile, parents before their children'
+        pending = [self.root]
+        while pending:
+            tile = pending.pop(0)
+            yield tile
+            pending.extend(tile.children)
+
+    def KMLRegion(self, tile):
+        E, _ = kml.KMLPaths.KMLBuilder()
+        return E.Region(
+            E.LatLonAltBox(
+                E.north(tile.north),
+                E.south(tile.south),
+                E.east(tile.east),
+                E.west(tile.west)),
+            E.Lod(
+                # the whole archive is always shown, and the most
+                # detailed tiles however close the view
+                E.minLodPixels(0 if tile is self.root else MINLODPIXELS),
+                E.maxLodPixels(MAXLODPIXELS if tile.children else -1)))
+
+    def tilePaths(self, tile):
+        'paths in tile as lists of coordinate strings, simplified for its level'
+        tolerance = self.tolerance
+        if tile.children:
+            # about one pixel at the largest size the tile is drawn
+            tolerance = max(tolerance or 0, tile.size() / MAXLODPIXELS)
+        result = {}
+        for mode, paths in tile.paths.items():
+            result[mode] = []
+            for path in paths:
+                keep = simplify.simplify(path, tolerance)
+                result[mode].append([kml.KMLPaths.formatCoordinate(path[i])
+                                     for i in keep])
+        return result
+
+    def KMLTile(self, tile, name):
+        E, _ = kml.KMLPaths.KMLBuilder()
+        paths = self.tilePaths(tile)
+        return E.kml(E.Document(*(
+            [E.name(name),
+             self.KMLRegion(tile)] +
+            kml.KMLPaths.KMLStyles() +
+            [E.Placemark(
+                E.name(name + ':' + styleid),
+                E.styleUrl('#' + styleid),
+                E.MultiGeometry(*[
+                    kml.KMLPaths.KMLLineString(' '.join(x))
+                    for x in paths[mode]])
+            ) for styleid, _, mode in kml.STYLES if paths[mode]] +
+            [E.NetworkLink(
+                E.name(child.key),
+                self.KMLRegion(child),
+                E.Link(
+                    E.href(child.filename),
+                    E.viewRefreshMode('onRegion')))
+             for child in tile.children]
+        )))
+
+    def write(self, output, name):
+        'write the tiles as a KMZ to output, a filename or file-like object'
+        kmz = zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED)
+        try:
+            for tile in self.tiles():
+                kmz.writestr(tile.filename, etree.tostring(
+                    self.KMLTile(tile, name), xml_declaration=True,
+                    encoding='UTF-8'))
+        finally:
+            kmz.close()
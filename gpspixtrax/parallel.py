@@ -0,0 +1,191 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Run pass2 and pass3 on each slice in a separate process, as if it were
+# the only slice.  pass2 carries no state from one slice into the next.
+# pass3 carries a little, which is fixed up afterwards: if a slice does
+# not start with a void fix, the void images before its first acquired
+# fix are interpolated from the last acquired fix of an earlier slice,
+# along with the images missing GPS left over from it.
+#
+# Pickling whole images to the workers and back costs more than the
+# passes themselves, so each worker is sent only the fields the passes
+# read, as a list per field, and sends back only the keys they set.
+#
+# The same code does the same arithmetic in the workers as in the serial
+# path, so the results are identical.  The workers count what they
+# interpolate, which the parent adds to what it interpolates stitching
+# the slices together, so the counters are those of the serial path too.
+
+import multiprocessing
+from datetime import timedelta
+
+from . import ddict
+from . import gpspixtrax
+from . import instrument
+
+# the fields pass2 and pass3 read, the only ones sent to the workers;
+# times are sent as microseconds from the first image of the slice and
+# rebuilt there as timedeltas, whose differences are exactly those of
+# the datetimes
+TIMES = ('gpstime', 'localtime')
+FIELDS = ('GPSLatitude', 'GPSLongitude', 'GPSAltitude', 'GPSStatus',
+          'GPSSpeed', 'GPSTrack')
+# pass2 results that are timedeltas, returned as microseconds
+DURATIONS = ('durationGPS', 'durationLocal')
+# counters from the workers that are maxima, not sums
+MAXIMA = ('longestMissingGPS',)
+
+def micro(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def columns(images):
+    'list of the values of each field sent to the workers for one slice'
+    result = []
+    for name in TIMES:
+        values = [image[name] for image in images]
+        if values:
+            start = values[0]
+            values = [micro(x - start) for x in values]
+        result.append(values)
+    for name in FIELDS:
+        result.append([image.get(name) for image in images])
+    return result
+
+def rebuild(columns):
+    'worker: ddicts for one slice from its columns'
+    n = len(TIMES)
+    columns = ([[timedelta(microseconds=x) for x in values]
+                for values in columns[:n]] + list(columns[n:]))
+    images = [ddict.ddict(zip(TIMES + FIELDS, values))
+              for values in zip(*columns)]
+    for name, values in zip(FIELDS, columns[n:]):
+        if None in values:
+            # absent from the image, not None
+            for image, value in zip(images, values):
+                if value is None:
+                    del image[name]
+    return images
+
+def _pass2(columns):
+    'worker: run pass2 on one slice alone, returning a list per key set'
+    images = rebuild(columns)
+    G = gpspixtrax.GPSPixTrax([images])
+    G.pass2slice(images)
+    results = []
+    for key in gpspixtrax.PASS2KEYS:
+        if key in DURATIONS:
+            results.append([micro(image[key]) for image in images])
+        else:
+            results.append([image[key] for image in images])
+    return results
+
+def _pass3(columns):
+    '''worker: run pass3 on one slice alone, returning the index and values
+    of the keys set for each interpolated image, and its counters'''
+    images = rebuild(columns)
+    G = gpspixtrax.GPSPixTrax([images], stats=instrument.Stats())
+    lastAcq, missingGPS = G.pass3slice(images, None, [])
+    index = dict((id(x), j) for j, x in enumerate(images))
+    if lastAcq is not None:
+        lastAcq = index[id(lastAcq)]
+    updated = [(j, [image[key] for key in gpspixtrax.PASS3KEYS])
+               for j, image in enumerate(images)
+               if gpspixtrax.PASS3KEYS[0] in image]
+    return (updated, lastAcq, [index[id(x)] for x in missingGPS],
+            G.stats.counters)
+
+class ParallelGPSPixTrax(gpspixtrax.GPSPixTrax):
+    '''GPSPixTrax that runs pass2 and pass3 on slices in a process pool,
+    sending each worker only the fields those passes read'''
+    def __init__(self, imagedata, processes=None, pool=None, stats=None):
+        gpspixtrax.GPSPixTrax.__init__(self, imagedata, stats)
+        self.processes = processes
+        self.pool = pool
+        # fields sent for pass2, kept for pass3 within parse()
+        self.sent = None
+        self.parsing = False
+
+    def map(self, function):
+        'apply worker function to every slice, returning results in order'
+        data = self.sent
+        if data is None:
+            data = [columns(images) for images in self.imagedata]
+            if self.parsing:
+                # pass2 changes none of them
+                self.sent = data
+        if self.pool is not None:
+            return self.pool.map(function, data)
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            return pool.map(function, data)
+        finally:
+            pool.close()
+            pool.join()
+
+    def parse(self):
+        'parse, with one pool and one copy of the fields for both passes'
+        pool = self.pool
+        if pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        self.parsing = True
+        try:
+            gpspixtrax.GPSPixTrax.parse(self)
+        finally:
+            self.parsing = False
+            self.sent = None
+            if pool is None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+    def pass2(self):
+        for images, results in zip(self.imagedata, self.map(_pass2)):
+            for key, values in zip(gpspixtrax.PASS2KEYS, results):
+                if key in DURATIONS:
+                    values = [timedelta(microseconds=x) for x in values]
+                for image, value in zip(images, values):
+                    image[key] = value
+
+    def pass3(self):
+        missingGPS = []
+        lastAcq = None
+        results = self.map(_pass3)
+        for images, result in zip(self.imagedata, results):
+            updated, last, missing, counters = result
+            if self.stats is not None:
+                self.stats.merge(counters, MAXIMA)
+            for j, values in updated:
+                image = images[j]
+                for key, value in zip(gpspixtrax.PASS3KEYS, values):
+                    image[key] = value
+            if not images:
+                continue
+            if lastAcq is not None and images[0].GPSStatus != 'V':
+                # redo the start of the slice up to its first acquired fix
+                # with the state carried from earlier slices
+                acquired = [j for j, x in enumerate(images)
+                            if x.GPSStatus == 'A']
+                if acquired:
+                    self.pass3slice(images, lastAcq, missingGPS,
+                                    acquired[0] + 1)
+                else:
+                    lastAcq, missingGPS = self.pass3slice(
+                        images, lastAcq, missingGPS)
+                    continue
+            lastAcq = last is not None and images[last] or None
+            missingGPS = [images[j] for j in missing]
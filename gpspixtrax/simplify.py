@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Path simplification by Visvalingam's algorithm, using as the importance
+# of each vertex its distance from the line between its neighbours rather
+# than the area of the triangle they make, so that the tolerance can be
+# given in meters.  Vertices are dropped least important first, keeping
+# them in a heap, so the whole path takes O(n log n).
+#
+# Points are (longitude, latitude, ...) tuples as in KML coordinates;
+# altitude is ignored.
+
+import heapq
+import math
+
+from . import geodesy
+
+def segmentdistance(point, start, end):
+    'distance in km from point to the segment from start to end'
+    a = geodesy.haversine(start[1], start[0], point[1], point[0])
+    b = geodesy.haversine(point[1], point[0], end[1], end[0])
+    c = geodesy.haversine(start[1], start[0], end[1], end[0])
+    # short enough to treat the triangle as flat
+    if b * b >= a * a + c * c:
+        # closest to start
+        return a
+    if a * a >= b * b + c * c:
+        # closest to end
+        return b
+    # height of the triangle over the segment, from its area by the
+    # form of Heron's formula that is stable for nearly flat triangles
+    x, y, z = sorted((a, b, c), reverse=True)
+    area = 0.25 * math.sqrt(max(0.0, (x + (y + z)) * (z - (x - y)) *
+                                     (z + (x - y)) * (x + (y - z))))
+    return 2 * area / c
+
+def simplify(points, tolerance):
+    '''return indices of the points to keep, dropping points that are
+    within tolerance meters of the line between their remaining neighbours'''
+    n = len(points)
+    if n < 3 or not tolerance:
+        return list(range(n))
+    limit = tolerance / 1000.0
+    before = list(range(-1, n - 1))
+    after = list(range(1, n + 1))
+    kept = [True] * n
+    errors = [None] * n
+    heap = []
+    for i in range(1, n - 1):
+        errors[i] = segmentdistance(points[i], points[i-1], points[i+1])
+        heap.append((errors[i], i))
+    heapq.heapify(heap)
+    while heap:
+        error, i = heapq.heappop(heap)
+        if not kept[i] or error != errors[i]:
+            # superseded by a later entry
+            continue
+        if error > limit:
+            break
+        kept[i] = False
+        previous, following = before[i], after[i]
+        after[previous] = following
+        before[following] = previous
+        for j in (previous, following):
+            if 0 < j < n - 1:
+                # never less important than a point already dropped, so
+                # that points are dropped in order of importance
+                errors[j] = max(error, segmentdistance(
+                    points[j], points[before[j]], points[after[j]]))
+                heapq.heappush(heap, (errors[j], j))
+    return [i for i in range(n) if kept[i]]
@@ -0,0 +1,379 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Binary snapshots of processed image data, so that a trip can be opened
+# again without exiftool or parse().  The file is:
+#
+#   header      HEADER, with the offset of each section
+#   fields      JSON list of [name, kind] for each record field
+#   slices      uint32 index of the first record of each slice, and the
+#               number of records
+#   records     one fixed-width record per image: a uint64 mask of the
+#               fields present, a uint64 mask of fields holding ints (for
+#               numbers) or aware datetimes (for times), then the fields
+#   strings     uint32 count, uint32 offsets of count + 1 boundaries, and
+#               the UTF-8 bytes of every distinct string
+#   extras      uint64 offsets of count + 1 boundaries, then for each
+#               record a JSON object (or nothing) of any keys or values
+#               that do not fit the fixed fields, such as the other tags
+#               exiftool reports; datetimes and timedeltas there are
+#               stored as {"__snapshot__": kind, ...} objects
+#
+# Numbers are stored as doubles, times and durations as int64
+# microseconds since 1970 (UTC for aware datetimes), and strings as
+# uint32 indexes into the string table.  Snapshots are opened with mmap
+# and records, and their extras, are decoded only when they are used.
+
+from datetime import datetime, timedelta
+import json
+import mmap
+import struct
+
+from dateutil import tz
+
+from . import ddict
+from . import exiftime
+
+MAGIC = b'GPXSNAP\0'
+VERSION = 1
+
+# magic, version, record count, slice count, then offset and length of
+# fields, and offsets of slices, records, strings and extras
+HEADER = struct.Struct('<8sIIIQQQQQQ')
+
+NUMBER = 'number'
+TIME = 'time'
+DURATION = 'duration'
+STRING = 'string'
+
+# struct code for each kind of field
+CODES = {NUMBER: 'd', TIME: 'q', DURATION: 'q', STRING: 'I'}
+
+FIELDS = (
+    # exiftool
+    ('SourceFile', STRING),
+    ('GPSDateTime', STRING),
+    ('GPSAltitude', NUMBER),
+    ('GPSLatitude', NUMBER),
+    ('GPSLongitude', NUMBER),
+    ('GPSSpeed', NUMBER),
+    ('GPSStatus', STRING),
+    ('GPSTrack', NUMBER),
+    ('GPSMeasureMode', NUMBER),
+    ('DateTimeOriginal', STRING),
+    ('ShotNumberSincePowerUp', NUMBER),
+    # parsetime
+    ('gpstime', TIME),
+    ('localtime', TIME),
+    ('pseudolocaltime', TIME),
+    # offsets
+    ('tzoffset', NUMBER),
+    ('tzseconds', NUMBER),
+    ('tzconfidence', NUMBER),
+    ('gpsStampAge', NUMBER),
+    # pass2
+    ('durationGPS', DURATION),
+    ('durationLocal', DURATION),
+    ('deltaDistance', NUMBER),
+    ('initialBearing', NUMBER),
+    ('averageSpeed', NUMBER),
+    ('deltaAltitude', NUMBER),
+    # pass3
+    ('fuzzdistance', NUMBER),
+    ('errSpeed', NUMBER),
+    ('fuzzlat', NUMBER),
+    ('fuzzlon', NUMBER),
+    ('fuzzbearing', NUMBER),
+    ('projlat', NUMBER),
+    ('projlon', NUMBER),
+    ('projerr', NUMBER),
+    # tracklog
+    ('loglat', NUMBER),
+    ('loglon', NUMBER),
+    ('logalt', NUMBER),
+    ('loggap', NUMBER),
+)
+
+EPOCH = datetime(1970, 1, 1)
+STRINGS = (str, type(u''))
+INTS = tuple(set((int, type(2**64))))
+
+# key of the objects standing for datetimes and timedeltas in extras
+TAGGED = '__snapshot__'
+
+class SnapshotError(Exception):
+    pass
+
+def micro(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def encode(kind, value, strings):
+    '''return (stored value, flag) for value of field kind, or None if
+    the field cannot hold it'''
+    t = type(value)
+    if kind == NUMBER:
+        if t is bool or not isinstance(value, INTS + (float,)):
+            return None
+        if isinstance(value, INTS):
+            if abs(value) >= 2**53:
+                return None
+            return float(value), True
+        return value, False
+    if kind == TIME:
+        if t is not datetime:
+            return None
+        if value.tzinfo is None:
+            return micro(value - EPOCH), False
+        if value.tzinfo != exiftime.UTC:
+            return None
+        return micro(value.replace(tzinfo=None) - EPOCH), True
+    if kind == DURATION:
+        if t is not timedelta:
+            return None
+        return micro(value), False
+    if t not in STRINGS:
+        return None
+    if isinstance(value, bytes):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+    return strings.setdefault(value, len(strings)), False
+
+def tag(value):
+    'JSON object standing for a datetime or timedelta value in extras'
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return {TAGGED: TIME, 'value': micro(value - EPOCH)}
+        offset = value.utcoffset()
+        return {TAGGED: TIME,
+                'value': micro(value.replace(tzinfo=None) - offset - EPOCH),
+                'offset': offset.days * 86400 + offset.seconds}
+    if isinstance(value, timedelta):
+        return {TAGGED: DURATION, 'value': micro(value)}
+    raise TypeError('%r is not JSON serializable' %(value,))
+
+def untag(obj):
+    'value that obj stands for, as written by tag'
+    kind = obj.get(TAGGED)
+    if kind == TIME:
+        value = EPOCH + timedelta(microseconds=obj['value'])
+        offset = obj.get('offset')
+        if offset is None:
+            return value
+        zone = tz.tzoffset(None, offset) if offset else exiftime.UTC
+        return value.replace(tzinfo=exiftime.UTC).astimezone(zone)
+    if kind == DURATION:
+        return timedelta(microseconds=obj['value'])
+    return obj
+
+def dumpextras(extra):
+    '''JSON of the extras of one image, raising SnapshotError naming any
+    key whose value cannot be stored'''
+    try:
+        return json.dumps(extra, default=tag)
+    except (TypeError, ValueError):
+        for key, value in extra.items():
+            try:
+                json.dumps(value, default=tag)
+            except (TypeError, ValueError) as e:
+                raise SnapshotError('cannot store %s in a snapshot: %s'
+                                    %(key, e))
+        raise
+
+def write(path, imagedata):
+    'write imagedata, a list of lists of images, as a snapshot at path'
+    record = struct.Struct('<QQ' + ''.join(CODES[x[1]] for x in FIELDS))
+    fields = json.dumps([list(x) for x in FIELDS])
+    fields = fields.encode('ascii')
+    index = dict((name, i) for i, (name, _) in enumerate(FIELDS))
+    strings = {}
+    extras = []
+    boundaries = [0]
+    f = open(path, 'wb')
+    try:
+        f.write(b'\0' * HEADER.size)
+        f.write(fields)
+        slicesoffset = f.tell()
+        count = sum(len(x) for x in imagedata)
+        # boundaries are known before the records are written
+        for images in imagedata:
+            boundaries.append(boundaries[-1] + len(images))
+        f.write(struct.pack('<%dI' %len(boundaries), *boundaries))
+        recordsoffset = f.tell()
+        for images in imagedata:
+            for image in images:
+                present = 0
+                flags = 0
+                values = [0] * len(FIELDS)
+                extra = {}
+                for key, value in image.items():
+                    i = index.get(key)
+                    encoded = None
+                    if i is not None:
+                        encoded = encode(FIELDS[i][1], value, strings)
+                    if encoded is None:
+                        extra[key] = value
+                        continue
+                    values[i], flag = encoded
+                    present |= 1 << i
+                    if flag:
+                        flags |= 1 << i
+                f.write(record.pack(present, flags, *values))
+                extras.append(dumpextras(extra).encode('utf-8')
+                              if extra else b'')
+        stringsoffset = f.tell()
+        table = [None] * len(strings)
+        for value, i in strings.items():
+            table[i] = value.encode('utf-8')
+        offsets = [0]
+        for value in table:
+            offsets.append(offsets[-1] + len(value))
+        f.write(struct.pack('<I%dI' %len(offsets), len(table), *offsets))
+        for value in table:
+            f.write(value)
+        extrasoffset = f.tell()
+        offsets = [0]
+        for value in extras:
+            offsets.append(offsets[-1] + len(value))
+        f.write(struct.pack('<%dQ' %len(offsets), *offsets))
+        for value in extras:
+            f.write(value)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, count, len(imagedata),
+                            HEADER.size, len(fields), slicesoffset,
+                            recordsoffset, stringsoffset, extrasoffset))
+    finally:
+        f.close()
+
+class Snapshot(object):
+    'memory-mapped snapshot, decoding records into ddicts when used'
+    def __init__(self, path):
+        self.path = path
+        f = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        if len(self.data) < HEADER.size:
+            raise SnapshotError('%s: not a snapshot' %path)
+        (magic, version, self.count, nslices, fieldsoffset, fieldslength,
+         self.slicesoffset, self.recordsoffset, self.stringsoffset,
+         self.extrasoffset) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise SnapshotError('%s: not a snapshot' %path)
+        if version != VERSION:
+            raise SnapshotError('%s: unsupported snapshot version %d'
+                                %(path, version))
+        fields = json.loads(self.data[fieldsoffset:fieldsoffset+fieldslength]
+                            .decode('ascii'))
+        self.fields = [tuple(x) for x in fields]
+        self.record = struct.Struct('<QQ' + ''.join(CODES[x[1]] for x in fields))
+        self.boundaries = struct.unpack_from('<%dI' %(nslices + 1), self.data,
+                                             self.slicesoffset)
+        count, = struct.unpack_from('<I', self.data, self.stringsoffset)
+        # string bytes follow the count and count + 1 offsets
+        self.stringbase = self.stringsoffset + 4 * (count + 2)
+        self.strings = {}
+        # extra bytes follow the count + 1 offsets
+        self.extrabase = self.extrasoffset + 8 * (self.count + 1)
+
+    def close(self):
+        self.data.close()
+
+    def __len__(self):
+        return self.count
+
+    def string(self, i):
+        value = self.strings.get(i)
+        if value is None:
+            start, end = struct.unpack_from('<II', self.data,
+                                            self.stringsoffset + 4 + 4 * i)
+            value = self.data[self.stringbase+start:
+                              self.stringbase+end].decode('utf-8')
+            self.strings[i] = value
+        return value
+
+    def extras(self, n):
+        'dict of the keys of record n that are not in the fixed fields'
+        start, end = struct.unpack_from('<QQ', self.data,
+                                        self.extrasoffset + 8 * n)
+        if start == end:
+            return {}
+        return json.loads(self.data[self.extrabase+start:
+                                    self.extrabase+end].decode('utf-8'),
+                          object_hook=untag)
+
+    def image(self, n):
+        'return record n as a ddict like the one that was written'
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        values = self.record.unpack_from(
+            self.data, self.recordsoffset + n * self.record.size)
+        present, flags = values[0:2]
+        image = ddict.ddict()
+        for i, (name, kind) in enumerate(self.fields):
+            bit = 1 << i
+            if not present & bit:
+                continue
+            value = values[i+2]
+            if kind == NUMBER:
+                if flags & bit:
+                    value = int(value)
+            elif kind == TIME:
+                value = EPOCH + timedelta(microseconds=value)
+                if flags & bit:
+                    value = value.replace(tzinfo=exiftime.UTC)
+            elif kind == DURATION:
+                value = timedelta(microseconds=value)
+            else:
+                value = self.string(value)
+            image[name] = value
+        image.update(self.extras(n))
+        return image
+
+    @property
+    def slices(self):
+        return [SnapshotSlice(self, self.boundaries[i], self.boundaries[i+1])
+                for i in range(len(self.boundaries) - 1)]
+
+    def imagedata(self):
+        'decode every record into a list of lists of ddicts'
+        return [list(x) for x in self.slices]
+
+class SnapshotSlice(object):
+    'list-like view of records start..stop of a snapshot'
+    def __init__(self, snapshot, start, stop):
+        self.snapshot = snapshot
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[x] for x in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.snapshot.image(self.start + i)
+
+    def __iter__(self):
+        for i in range(self.start, self.stop):
+            yield self.snapshot.image(i)
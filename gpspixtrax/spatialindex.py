@@ -0,0 +1,178 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Grid index over the positions of processed images, for bounding box,
+# radius and k-nearest queries.  Each image is placed at the best
+# position it has: a verified fix, else the interpolated (fuzz) position,
+# else the projected one.  Radius queries look only at the grid cells in
+# the equirectangular bounding box of the circle, and only measure
+# haversine distances to the positions inside that box.  An index can be
+# saved as JSON and loaded again without the image data.
+
+import collections
+import json
+import math
+
+from . import geodesy
+
+# position fields for each kind of position, in order of preference
+SOURCES = collections.OrderedDict((
+    ('gps', ('GPSLatitude', 'GPSLongitude')),
+    ('fuzz', ('fuzzlat', 'fuzzlon')),
+    ('proj', ('projlat', 'projlon')),
+))
+
+CELLSIZE = 0.01 # degrees
+
+VERSION = 1
+
+# image is None for an index loaded from a file
+Position = collections.namedtuple('Position',
+                                  'file lat lon source image')
+
+def position(image, sources):
+    'return (lat, lon, source) for the best position of image, or None'
+    for source in sources:
+        lat, lon = SOURCES[source]
+        if source == 'gps' and image.get('GPSStatus') != 'A':
+            continue
+        if lat in image and lon in image:
+            return image[lat], image[lon], source
+    return None
+
+class GridIndex(object):
+    'positions in cells of cellsize degrees of latitude and longitude'
+    def __init__(self, imagedata=(), sources=tuple(SOURCES), cellsize=CELLSIZE):
+        self.cellsize = cellsize
+        self.positions = []
+        self.cells = {}
+        for slice in imagedata:
+            for image in slice:
+                found = position(image, sources)
+                if found is not None:
+                    lat, lon, source = found
+                    self.add(Position(image.SourceFile, lat, lon, source,
+                                      image))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def cell(self, lat, lon):
+        return (int(math.floor(lat / self.cellsize)),
+                int(math.floor(lon / self.cellsize)))
+
+    def add(self, position):
+        self.cells.setdefault(self.cell(position.lat, position.lon),
+                              []).append(len(self.positions))
+        self.positions.append(position)
+
+    def candidates(self, south, west, north, east):
+        'indexes of positions in the cells covering the box'
+        bottom, left = self.cell(south, west)
+        top, right = self.cell(north, east)
+        if (top - bottom + 1) * (right - left + 1) > len(self.cells):
+            # a big box; cheaper to look at every occupied cell
+            keys = [x for x in self.cells
+                    if bottom <= x[0] <= top and left <= x[1] <= right]
+        else:
+            keys = [(row, column) for row in range(bottom, top + 1)
+                    for column in range(left, right + 1)]
+        for key in keys:
+            for i in self.cells.get(key, ()):
+                yield i
+
+    def bbox(self, south, west, north, east):
+        '''list of positions in the box, which crosses the antimeridian
+        if west is greater than east'''
+        if west > east:
+            return (self.bbox(south, west, north, 180) +
+                    self.bbox(south, -180, north, east))
+        result = []
+        for i in self.candidates(south, west, north, east):
+            p = self.positions[i]
+            if south <= p.lat <= north and west <= p.lon <= east:
+                result.append(p)
+        return result
+
+    def bounds(self, lat, lon, meters):
+        '''(south, west, north, east) of the equirectangular box around the
+        circle of radius meters, or None for longitude if it covers all'''
+        dlat = math.degrees(meters / 1000.0 / geodesy.R)
+        south = max(lat - dlat, -90.0)
+        north = min(lat + dlat, 90.0)
+        widest = max(abs(south), abs(north))
+        if widest >= 90.0:
+            return south, None, north, None
+        dlon = dlat / math.cos(math.radians(widest))
+        if dlon >= 180.0:
+            return south, None, north, None
+        west = lon - dlon
+        east = lon + dlon
+        # wrap across the antimeridian
+        if west < -180.0:
+            west += 360.0
+        if east > 180.0:
+            east -= 360.0
+        return south, west, north, east
+
+    def radius(self, lat, lon, meters):
+        'list of (distance in meters, position) within meters, nearest first'
+        south, west, north, east = self.bounds(lat, lon, meters)
+        if west is None:
+            west, east = -180.0, 180.0
+        result = []
+        for p in self.bbox(south, west, north, east):
+            distance = 1000.0 * geodesy.haversine(lat, lon, p.lat, p.lon)
+            if distance <= meters:
+                result.append((distance, p))
+        result.sort(key=lambda x: x[0])
+        return result
+
+    def knearest(self, lat, lon, k):
+        'list of (distance in meters, position) for the k nearest, nearest first'
+        k = min(k, len(self.positions))
+        if k <= 0:
+            return []
+        # start with about a cell, widening until there are enough
+        meters = 1000.0 * geodesy.haversine(0, 0, self.cellsize, 0)
+        halfway = 1000.0 * math.pi * geodesy.R
+        while True:
+            found = self.radius(lat, lon, meters)
+            if len(found) >= k or meters >= halfway:
+                return found[0:k]
+            meters *= 2
+
+    def save(self, f):
+        'write the index as JSON to file object f'
+        json.dump({
+            'version': VERSION,
+            'cellsize': self.cellsize,
+            'positions': [[p.file, p.lat, p.lon, p.source]
+                          for p in self.positions],
+        }, f)
+
+    @classmethod
+    def load(cls, f):
+        'read an index written by save from file object f'
+        data = json.load(f)
+        if data.get('version') != VERSION:
+            raise ValueError('unsupported index version %r'
+                             %data.get('version'))
+        index = cls(cellsize=data['cellsize'])
+        for file, lat, lon, source in data['positions']:
+            index.add(Position(file, lat, lon, source, None))
+        return index
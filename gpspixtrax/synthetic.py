@@ -0,0 +1,126 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Synthetic trips, as exiftool -n -j would report them, for measuring
+# how the processing scales.  The camera travels along a wandering route
+# for some days, shooting during the day with occasional bursts, and
+# with its clock set to a time zone that changes as the trip goes on.
+# Its GPS loses the fix in runs of shots, during which it stamps each
+# image with the last position and GPS time it had, marked V, as the
+# camera the real data came from does.  The same arguments always make
+# the same trip on the same version of Python.
+
+from datetime import datetime, timedelta
+import json
+import math
+import random
+
+from . import geodesy
+
+START = datetime(2013, 6, 7, 6, 0, 0) # UTC
+# shots each day are spread over this many hours from START's time
+DAYLIGHT = 12
+
+def trip(images=1000, days=10, perdirectory=1000, dropout=0.3, runlength=8,
+         zones=(-5, 2, 5.5), burst=0.02, lat=55.68, lon=12.58, seed=1):
+    '''yield images exiftool records over days, in a directory per day
+    with at most perdirectory images each; dropout of the images are in
+    V runs of runlength on average, zones are the camera clock offsets
+    from UTC in hours over the course of the trip, and burst of the shots
+    start a burst of several images'''
+    rng = random.Random(seed)
+    # chance of losing the fix after a verified shot, so that on average
+    # dropout of the shots are in runs of runlength
+    if dropout >= 1:
+        lose = 1.0
+    else:
+        lose = dropout / (runlength * (1.0 - dropout))
+    alt = 20.0
+    heading = rng.uniform(0, 360)
+    fix = None
+    number = 0
+    for day in range(days):
+        count = images // days + (day < images % days)
+        zone = zones[day * len(zones) // days]
+        when = START + timedelta(days=day)
+        gap = DAYLIGHT * 3600.0 / max(count, 1)
+        shot = 0
+        directory = when.strftime('%Y%m%d')
+        # the receiver takes a few shots to find itself each morning
+        status = 'V'
+        pending = rng.randint(0, runlength)
+        while shot < count:
+            # one burst or a single shot
+            shots = 1
+            if rng.random() < burst:
+                shots = rng.randint(3, 10)
+            elapsed = rng.expovariate(1.0 / gap)
+            speed = rng.choice((0.0, rng.uniform(1, 6), rng.uniform(20, 110)))
+            heading = (heading + rng.gauss(0, 30)) % 360
+            lat, lon = geodesy.project(lat, lon, math.radians(heading),
+                                       speed * elapsed / 3600.0)
+            lat = max(-80.0, min(80.0, lat))
+            alt = max(-20.0, alt + rng.gauss(0, 5))
+            for _ in range(min(shots, count - shot)):
+                if status == 'A' and rng.random() < lose:
+                    status = 'V'
+                    pending = max(1, int(rng.expovariate(1.0 / runlength)))
+                elif status == 'V':
+                    pending -= 1
+                    if pending <= 0:
+                        status = 'A'
+                when += timedelta(seconds=elapsed)
+                elapsed = rng.uniform(0.1, 0.3)
+                number = number % 99999 + 1
+                if status == 'A':
+                    fix = (when, lat, lon, alt, speed, heading)
+                elif fix is None:
+                    # never had a fix; whatever the receiver last knew
+                    fix = (when - timedelta(days=30), 0.0, 0.0, 0.0, 0.0,
+                           0.0)
+                fixtime, fixlat, fixlon, fixalt, fixspeed, fixtrack = fix
+                subdirectory = directory
+                if shot >= perdirectory:
+                    subdirectory = '%s-%d' %(directory, shot // perdirectory)
+                local = when + timedelta(hours=zone)
+                yield {
+                    'SourceFile': '%s/dsc%05d.jpg' %(subdirectory, number),
+                    'GPSDateTime': '%s.%03dZ' %(
+                        fixtime.strftime('%Y:%m:%d %H:%M:%S'),
+                        fixtime.microsecond // 1000),
+                    'GPSAltitude': round(fixalt, 1),
+                    'GPSLatitude': fixlat,
+                    'GPSLongitude': fixlon,
+                    'GPSSpeed': round(fixspeed, 1),
+                    'GPSStatus': status,
+                    'GPSTrack': round(fixtrack, 2),
+                    'GPSMeasureMode': 3,
+                    'DateTimeOriginal': local.strftime('%Y:%m:%d %H:%M:%S'),
+                    'ShotNumberSincePowerUp': shot + 1,
+                }
+                shot += 1
+
+def dump(records, f):
+    'write records to file object f as the JSON array exiftool -j would'
+    f.write('[')
+    first = True
+    for record in records:
+        if not first:
+            f.write(',\n')
+        first = False
+        f.write(json.dumps(record, sort_keys=True))
+    f.write(']\n')
@@ -0,0 +1,219 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Track logs from a separate GPS logger, read from GPX or NMEA files one
+# point at a time into arrays sorted by time, and matched against images
+# in a single merge over the sorted slices.  Images are placed by their
+# camera clock corrected by tzseconds, since the camera's own GPS clock
+# is what cannot be trusted when it has no fix.
+
+from array import array
+from bisect import bisect_right
+import calendar
+
+from lxml import etree
+
+from . import exiftime
+
+# do not interpolate between logger points further apart than this
+MAXGAP = 300 # seconds
+
+NAN = float('nan')
+
+class TrackLog(object):
+    'logger points as parallel arrays of UTC seconds, latitude, longitude, altitude'
+    def __init__(self):
+        self.times = array('d')
+        self.lats = array('d')
+        self.lons = array('d')
+        # NaN where the logger recorded no altitude
+        self.alts = array('d')
+        self.timeparser = exiftime.TimestampParser()
+        # UTC seconds at the start of each YYYY-MM-DD seen
+        self.days = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, time, lat, lon, alt=NAN):
+        self.times.append(time)
+        self.lats.append(lat)
+        self.lons.append(lon)
+        self.alts.append(alt)
+
+    def sort(self):
+        'put points in time order, if they are not already'
+        times = self.times
+        if all(times[i] <= times[i+1] for i in range(len(times) - 1)):
+            # logs are written in order; only concatenated files are not
+            return
+        order = sorted(range(len(times)), key=times.__getitem__)
+        for name in ('times', 'lats', 'lons', 'alts'):
+            values = getattr(self, name)
+            setattr(self, name, array('d', [values[i] for i in order]))
+
+    def gpxtime(self, text):
+        'UTC seconds for a GPX time, quickly if it is YYYY-MM-DDTHH:MM:SS[.f]Z'
+        if (len(text) >= 20 and text[10] == 'T' and text[13] == ':' and
+            text[16] == ':' and text[-1] == 'Z'):
+            day = self.days.get(text[0:10])
+            if day is None:
+                day = self.timeparser.epoch(text[0:10] + 'T00:00:00Z')
+                self.days[text[0:10]] = day
+            try:
+                return (day + int(text[11:13]) * 3600 + int(text[14:16]) * 60
+                        + float(text[17:-1]))
+            except ValueError:
+                pass
+        return self.timeparser.epoch(text)
+
+    def readgpx(self, source):
+        'add the track points from GPX filename or file object source'
+        # any GPX version; only trkpt matters
+        for event, element in etree.iterparse(source, tag='{*}trkpt'):
+            time = None
+            alt = NAN
+            for child in element:
+                # faster than find for the few children a point has
+                tag = child.tag
+                if tag.endswith('}time') and child.text:
+                    time = self.gpxtime(child.text.strip())
+                elif tag.endswith('}ele') and child.text:
+                    alt = float(child.text)
+            if time is not None:
+                self.append(time, float(element.get('lat')),
+                            float(element.get('lon')), alt)
+            # keep memory constant however long the log
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    def readnmea(self, lines):
+        'add the fixes from the NMEA 0183 sentences in iterable lines'
+        date = None
+        gga = (None, NAN)
+        for line in lines:
+            fields = nmeafields(line)
+            if fields is None:
+                continue
+            sentence = fields[0][-3:]
+            if sentence == 'GGA' and len(fields) > 9:
+                # fix quality 0 is no fix
+                if fields[6] not in ('', '0') and fields[9]:
+                    gga = (fields[1], float(fields[9]))
+                    if (date is not None and len(self)
+                        and self.alts[-1] != self.alts[-1]
+                        and self.times[-1] == nmeatime(date, fields[1])):
+                        # RMC came first for this fix
+                        self.alts[-1] = gga[1]
+            elif sentence == 'RMC' and len(fields) > 9:
+                date = fields[9]
+                if fields[2] != 'A' or not fields[3] or not fields[5]:
+                    # void fix
+                    continue
+                alt = NAN
+                if gga[0] == fields[1]:
+                    alt = gga[1]
+                self.append(nmeatime(date, fields[1]),
+                            nmeadegrees(fields[3], fields[4], 'S'),
+                            nmeadegrees(fields[5], fields[6], 'W'), alt)
+
+    def locate(self, time, index, maxgap=MAXGAP):
+        '''return (lat, lon, alt, gap) interpolated at time, or None, and the
+        index of the first point after time, searching on from index'''
+        times = self.times
+        n = len(times)
+        if index > 0 and times[index-1] > time:
+            # going back in time; start over
+            index = bisect_right(times, time)
+        # usually the next point is close by; otherwise search for it
+        stop = min(n, index + 8)
+        while index < stop and times[index] <= time:
+            index += 1
+        if index == stop and index < n and times[index] <= time:
+            index = bisect_right(times, time, index)
+        if index == 0 or index == n and times[-1] != time:
+            return None, index
+        before = index - 1
+        if times[before] == time:
+            return (self.lats[before], self.lons[before], self.alts[before],
+                    0.0), index
+        gap = times[index] - times[before]
+        if gap > maxgap:
+            return None, index
+        f = (time - times[before]) / gap
+        def between(values):
+            return values[before] + f * (values[index] - values[before])
+        return (between(self.lats), between(self.lons), between(self.alts),
+                gap), index
+
+    def match(self, imagedata, maxgap=MAXGAP):
+        '''set loglat, loglon, loggap and, if the logger recorded altitude,
+        logalt for each image with a time zone offset taken while the
+        logger has points at most maxgap seconds apart; returns how many'''
+        self.sort()
+        matched = 0
+        index = 0
+        for slice in imagedata:
+            for image in slice:
+                if 'tzseconds' not in image:
+                    continue
+                time = (exiftime.epoch(image.pseudolocaltime) +
+                        image.tzseconds)
+                location, index = self.locate(time, index, maxgap)
+                if location is None:
+                    continue
+                lat, lon, alt, gap = location
+                image['loglat'] = lat
+                image['loglon'] = lon
+                if alt == alt:
+                    image['logalt'] = alt
+                image['loggap'] = gap
+                matched += 1
+        return matched
+
+def nmeafields(line):
+    'return the fields of a valid NMEA sentence, or None'
+    line = line.strip()
+    if not line.startswith('$'):
+        return None
+    body, star, checksum = line[1:].partition('*')
+    if star:
+        total = 0
+        for c in body:
+            total ^= ord(c)
+        if checksum[:2].upper() != '%02X' %total:
+            return None
+    return body.split(',')
+
+def nmeatime(date, time):
+    'UTC seconds from NMEA ddmmyy date and hhmmss.ss time'
+    seconds = float(time[4:])
+    year = int(date[4:6])
+    # two-digit years, as GPS itself only started in 1980
+    year += 1900 if year >= 80 else 2000
+    return calendar.timegm((year, int(date[2:4]),
+                            int(date[0:2]), int(time[0:2]), int(time[2:4]),
+                            0)) + seconds
+
+def nmeadegrees(value, hemisphere, negative):
+    'decimal degrees from NMEA [d]ddmm.mmmm and hemisphere letter'
+    point = value.index('.') if '.' in value else len(value)
+    degrees = int(value[:point-2]) + float(value[point-2:]) / 60.0
+    if hemisphere == negative:
+        return -degrees
+    return degrees
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Time zone offsets of the camera clock for a whole trip, solved in a few
+# linear passes over its images in order.
+#
+# Each verified (GPSStatus 'A') fix votes for gpstime - pseudolocaltime
+# rounded to the nearest half hour.  A scan over the votes starts a new
+# segment where a run of at least minrun fixes agrees on an offset other
+# than the most common one in the current segment, as happens when the
+# camera clock is set to a new time zone; shorter runs are outvoted.
+#
+# Then each image is assigned an offset.  A verified fix keeps its own
+# vote.  Other images take the most common offset of the segment of the
+# nearest fixes before and after them.  Between two segments, the segment
+# whose fix is nearer by the camera clock wins, since the GPS clock
+# stands still without a fix.
+#
+# With no verified fix in the whole trip, void fixes vote instead, but
+# only those within epsilon seconds of a whole number of hours and less
+# than span seconds from the camera clock.  A half-hour offset is never
+# guessed without a verified fix.
+#
+# The images given an offset are counted by how: voted for their own
+# verified fix, guessed from their own void fix, or taken from the
+# nearest vote.
+#
+# tzconfidence, from 0 to 1, is the share of the segment's votes for the
+# offset.  It is reduced by span / (span + d) for an image d seconds by
+# the camera clock from the nearest vote, and halved for guesses from
+# void fixes.
+
+def seconds(delta):
+    return delta.days * 86400 + delta.seconds + delta.microseconds * 0.000001
+
+# seconds in each bucket of the vote histogram
+BUCKET = 1800
+
+# keys set for each image with an offset
+KEYS = ('tzoffset', 'tzseconds', 'tzconfidence', 'gpsStampAge')
+
+class Segment(object):
+    'histogram of the votes for a stretch of the trip in one time zone'
+    def __init__(self):
+        self.votes = {}
+        self.total = 0
+        self.mode = None
+        # whether a run of at least minrun votes has been added
+        self.solid = False
+
+    def add(self, bucket, count=1):
+        n = self.votes.get(bucket, 0) + count
+        self.votes[bucket] = n
+        self.total += count
+        if self.mode is None or n > self.votes[self.mode]:
+            self.mode = bucket
+
+    def confidence(self, bucket):
+        'share of the votes for bucket'
+        return self.votes.get(bucket, 0) / float(self.total)
+
+def guess(seconds, epsilon, span):
+    '''bucket of the whole number of hours that seconds is within epsilon
+    of, if less than span, or None'''
+    off = abs(seconds)
+    if off < span and (off + epsilon) % 3600 < epsilon * 2:
+        return int(round(seconds / 3600.0)) * 2
+    return None
+
+def segments(votes, minrun=3):
+    '''list of Segments for votes, a list of buckets in trip order, and
+    the index of the segment each vote is in'''
+    result = []
+    owners = []
+    i = 0
+    while i < len(votes):
+        bucket = votes[i]
+        j = i + 1
+        while j < len(votes) and votes[j] == bucket:
+            j += 1
+        current = result and result[-1] or None
+        solid = j - i >= minrun
+        if current is None or (solid and current.solid and
+                               bucket != current.mode):
+            current = Segment()
+            result.append(current)
+        current.add(bucket, j - i)
+        current.solid = current.solid or solid
+        owners.extend([len(result) - 1] * (j - i))
+        i = j
+    return result, owners
+
+def offset(bucket):
+    'tzoffset in hours for bucket, an int unless a half hour'
+    if bucket % 2:
+        return bucket * 0.5
+    return bucket // 2
+
+def solve(images, minrun=3, span=28800, epsilon=300, weak=0.5):
+    '''set tzoffset, tzseconds, tzconfidence and gpsStampAge on images, a
+    list of images of a trip in order; returns the list of Segments and a
+    dict counting the images voted, guessed, nearest and unsolved'''
+    n = len(images)
+    # camera clock in seconds into the trip, and GPS time - camera clock;
+    # items rather than attributes, as this is run for every image
+    local = []
+    raw = []
+    buckets = []
+    start = n and images[0]['pseudolocaltime']
+    for image in images:
+        pseudolocaltime = image['pseudolocaltime']
+        local.append(seconds(pseudolocaltime - start))
+        r = seconds(image['gpstime'] - pseudolocaltime)
+        raw.append(r)
+        buckets.append(int(round(r / BUCKET))
+                       if image['GPSStatus'] == 'A' else None)
+    factor = 1.0
+    if not any(x is not None for x in buckets):
+        buckets = [guess(r, epsilon, span) for r in raw]
+        factor = weak
+    positions = [i for i in range(n) if buckets[i] is not None]
+    result, owners = segments([buckets[i] for i in positions], minrun)
+
+    # index into positions of the last vote at or before each image
+    before = [None] * n
+    k = -1
+    for i in range(n):
+        if k + 1 < len(positions) and positions[k + 1] == i:
+            k += 1
+        before[i] = k
+
+    counts = dict(voted=0, guessed=0, nearest=0, unsolved=0)
+    own = 'voted' if factor == 1.0 else 'guessed'
+    for i, image in enumerate(images):
+        k = before[i]
+        if k >= 0 and positions[k] == i:
+            bucket = buckets[i]
+            confidence = result[owners[k]].confidence(bucket)
+            counts[own] += 1
+        else:
+            # nearest vote by the camera clock, the earlier one if tied
+            distance = None
+            if k >= 0:
+                distance = abs(local[i] - local[positions[k]])
+            if k + 1 < len(positions):
+                later = abs(local[positions[k + 1]] - local[i])
+                if distance is None or later < distance:
+                    k += 1
+                    distance = later
+            if distance is None:
+                for key in KEYS:
+                    if key in image:
+                        del image[key]
+                counts['unsolved'] += 1
+                continue
+            segment = result[owners[k]]
+            bucket = segment.mode
+            confidence = (segment.confidence(bucket) *
+                          span / (span + distance))
+            counts['nearest'] += 1
+        image['tzoffset'] = offset(bucket)
+        image['tzseconds'] = bucket * BUCKET
+        image['tzconfidence'] = confidence * factor
+        image['gpsStampAge'] = int(bucket * BUCKET - raw[i])
+    return result, counts
@@ -0,0 +1,345 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Watching import directories for new images, on Linux.  Files written
+# under the roots are collected from inotify until the copying has been
+# quiet for a while, so a card copied in is handled as one batch.  Only
+# the new files go through exiftool, using workers kept running between
+# batches, and the trip is brought up to date with GPSPixTrax.update(),
+# after which KML is written again for just the slices that changed.
+# Images and directories deleted or moved away are dropped from the trip
+# in the same batches, along with the KML of any slice left empty.
+#
+# inotify is used through ctypes, so nothing beyond the C library is
+# needed.
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+from . import discover
+from . import exiftool
+from . import gpspixtrax
+from . import instrument
+from . import kml
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+ADDED = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+REMOVED = IN_MOVED_FROM | IN_DELETE | IN_DELETE_SELF
+MASK = ADDED | REMOVED
+
+# wd, mask, cookie, length of name
+EVENT = struct.Struct('iIII')
+
+# file names as the OS has them, on python 2 and 3
+encode = getattr(os, 'fsencode', lambda x: x)
+decode = getattr(os, 'fsdecode', lambda x: x)
+
+class Inotify(object):
+    'inotify instance yielding (path, mask) for events under watched directories'
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.add = libc.inotify_add_watch
+        self.add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        # directory by watch descriptor
+        self.directories = {}
+
+    def watch(self, directory):
+        wd = self.add(self.fd, encode(directory), MASK)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), directory)
+        self.directories[wd] = directory
+
+    def read(self, timeout):
+        'list of (path, mask) for events within timeout seconds'
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+            if mask & IN_IGNORED:
+                self.directories.pop(wd, None)
+                continue
+            directory = self.directories.get(wd)
+            if directory is None and not mask & IN_Q_OVERFLOW:
+                continue
+            if name:
+                events.append((os.path.join(directory, decode(name)), mask))
+            else:
+                events.append((directory, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+def walk(roots, dates=None):
+    '''every image file under roots, grouped by directory, and every
+    directory, leaving out those named for dates outside dates'''
+    groups = discover.discover(roots, dates=dates)
+    return discover.filelist(groups), [x for x, _ in groups]
+
+class Debouncer(object):
+    '''files seen, released as one batch once nothing new has arrived for
+    quiet seconds, or maxdelay seconds after the first of them'''
+    def __init__(self, quiet=2.0, maxdelay=30.0, clock=time.time):
+        self.quiet = quiet
+        self.maxdelay = maxdelay
+        self.clock = clock
+        self.pending = set()
+        self.first = None
+        self.last = None
+
+    def add(self, path):
+        now = self.clock()
+        if not self.pending:
+            self.first = now
+        self.pending.add(path)
+        self.last = now
+
+    def timeout(self):
+        'seconds until the batch is due, or None if there is none'
+        if not self.pending:
+            return None
+        due = min(self.last + self.quiet, self.first + self.maxdelay)
+        return max(0.0, due - self.clock())
+
+    def take(self):
+        'sorted batch of paths if it is due, else []'
+        if not self.pending or self.timeout() > 0:
+            return []
+        batch = sorted(self.pending)
+        self.pending = set()
+        return batch
+
+def kmlname(root, directory):
+    'KML filename for the slice from directory under root'
+    relative = os.path.relpath(directory, root)
+    if relative == '.':
+        relative = os.path.basename(os.path.abspath(root))
+    return relative.replace(os.sep, '_') + '.kml'
+
+def root(roots, path):
+    'the one of roots that path is under'
+    for x in roots:
+        if path == x or path.startswith(x + os.sep):
+            return x
+    return os.path.dirname(path)
+
+def writekml(imagedata, roots, output, tolerance=None, stats=None):
+    '''write KML for each slice of imagedata into directory output, its
+    paths simplified to within tolerance meters if set, counting their
+    vertices in stats if given'''
+    for images in imagedata:
+        if not images:
+            continue
+        directory = os.path.dirname(images[0].SourceFile)
+        name = kmlname(root(roots, directory), directory)
+        path = os.path.join(output, name)
+        # viewers never see a half-written file
+        kml.KMLPaths(images, tolerance, stats).writeKMLPaths(path + '.tmp',
+                                                             name[:-4])
+        os.rename(path + '.tmp', path)
+
+def simplified(stats):
+    'what simplifying the paths did, from the counters in stats'
+    return '%d of %d path vertices kept' %(
+        stats.counters.get('keptVertices', 0),
+        stats.counters.get('pathVertices', 0))
+
+class Watcher(object):
+    '''trip of all the images under roots, kept up to date as images are
+    added, with KML for each slice written into output'''
+    def __init__(self, roots, output, pool=None, quiet=2.0, maxdelay=30.0,
+                 inotify=None, clock=time.time, log=None, dates=None,
+                 tolerance=None):
+        self.roots = [os.path.abspath(x) for x in roots]
+        self.output = output
+        # (first, last) datetime.date, as for discover
+        self.dates = dates
+        # meters to simplify the KML paths to within, if set
+        self.tolerance = tolerance
+        # paths deleted or moved away since the last batch
+        self.removed = set()
+        # kept between batches so that exiftool is started only once
+        self.pool = pool
+        self.debouncer = Debouncer(quiet, maxdelay, clock)
+        self.inotify = inotify
+        self.log = log or (lambda message: None)
+        self.G = None
+
+    def start(self):
+        'watch the roots and process the images already there'
+        if self.inotify is None:
+            self.inotify = Inotify()
+        files, directories = walk(self.roots, self.dates)
+        for directory in directories:
+            self.inotify.watch(directory)
+        imagedata = []
+        if files:
+            imagedata = exiftool.fetchdata(files, pool=self.pool)
+        self.G = gpspixtrax.GPSPixTrax(imagedata)
+        self.G.parse()
+        written = self.writekml(0, len(imagedata))
+        self.log('%d images in %d slices%s' %(len(files), len(imagedata),
+                                              written))
+
+    def writekml(self, start, stop):
+        '''write the KML of slices start..stop, returning what simplifying
+        their paths did for the log, if anything'''
+        stats = instrument.Stats()
+        writekml(self.G.imagedata[start:stop], self.roots, self.output,
+                 self.tolerance, stats)
+        if not self.tolerance:
+            return ''
+        return ', ' + simplified(stats)
+
+    def pruned(self, directory):
+        'whether directory is named for a date outside dates'
+        return discover.Discovery([], dates=self.dates).prune(
+            os.path.basename(directory), 0)
+
+    def remove(self, path):
+        self.removed.add(path)
+        self.debouncer.add(path)
+
+    def event(self, path, mask):
+        if mask & IN_Q_OVERFLOW:
+            # events were lost; pick up whatever is not known yet, and
+            # drop whatever has gone
+            known = set(x.SourceFile for y in self.G.imagedata for x in y)
+            files = walk(self.roots, self.dates)[0]
+            for path in set(files) - known:
+                self.debouncer.add(path)
+            for path in known - set(files):
+                self.remove(path)
+        elif mask & REMOVED:
+            if mask & (IN_ISDIR | IN_DELETE_SELF) or discover.isimage(path):
+                self.remove(path)
+        elif mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not self.pruned(path):
+                # a new directory may already have files in it by now
+                files, directories = walk([path], self.dates)
+                for directory in directories:
+                    self.inotify.watch(directory)
+                for x in files:
+                    self.removed.discard(x)
+                    self.debouncer.add(x)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and discover.isimage(path):
+            self.removed.discard(path)
+            self.debouncer.add(path)
+
+    def gone(self, path, removed):
+        'whether path or a directory above it is in removed'
+        while path not in removed:
+            parent = os.path.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+        return True
+
+    def process(self, batch):
+        '''read the new files in batch, drop the removed ones, and update
+        the trip and its KML'''
+        removed = self.removed.intersection(batch)
+        self.removed -= removed
+        batch = [x for x in batch if x not in removed]
+        fetched = []
+        if batch:
+            fetched = exiftool.fetchdata(batch, pool=self.pool)
+        slices = dict((os.path.dirname(x[0].SourceFile), x) for x in fetched)
+        new = set(batch)
+        changed = []
+        emptied = []
+        dropped = 0
+        for images in self.G.imagedata:
+            if not images:
+                continue
+            directory = os.path.dirname(images[0].SourceFile)
+            kept = [x for x in images if not self.gone(x.SourceFile, removed)]
+            if directory not in slices and len(kept) == len(images):
+                continue
+            dropped += len(images) - len(kept)
+            # the slice as it was, less any files written again or removed
+            kept = [x for x in kept if x.SourceFile not in new]
+            kept.extend(slices.pop(directory, []))
+            if kept:
+                changed.append(kept)
+            else:
+                emptied.append(directory)
+        changed.extend(slices.values())
+        start, stop = self.G.update(changed, removed=emptied)
+        for directory in emptied:
+            path = os.path.join(
+                self.output, kmlname(root(self.roots, directory), directory))
+            if os.path.exists(path):
+                os.remove(path)
+        written = self.writekml(start, stop)
+        self.log('%d new images, %d removed, %d slices updated%s' %(
+            sum(len(x) for x in fetched), dropped, stop - start, written))
+        return start, stop
+
+    def poll(self, timeout=None):
+        'handle events for up to timeout seconds, processing a batch if due'
+        wait = self.debouncer.timeout()
+        if wait is None or timeout is not None and timeout < wait:
+            wait = timeout
+        for path, mask in self.inotify.read(wait):
+            self.event(path, mask)
+        batch = self.debouncer.take()
+        if batch:
+            return self.process(batch)
+        return None
+
+    def run(self):
+        self.start()
+        while True:
+            self.poll()
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
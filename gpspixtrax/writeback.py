@@ -0,0 +1,251 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Writing the results back: images without a verified fix get the
+# position inferred for them, or, when there is none and strip is asked
+# for, lose the stale GPS position the camera stamped them with.  exiftool
+# keeps the original of each image it changes unless backup is turned
+# off.  Changes go to exiftool as one
+# command per file, so that each file succeeds or fails on its own, but
+# the commands are sent in batches to long-lived -stay_open workers, so
+# there is no exiftool startup per file.  Alternatively, the positions
+# can be written to XMP sidecars without exiftool at all, named for the
+# whole filename, as exiftool's %f.%e.xmp, so that the RAW and JPEG of
+# one shot each keep their own.
+#
+# Every file done is recorded in a journal as a line of JSON, flushed
+# after each batch, and files the journal already has as done are not
+# written again, so an interrupted run can simply be started again.
+# Writing the same change twice does no harm, so a file finished but not
+# yet journaled when the run stopped is only written once more.
+
+import collections
+import json
+import os
+import re
+
+from . import exiftool
+from . import spatialindex
+
+# inferred positions to write, in order of preference
+SOURCES = ('fuzz',)
+
+# stale tags removed along with the camera's position when a new one is
+# written; the speed, track and altitude were all measured elsewhere
+STALE = ('GPSAltitude', 'GPSAltitudeRef', 'GPSSpeed', 'GPSSpeedRef',
+         'GPSTrack', 'GPSTrackRef')
+
+UPDATED = re.compile(r'\b1 image files (updated|unchanged)')
+
+CREATORTOOL = 'gpspixtrax'
+
+XMP = u'''<?xpacket begin='\ufeff' id='W5M0MpCehiHzreSzNTczkc9d'?>
+<x:xmpmeta xmlns:x='adobe:ns:meta/'>
+ <rdf:RDF xmlns:rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#'>
+  <rdf:Description rdf:about=''
+    xmlns:exif='http://ns.adobe.com/exif/1.0/'
+    xmlns:xmp='http://ns.adobe.com/xap/1.0/'>
+   <exif:GPSVersionID>2.2.0.0</exif:GPSVersionID>
+   <exif:GPSLatitude>%s</exif:GPSLatitude>
+   <exif:GPSLongitude>%s</exif:GPSLongitude>
+   <xmp:CreatorTool>%s</xmp:CreatorTool>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end='w'?>
+'''
+
+# lat and lon are None for a position to be removed
+Change = collections.namedtuple('Change', 'file lat lon source')
+
+def changes(imagedata, sources=SOURCES, strip=False):
+    '''list of Change for each image without a verified fix: its inferred
+    position from sources, or if strip, removal of its position'''
+    result = []
+    for slice in imagedata:
+        for image in slice:
+            if image.get('GPSStatus') == 'A':
+                continue
+            found = spatialindex.position(image, sources)
+            if found is not None:
+                lat, lon, source = found
+                result.append(Change(image.SourceFile, lat, lon, source))
+            elif strip and 'GPSLatitude' in image:
+                result.append(Change(image.SourceFile, None, None, None))
+    return result
+
+def exiftoolargs(change, backup=True):
+    'exiftool arguments to make change'
+    args = ['-n']
+    if not backup:
+        args.append('-overwrite_original')
+    if change.lat is None:
+        args.append('-GPS:all=')
+    else:
+        args.extend([
+            '-GPSLatitude=%r' %abs(change.lat),
+            '-GPSLatitudeRef=%s' %('S' if change.lat < 0 else 'N'),
+            '-GPSLongitude=%r' %abs(change.lon),
+            '-GPSLongitudeRef=%s' %('W' if change.lon < 0 else 'E'),
+        ])
+        args.extend('-%s=' %x for x in STALE)
+    args.append(change.file)
+    return args
+
+def xmpcoordinate(value, positive, negative):
+    'XMP GPSCoordinate DDD,MM.mmmmmmmmK for decimal degrees value'
+    # round the minutes first, so that they never come to 60
+    minutes = round(abs(value) * 60, 8)
+    degrees = int(minutes // 60)
+    return '%d,%.8f%s' %(degrees, minutes - degrees * 60,
+                         negative if value < 0 else positive)
+
+def sidecar(path):
+    'sidecar for path, named as exiftool %f.%e.xmp names it'
+    return path + '.xmp'
+
+class Journal(object):
+    'JSON lines of the files written, read again to resume'
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            for line in open(path):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line cut short by a crash
+                    continue
+                if entry['status'] == 'ok':
+                    self.done.add(entry['file'])
+                else:
+                    self.done.discard(entry['file'])
+        # not created until there is something to record
+        self.f = None
+
+    def record(self, change, status, detail=''):
+        if self.f is None:
+            self.f = open(self.path, 'a')
+        self.f.write(json.dumps({'file': change.file, 'status': status,
+                                 'source': change.source,
+                                 'detail': detail.strip()}) + '\n')
+        if status == 'ok':
+            self.done.add(change.file)
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+class WriteBack(object):
+    '''write inferred positions for imagedata to the images or to XMP
+    sidecars, journaling each file in journal, a path, if given'''
+    def __init__(self, imagedata, journal=None, sources=SOURCES, strip=False,
+                 dryrun=False):
+        self.changes = changes(imagedata, sources, strip)
+        self.dryrun = dryrun
+        self.journal = None
+        if journal is not None:
+            self.journal = Journal(journal)
+
+    def pending(self):
+        'changes not already done according to the journal'
+        if self.journal is None:
+            return list(self.changes)
+        return [x for x in self.changes if x.file not in self.journal.done]
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+
+    def record(self, counts, change, status, detail=''):
+        counts[status] = counts.get(status, 0) + 1
+        if self.journal is not None and not self.dryrun:
+            self.journal.record(change, status, detail)
+
+    def write(self, pool=None, workers=None, batchsize=500, backup=True):
+        '''write the pending changes to the images with exiftool, using
+        pool or a pool of workers, leaving exiftool's copy of each original
+        unless not backup; returns dict of counts by status'''
+        pending = self.pending()
+        counts = {'skipped': len(self.changes) - len(pending)}
+        if self.dryrun:
+            for change in pending:
+                self.record(counts, change, 'dryrun')
+            return counts
+        commands = [exiftoolargs(x, backup) for x in pending]
+        ownpool = pool is None
+        if ownpool:
+            pool = exiftool.ExifToolPool(workers=workers, batchsize=batchsize)
+        try:
+            # journaled as each batch finishes, not after the last one
+            changes = iter(pending)
+            for outputs in pool.iterbatches(commands):
+                for output in outputs:
+                    change = next(changes)
+                    if UPDATED.search(output):
+                        self.record(counts, change, 'ok')
+                    else:
+                        self.record(counts, change, 'error', output)
+                if self.journal is not None:
+                    self.journal.flush()
+        finally:
+            if ownpool:
+                pool.close()
+            if self.journal is not None:
+                self.journal.flush()
+        return counts
+
+    def writesidecars(self, overwrite=False):
+        '''write the pending new positions as XMP sidecars, leaving alone
+        sidecars written by other programs unless overwrite; removals
+        cannot be made in a sidecar and are counted as nosidecar'''
+        pending = self.pending()
+        counts = {'skipped': len(self.changes) - len(pending)}
+        for change in pending:
+            if change.lat is None:
+                self.record(counts, change, 'nosidecar')
+                continue
+            path = sidecar(change.file)
+            if not overwrite and os.path.exists(path):
+                if ('<xmp:CreatorTool>%s<' %CREATORTOOL
+                        not in open(path, 'rb').read().decode('utf-8', 'replace')):
+                    self.record(counts, change, 'error',
+                                '%s already exists' %path)
+                    continue
+            if self.dryrun:
+                self.record(counts, change, 'dryrun')
+                continue
+            data = XMP %(xmpcoordinate(change.lat, 'N', 'S'),
+                         xmpcoordinate(change.lon, 'E', 'W'),
+                         CREATORTOOL)
+            # never leave a partial sidecar behind
+            f = open(path + '.tmp', 'wb')
+            try:
+                f.write(data.encode('utf-8'))
+            finally:
+                f.close()
+            os.rename(path + '.tmp', path)
+            self.record(counts, change, 'ok')
+        if self.journal is not None:
+            self.journal.flush()
+        return counts
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+if sys.version_info >= (3, 6):
+    import asyncio
+    from gpspixtrax import aioexiftool
+    from gpspixtrax import ddict
+
+# stands in for exiftool -stay_open: one record per file argument, except
+# that a file named hang never finishes, one named die kills exiftool the
+# first time, one named stall hangs the first time, and one named slow
+# takes half a second
+FAKE = r'''#!%s
+import json, os, sys, time
+args = []
+while True:
+    line = sys.stdin.readline()
+    if not line:
+        break
+    line = line.rstrip('\n')
+    if line.startswith('-execute'):
+        files = [x for x in args if not x.startswith('-')]
+        if 'die' in files and not os.path.exists(%r):
+            open(%r, 'w').close()
+            sys.exit(1)
+        if 'hang' in files:
+            time.sleep(60)
+        if 'stall' in files and not os.path.exists(%r):
+            open(%r, 'w').close()
+            time.sleep(60)
+        if 'slow' in files:
+            time.sleep(0.5)
+        records = [{'SourceFile': x} for x in files if 'missing' not in x]
+        if records:
+            sys.stdout.write(json.dumps(records) + '\n')
+        sys.stdout.write('{ready%%s}\n' %%line[len('-execute'):])
+        sys.stdout.flush()
+        args = []
+    elif line == 'False' and args[-1:] == ['-stay_open']:
+        break
+    else:
+        args.append(line)
+'''
+
+@unittest.skipIf(sys.version_info < (3, 6), 'asyncio driver needs python 3.6')
+class Test_aioexiftool(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.program = os.path.join(self.tmpdir, 'exiftool')
+        died = os.path.join(self.tmpdir, 'died')
+        stalled = os.path.join(self.tmpdir, 'stalled')
+        with open(self.program, 'w') as f:
+            f.write(FAKE %(sys.executable, died, died, stalled, stalled))
+        os.chmod(self.program, 0o755)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        shutil.rmtree(self.tmpdir)
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_worker(self):
+        async def run():
+            w = aioexiftool.AsyncExifToolWorker(self.program)
+            try:
+                self.assertEquals(await w.fetch(['1/a.jpg']),
+                                  [{'SourceFile': '1/a.jpg'}])
+                # no readable files
+                self.assertEquals(await w.fetch(['1/missing.jpg']), [])
+                self.assertEquals(w.sequence, 2)
+            finally:
+                await w.close()
+            self.assertEquals(w.process, None)
+        self.run_async(run())
+
+    def test_pool_iterdata(self):
+        filelist = ['1/a.jpg', '1/b.jpg', '1/missing.jpg', '1/c.jpg',
+                    '2/a.jpg', '2/b.jpg', '3/a.jpg']
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=2, batchsize=2, program=self.program) as pool:
+                return [s async for s in aioexiftool.iterdata(filelist, pool)]
+        i = self.run_async(run())
+        self.assertEquals([[x.SourceFile for x in s] for s in i],
+                          [['1/a.jpg', '1/b.jpg', '1/c.jpg'],
+                           ['2/a.jpg', '2/b.jpg'],
+                           ['3/a.jpg']])
+        self.assertEquals(isinstance(i[0][0], ddict.ddict), True)
+
+    def test_fetchdata_concurrent(self):
+        # many scans share one pool through its bounded queue
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=2, batchsize=3, queuesize=1,
+                    program=self.program) as pool:
+                return await asyncio.gather(*[
+                    aioexiftool.fetchdata(['%d/%d.jpg' %(x, y)
+                                           for y in range(10)], pool)
+                    for x in range(5)])
+        results = self.run_async(run())
+        self.assertEquals([[[x.SourceFile for x in s] for s in i]
+                           for i in results],
+                          [[['%d/%d.jpg' %(x, y) for y in range(10)]]
+                           for x in range(5)])
+
+    def test_submit_waits(self):
+        async def run():
+            pool = aioexiftool.AsyncExifToolPool(
+                workers=1, queuesize=1, program=self.program)
+            # no workers started, so nothing ever takes from the queue
+            pool.queue = asyncio.Queue(pool.queuesize)
+            await pool.submit(['a.jpg'])
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(pool.submit(['b.jpg']), 0.1)
+        self.run_async(run())
+
+    def test_iterfetch_bounded(self):
+        filelist = ['slow'] + ['%d.jpg' %x for x in range(20)]
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=2, batchsize=1, queuesize=2,
+                    program=self.program) as pool:
+                submit = pool.submit
+                futures = []
+                async def counting(batch):
+                    futures.append(await submit(batch))
+                    return futures[-1]
+                pool.submit = counting
+                # submitted before the slow first batch was done
+                early = None
+                async for record in pool.iterfetch(filelist):
+                    if early is None:
+                        early = len(futures)
+                return early
+        self.assertTrue(self.run_async(run()) <= 2)
+
+    def test_timeout_retried(self):
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=1, timeout=0.5, retries=1,
+                    program=self.program) as pool:
+                return await pool.fetch(['stall'])
+        # the first exiftool is killed, the batch served by a second one
+        self.assertEquals(self.run_async(run()), [{'SourceFile': 'stall'}])
+
+    def test_timeout(self):
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=1, timeout=0.5, program=self.program) as pool:
+                # not assertRaises, which would clear the frame of the
+                # worker task waiting in the traceback for its next batch
+                try:
+                    await pool.fetch(['hang'])
+                    self.fail('timeout not raised')
+                except aioexiftool.ExifToolError:
+                    pass
+                # a fresh exiftool serves the next batch
+                return await pool.fetch(['a.jpg'])
+        self.assertEquals(self.run_async(run()), [{'SourceFile': 'a.jpg'}])
+
+    def test_restart(self):
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=1, retries=1, program=self.program) as pool:
+                return await pool.fetch(['die'])
+        # the first exiftool exits, the batch is retried on a second one
+        self.assertEquals(self.run_async(run()), [{'SourceFile': 'die'}])
+
+    def test_restart_gives_up(self):
+        with open(self.program, 'w') as f:
+            f.write('#!%s\nimport sys\nsys.exit(1)\n' %sys.executable)
+        async def run():
+            async with aioexiftool.AsyncExifToolPool(
+                    workers=1, retries=2, program=self.program) as pool:
+                await pool.fetch(['a.jpg'])
+        self.assertRaises(aioexiftool.ExifToolError, self.run_async, run())
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import mock
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from gpspixtrax import cache
+from gpspixtrax import ddict
+from gpspixtrax import exiftool
+
+class Test_MetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.files = []
+        for name in ('a.jpg', 'b.jpg', 'c.jpg'):
+            filename = os.path.join(self.directory, name)
+            open(filename, 'w').write(name)
+            self.files.append(filename)
+        self.cache = cache.MetadataCache(
+            os.path.join(self.directory, 'cache', 'exif.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def fetcher(filelist):
+        return [{'SourceFile': x, 'GPSStatus': 'A'} for x in filelist]
+
+    def test_fetch(self):
+        F = mock.Mock(side_effect=self.fetcher)
+        records = self.cache.fetch(self.files, F)
+        F.assert_called_once_with(self.files)
+        self.assertEquals(records, self.fetcher(self.files))
+        self.assertEquals(self.cache.stats(),
+                          {'entries': 3, 'hits': 0, 'misses': 3})
+
+        F.reset_mock()
+        records = self.cache.fetch(self.files, F)
+        self.assertEquals(F.called, False)
+        self.assertEquals(records, self.fetcher(self.files))
+        self.assertEquals(self.cache.stats(),
+                          {'entries': 3, 'hits': 3, 'misses': 3})
+
+    def test_changed(self):
+        self.cache.fetch(self.files, self.fetcher)
+        open(self.files[1], 'a').write('changed')
+        F = mock.Mock(side_effect=self.fetcher)
+        records = self.cache.fetch(self.files, F)
+        F.assert_called_once_with(self.files[1:2])
+        self.assertEquals([x['SourceFile'] for x in records], self.files)
+
+    def test_unreadable(self):
+        missing = os.path.join(self.directory, 'missing.jpg')
+        F = mock.Mock(return_value=self.fetcher(self.files))
+        records = self.cache.fetch(self.files[0:1] + [missing] + self.files[1:], F)
+        self.assertEquals([x['SourceFile'] for x in records], self.files)
+        self.assertEquals(len(self.cache), 3)
+
+    def test_relative_path(self):
+        self.cache.fetch(self.files, self.fetcher)
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            records = self.cache.fetch(['a.jpg'], None)
+        finally:
+            os.chdir(cwd)
+        self.assertEquals(records, [{'SourceFile': 'a.jpg', 'GPSStatus': 'A'}])
+
+    def test_bare_filename(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            c = cache.MetadataCache('exif.sqlite')
+            c.close()
+        finally:
+            os.chdir(cwd)
+        self.assertEquals(
+            os.path.exists(os.path.join(self.directory, 'exif.sqlite')), True)
+
+    def test_evict(self):
+        self.cache.maxentries = 2
+        self.cache.fetch(self.files[0:1], self.fetcher)
+        self.cache.fetch(self.files[1:], self.fetcher)
+        self.assertEquals(len(self.cache), 2)
+        F = mock.Mock(side_effect=self.fetcher)
+        self.cache.fetch(self.files[1:], F)
+        self.assertEquals(F.called, False)
+
+    def test_invalidate_vacuum(self):
+        self.cache.fetch(self.files, self.fetcher)
+        self.cache.invalidate(self.files[0:1])
+        self.assertEquals(len(self.cache), 2)
+        os.unlink(self.files[1])
+        self.assertEquals(self.cache.vacuum(), 1)
+        self.assertEquals(len(self.cache), 1)
+        self.cache.invalidate()
+        self.assertEquals(len(self.cache), 0)
+
+    def test_kinds(self):
+        self.cache.fetch(self.files, self.fetcher, cache.NATIVE)
+        # records read natively are not served as exiftool's, or evicted
+        # to make room for them
+        F = mock.Mock(side_effect=self.fetcher)
+        self.cache.fetch(self.files, F)
+        F.assert_called_once_with(self.files)
+        self.assertEquals(len(self.cache), 6)
+        F.reset_mock()
+        self.cache.fetch(self.files, F, cache.NATIVE)
+        self.assertEquals(F.called, False)
+
+    def test_old_table(self):
+        self.cache.close()
+        path = os.path.join(self.directory, 'old.sqlite')
+        db = sqlite3.connect(path)
+        db.execute('''CREATE TABLE records (path TEXT PRIMARY KEY,
+                      size INTEGER, mtime INTEGER, inode INTEGER,
+                      used REAL, record TEXT)''')
+        db.execute("INSERT INTO records VALUES ('x', 1, 2, 3, 4, '{}')")
+        db.commit()
+        db.close()
+        self.cache = cache.MetadataCache(path)
+        self.assertEquals(len(self.cache), 0)
+        self.cache.fetch(self.files, self.fetcher)
+        self.assertEquals(len(self.cache), 3)
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fetchdata_native(self, I):
+        directory = os.path.dirname(__file__) + '/data/'
+        images = [directory + 'dsc05521_arw.jpg', directory + 'dsc08142.jpg']
+        exiftool.fetchdata(images, cache=self.cache, native=True)
+        self.assertEquals(I.call_count, 0)
+        I.return_value = json.dumps([{'SourceFile': x,
+                                      'ShotNumberSincePowerUp': 1}
+                                     for x in images])
+        i = exiftool.fetchdata(images, cache=self.cache)
+        # exiftool reads them again rather than getting the short records
+        I.assert_called_once_with(images)
+        self.assertEquals([x.ShotNumberSincePowerUp for x in i[0]], [1, 1])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fetchdata(self, I):
+        I.return_value = '[{"SourceFile": "%s"}]' %self.files[2]
+        self.cache.fetch(self.files[0:2], self.fetcher)
+        i = exiftool.fetchdata(self.files, cache=self.cache)
+        I.assert_called_once_with(self.files[2:])
+        self.assertEquals([x.SourceFile for x in i[0]], self.files)
+        self.assertEquals(isinstance(i[0][0], ddict.ddict), True)
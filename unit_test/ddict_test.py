@@ -15,6 +15,8 @@
 #  limitations under the License.
 #
 
+import copy
+import pickle
 import unittest
 
 from gpspixtrax import ddict
@@ -42,3 +44,11 @@ class Test_ddict(unittest.TestCase):
         d.b = 4
         self.assertEqual(d['b'], 4)
         self.assertEqual(d.b, 4)
+
+    def test_ddict_pickle(self):
+        d = ddict.ddict({'a':1, 'b':[2]})
+        for e in (pickle.loads(pickle.dumps(d, 2)), copy.deepcopy(d)):
+            self.assertEqual(type(e), ddict.ddict)
+            self.assertEqual(e, d)
+            self.assertEqual(e.a, 1)
+        self.assertRaises(AttributeError, lambda: d.__missingmethod__)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from gpspixtrax import discover
+
+class Test_discover(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name in ('20130607/dsc10.jpg', '20130607/dsc9.jpg',
+                     '20130607/DSC100.ARW', '20130607/notes.txt',
+                     '20130607/sub/img2.jpg', '20130607/sub/img10.jpg',
+                     '2013-06-08_2/a.jpg', '2013_06_09/a.jpg',
+                     'misc/p1.jpg', 'empty/'):
+            path = os.path.join(self.tmpdir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            if not name.endswith('/'):
+                open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def relative(self, groups):
+        return [(os.path.relpath(d, self.tmpdir),
+                 [os.path.relpath(x, d) for x in files])
+                for d, files in groups]
+
+    def test_discover(self):
+        groups = discover.discover([self.tmpdir], workers=3)
+        self.assertEqual(self.relative(groups), [
+            ('.', []),
+            ('2013-06-08_2', ['a.jpg']),
+            ('20130607', ['DSC100.ARW', 'dsc9.jpg', 'dsc10.jpg']),
+            ('20130607/sub', ['img2.jpg', 'img10.jpg']),
+            ('2013_06_09', ['a.jpg']),
+            ('empty', []),
+            ('misc', ['p1.jpg']),
+        ])
+        self.assertEqual(discover.filelist(groups)[0:2], [
+            os.path.join(self.tmpdir, '2013-06-08_2', 'a.jpg'),
+            os.path.join(self.tmpdir, '20130607', 'DSC100.ARW')])
+
+    def test_prune(self):
+        groups = discover.discover([self.tmpdir], dates=(
+            datetime.date(2013, 6, 8), None))
+        self.assertEqual([x for x, _ in self.relative(groups)],
+                         ['.', '2013-06-08_2', '2013_06_09', 'empty', 'misc'])
+        groups = discover.discover([self.tmpdir], dates=(
+            None, datetime.date(2013, 6, 8)))
+        self.assertEqual([x for x, _ in self.relative(groups)],
+                         ['.', '2013-06-08_2', '20130607', '20130607/sub',
+                          'empty', 'misc'])
+
+        old = time.time() - 86400
+        for name in ('20130607', 'misc'):
+            os.utime(os.path.join(self.tmpdir, name), (old, old))
+        groups = discover.discover([self.tmpdir], newer=old + 1)
+        self.assertEqual([x for x, _ in self.relative(groups)],
+                         ['.', '2013-06-08_2', '2013_06_09', 'empty'])
+
+    def test_namedate(self):
+        self.assertEqual(discover.namedate('trip-20130607-1'),
+                         datetime.date(2013, 6, 7))
+        self.assertEqual(discover.namedate('2013_06_07'),
+                         datetime.date(2013, 6, 7))
+        self.assertEqual(discover.namedate('20131399'), None)
+        self.assertEqual(discover.namedate('100MSDCF'), None)
+        self.assertEqual(discover.namedate('120130607'), None)
+
+    def test_onerror(self):
+        errors = []
+        missing = os.path.join(self.tmpdir, 'missing')
+        groups = discover.discover([missing, os.path.join(self.tmpdir, 'misc')],
+                                   onerror=errors.append)
+        self.assertEqual(self.relative(groups), [('misc', ['p1.jpg'])])
+        self.assertEqual(len(errors), 1)
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime
+import unittest
+
+from dateutil import parser as dateparser
+from dateutil import tz
+
+from gpspixtrax import exiftime
+
+class Test_TimestampParser(unittest.TestCase):
+    def assertSameAsDateutil(self, P, datestring):
+        expected = dateparser.parse(exiftime.iso8601(datestring))
+        result = P.parse(datestring)
+        self.assertEquals(result, expected)
+        self.assertEquals(result.tzinfo, expected.tzinfo)
+        self.assertEquals(result.utcoffset(), expected.utcoffset())
+
+    def test_fixed_format(self):
+        P = exiftime.TimestampParser()
+        for datestring in ('2013:06:11 17:31:10.577Z',
+                           '2013:06:12 13:49:52Z',
+                           '2013:06:18 06:36:57.463Z',
+                           '2013:06:07 14:50:39.035Z',
+                           '2013:06:12 07:27:01',
+                           '2013:06:12 07:27:01.5',
+                           '2013:06:12 07:27:01.123456'):
+            self.assertSameAsDateutil(P, datestring)
+        self.assertEquals(P.fallbacks, 0)
+        self.assertEquals(P.parse('2013:06:11 17:31:10.577Z'),
+                          datetime(2013, 6, 11, 17, 31, 10, 577000,
+                                   tzinfo=tz.tzutc()))
+        self.assertEquals(P.parse('2013-06-11T17:31:10Z'),
+                          datetime(2013, 6, 11, 17, 31, 10, tzinfo=tz.tzutc()))
+        self.assertEquals(P.parse('2013:06:12 07:27:01').tzinfo, None)
+
+    def test_fallback(self):
+        P = exiftime.TimestampParser()
+        self.assertSameAsDateutil(P, '2013:06:12 07:27:01+02:00')
+        self.assertSameAsDateutil(P, '2013:06:12 07:27')
+        self.assertEquals(P.fallbacks, 2)
+        self.assertRaises(ValueError, P.parse, '0000:00:00 00:00:00')
+        self.assertEquals(P.fallbacks, 3)
+
+    def test_epoch(self):
+        P = exiftime.TimestampParser()
+        self.assertEquals(P.epoch('1970:01:01 00:00:01.5Z'), 1.5)
+        self.assertEquals(P.epoch('2013:06:07 14:50:39Z'), 1370616639)
+        self.assertEquals(P.epoch('2013:06:07 14:50:39'), 1370616639)
+        self.assertEquals(
+            exiftime.epoch(datetime(2013, 6, 7, 16, 50, 39,
+                                    tzinfo=tz.tzoffset(None, 7200))),
+            1370616639)
@@ -18,6 +18,10 @@
 import json
 import mock
 import os
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 import unittest
 
 from gpspixtrax import ddict
@@ -137,3 +141,195 @@ class Test_exiftool(unittest.TestCase):
                         'dsc05521_arw.jpg',
                         'dsc05870_arw.jpg',
                         'dsc08142.jpg')
+
+    @mock.patch('gpspixtrax.exiftool.exiftool')
+    def test_worker(self, E):
+        process = E.popen.return_value
+        process.stdin = StringIO()
+        process.stdout = StringIO(
+            '[{\n  "SourceFile": "1/a.jpg",\n  "GPSStatus": "A"\n}]\n{ready1}\n'
+            '{ready2}\n')
+        process.poll.return_value = None
+        w = exiftool.ExifToolWorker()
+        E.popen.assert_called_once_with(
+            ('-stay_open', 'True', '-@', '-'),
+            stdin=exiftool.subprocess.PIPE, stdout=exiftool.subprocess.PIPE,
+            stderr=None, universal_newlines=True)
+        self.assertEquals(w.fetch(['1/a.jpg']),
+                          [{'SourceFile': '1/a.jpg', 'GPSStatus': 'A'}])
+        self.assertEquals(process.stdin.getvalue(),
+            '\n'.join(('-n', '-j') + exiftool.TAGS + ('1/a.jpg', '-execute1', '')))
+        # no readable files
+        self.assertEquals(w.fetch(['1/missing.jpg']), [])
+        process.stdin = mock.Mock()
+        w.close()
+        process.stdin.write.assert_called_once_with('-stay_open\nFalse\n')
+        process.stdin.close.assert_called_once_with()
+        process.wait.assert_called_once_with()
+
+    @mock.patch('gpspixtrax.exiftool.exiftool')
+    def test_worker_executemany(self, E):
+        process = E.popen.return_value
+        process.stdin = StringIO()
+        process.stdout = StringIO(
+            '    1 image files updated\n{ready1}\n{ready2}\n'
+            '    1 image files updated\n{ready3}\n')
+        w = exiftool.ExifToolWorker()
+        self.assertEquals(w.executemany([('-GPS:all=', 'a.jpg'),
+                                         ('-ver',),
+                                         ('-GPS:all=', 'b.jpg')]),
+                          ['    1 image files updated\n', '',
+                           '    1 image files updated\n'])
+        # sent all together before any output is read
+        self.assertEquals(process.stdin.getvalue(),
+            '-GPS:all=\na.jpg\n-execute1\n-ver\n-execute2\n'
+            '-GPS:all=\nb.jpg\n-execute3\n')
+
+    @mock.patch('gpspixtrax.exiftool.ExifToolWorker')
+    def test_pool_iterexecute(self, W):
+        W.return_value.executemany.side_effect = lambda commands: [
+            x[-1] for x in commands]
+        commands = [('-ver', str(x)) for x in range(11)]
+        with exiftool.ExifToolPool(workers=2, batchsize=3) as pool:
+            self.assertEquals(list(pool.iterexecute(commands)),
+                              [str(x) for x in range(11)])
+            self.assertEquals([len(x) for x in pool.iterbatches(commands)],
+                              [3, 3, 3, 2])
+        self.assertEquals(max(len(x[0][0]) for x in
+                              W.return_value.executemany.call_args_list), 3)
+
+    @mock.patch('gpspixtrax.exiftool.exiftool')
+    def test_worker_died(self, E):
+        process = E.popen.return_value
+        process.stdin = StringIO()
+        process.stdout = StringIO('[{\n')
+        w = exiftool.ExifToolWorker()
+        self.assertRaises(exiftool.ExifToolError, w.fetch, ['1/a.jpg'])
+
+    def test_pool_batches(self):
+        pool = exiftool.ExifToolPool(workers=4, batchsize=3)
+        try:
+            self.assertEquals(pool.batches([]), [])
+            self.assertEquals(pool.batches('ab'), [['a'], ['b']])
+            self.assertEquals(pool.batches('abcdefg'),
+                              [['a', 'b'], ['c', 'd'], ['e', 'f'], ['g']])
+            self.assertEquals([len(x) for x in pool.batches(range(20))],
+                              [3, 3, 3, 3, 3, 3, 2])
+        finally:
+            pool.close()
+
+    @mock.patch('gpspixtrax.exiftool.ExifToolWorker')
+    def test_fetchdata_pool(self, W):
+        W.return_value.fetch.side_effect = lambda batch: [
+            {'SourceFile': x} for x in batch if 'missing' not in x]
+        filelist = ['1/a.jpg', '1/b.jpg', '1/missing.jpg', '1/c.jpg',
+                    '2/a.jpg', '2/b.jpg', '3/a.jpg']
+        with exiftool.ExifToolPool(workers=3, batchsize=2) as pool:
+            i = exiftool.fetchdata(filelist, pool=pool)
+        self.assertEquals([[x.SourceFile for x in s] for s in i],
+                          [['1/a.jpg', '1/b.jpg', '1/c.jpg'],
+                           ['2/a.jpg', '2/b.jpg'],
+                           ['3/a.jpg']])
+        self.assertEquals(isinstance(i[0][0], ddict.ddict), True)
+        self.assertEquals(W.return_value.close.call_count, W.call_count)
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fetchdata_unsorted(self, I):
+        I.return_value = json.dumps([{'SourceFile': x} for x in
+            ('2/a.jpg', '1/b.jpg', '2/b.jpg', '1/a.jpg', '3/a.jpg')])
+        i = exiftool.fetchdata(mock.Mock())
+        # one slice per directory, whatever order the files came in
+        self.assertEquals([[x.SourceFile for x in s] for s in i],
+                          [['2/a.jpg', '2/b.jpg'], ['1/b.jpg', '1/a.jpg'],
+                           ['3/a.jpg']])
+
+    @mock.patch('gpspixtrax.exiftool.jpegexif.readexif')
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fetchdata_native(self, I, R):
+        R.side_effect = lambda x, tags: (
+            None if 'arw' in x else {'SourceFile': x, 'GPSStatus': 'A'})
+        I.return_value = '''[{"SourceFile": "1/b_arw.jpg", "GPSStatus": "V"},
+                             {"SourceFile": "2/a_arw.jpg", "GPSStatus": "V"}]'''
+        i = exiftool.fetchdata(['1/a.jpg', '1/b_arw.jpg', '1/missing_arw.jpg',
+                                '1/c.jpg', '2/a_arw.jpg'], native=True)
+        I.assert_called_once_with(['1/b_arw.jpg', '1/missing_arw.jpg',
+                                   '2/a_arw.jpg'])
+        self.assertEquals([[(x.SourceFile, x.GPSStatus) for x in s] for s in i],
+                          [[('1/a.jpg', 'A'), ('1/b_arw.jpg', 'V'),
+                            ('1/c.jpg', 'A')],
+                           [('2/a_arw.jpg', 'V')]])
+        R.assert_any_call('1/a.jpg', exiftool.NATIVETAGS)
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fetchdata_native_files(self, I):
+        directory = os.path.dirname(__file__) + '/data/'
+        i = exiftool.fetchdata([directory + 'dsc05521_arw.jpg',
+                                directory + 'dsc05870_arw.jpg',
+                                directory + 'dsc08142.jpg'], native=True)
+        # all three read without exiftool
+        self.assertEquals(I.call_count, 0)
+        self.assertEquals([[(x.GPSStatus, x.GPSAltitude) for x in s]
+                           for s in i],
+                          [[('V', 11.4), ('V', -0.6), ('A', 93.9)]])
+        self.assertEquals(i[0][2].DateTimeOriginal, '2013:06:18 08:37:01')
+
+    def test_iterjson(self):
+        pretty = StringIO(
+            '[{\n  "SourceFile": "1/a.jpg",\n  "GPSStatus": "A"\n},\n'
+            '{\n  "SourceFile": "1/b}.jpg",\n  "GPSStatus": "V"\n}]\n')
+        self.assertEquals(list(exiftool.iterjson(pretty)),
+                          [{'SourceFile': '1/a.jpg', 'GPSStatus': 'A'},
+                           {'SourceFile': '1/b}.jpg', 'GPSStatus': 'V'}])
+        compact = StringIO('[{"a": 1},{"b": 2}]')
+        self.assertEquals(list(exiftool.iterjson(compact)), [{'a': 1}, {'b': 2}])
+        self.assertEquals(list(exiftool.iterjson(StringIO(''))), [])
+        truncated = StringIO('[{\n  "a": 1\n},\n{\n  "b": 2\n')
+        self.assertRaises(exiftool.ExifToolError, list,
+                          exiftool.iterjson(truncated))
+
+    @mock.patch('gpspixtrax.exiftool.exiftool')
+    def test_iterdata(self, E):
+        lines = [
+            '[{\n', '  "SourceFile": "1/a.jpg"\n', '},\n',
+            '{\n', '  "SourceFile": "1/b.jpg"\n', '},\n',
+            '{\n', '  "SourceFile": "2/a.jpg"\n', '},\n',
+            '{\n', '  "SourceFile": "3/a.jpg"\n', '}]\n',
+        ]
+        process = E.popen.return_value
+        process.stdout.readline.side_effect = lines + ['']
+        slices = exiftool.iterdata(['1/a.jpg', '1/b.jpg', '2/a.jpg', '3/a.jpg'])
+        first = next(slices)
+        self.assertEquals([x.SourceFile for x in first], ['1/a.jpg', '1/b.jpg'])
+        self.assertEquals(isinstance(first[0], ddict.ddict), True)
+        # first slice produced before the rest of the output was read
+        self.assertEquals(process.stdout.readline.call_count, 9)
+        self.assertEquals([[x.SourceFile for x in s] for s in slices],
+                          [['2/a.jpg'], ['3/a.jpg']])
+        E.popen.assert_called_once_with(
+            ('-n', '-j') + exiftool.TAGS +
+            ('1/a.jpg', '1/b.jpg', '2/a.jpg', '3/a.jpg'),
+            stdout=exiftool.subprocess.PIPE, stderr=None,
+            universal_newlines=True)
+        process.wait.assert_called_once_with()
+
+    @mock.patch('gpspixtrax.exiftool.ExifToolWorker')
+    def test_iterdata_pool(self, W):
+        W.return_value.fetch.side_effect = lambda batch: [
+            {'SourceFile': x} for x in batch]
+        filelist = ['%d/%d.jpg' %(x // 5, x) for x in range(23)]
+        with exiftool.ExifToolPool(workers=2, batchsize=3) as pool:
+            slices = list(exiftool.iterdata(filelist, pool=pool))
+        self.assertEquals([[x.SourceFile for x in s] for s in slices],
+                          [filelist[i:i+5] for i in range(0, 23, 5)])
+
+    @mock.patch('gpspixtrax.exiftool.fetchrecords')
+    def test_iterrecords_chunks(self, F):
+        F.side_effect = lambda x, pool, native: [{'SourceFile': y} for y in x]
+        records = exiftool.iterrecords(
+            ['1/%d.jpg' %x for x in range(5)], native=True, chunksize=2)
+        self.assertEquals([x['SourceFile'] for x in records],
+                          ['1/%d.jpg' %x for x in range(5)])
+        self.assertEquals(F.call_args_list,
+                          [mock.call(['1/0.jpg', '1/1.jpg'], None, True),
+                           mock.call(['1/2.jpg', '1/3.jpg'], None, True),
+                           mock.call(['1/4.jpg'], None, True)])
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime, timedelta
+import mock
+import unittest
+
+from gpspixtrax import ddict
+from gpspixtrax import exiftime
+from gpspixtrax import exiftool
+from gpspixtrax import fixindex
+from gpspixtrax import gpspixtrax
+
+import fixtures
+
+START = datetime(2013, 6, 18, 9, tzinfo=exiftime.UTC)
+
+def image(seconds, status='A'):
+    return ddict.ddict(gpstime=START + timedelta(seconds=seconds),
+                       GPSStatus=status)
+
+class Test_fixindex(unittest.TestCase):
+    def test_queries(self):
+        images = [image(10), image(20, 'V'), image(30), image(30), image(50)]
+        # slices out of time order
+        F = fixindex.FixIndex([images[2:], images[0:2]])
+        self.assertEqual(len(F), 4)
+        t = exiftime.epoch(START)
+        self.assertEqual(F.before(t + 9), None)
+        self.assertTrue(F.before(t + 10) is images[0])
+        self.assertTrue(F.before(START + timedelta(seconds=29)) is images[0])
+        self.assertTrue(F.before(t + 30) is images[3])
+        self.assertTrue(F.after(t + 11) is images[2])
+        self.assertTrue(F.after(t + 30) is images[2])
+        self.assertEqual(F.after(t + 51), None)
+        self.assertEqual(F.bracket(t + 20), (images[0], images[2]))
+        self.assertEqual(F.bracket(t + 60), (images[4], None))
+        bracket = F.bracket(t + 30)
+        self.assertTrue(bracket[0] is images[2] and bracket[1] is images[3])
+        self.assertTrue(F.nearest(t) is images[0])
+        self.assertTrue(F.nearest(t + 20) is images[0])
+        self.assertTrue(F.nearest(t + 21) is images[2])
+        self.assertTrue(F.nearest(t + 100) is images[4])
+        self.assertEqual(F.window(t + 10, t + 30),
+                         [images[0], images[2], images[3]])
+        self.assertEqual(F.window(t + 31, t + 49), [])
+
+    def test_empty(self):
+        F = fixindex.FixIndex([[image(10, 'V')], []])
+        self.assertEqual(len(F), 0)
+        self.assertEqual(F.nearest(START), None)
+        self.assertEqual(F.bracket(START), (None, None))
+        self.assertEqual(F.window(0, 1e10), [])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_fixindex(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        G = gpspixtrax.GPSPixTrax(imagedata)
+        G.parse()
+        F = G.fixindex()
+        fixes = [x for slice in imagedata for x in slice
+                 if x.GPSStatus == 'A']
+        self.assertEqual(len(F), len(fixes))
+        for x in imagedata[3]:
+            t = exiftime.epoch(x.gpstime)
+            earlier = [y for y in fixes if exiftime.epoch(y.gpstime) <= t]
+            expected = max(earlier, key=lambda y: y.gpstime) if earlier else None
+            found = F.before(x.gpstime)
+            self.assertEqual(found and found.gpstime,
+                             expected and expected.gpstime)
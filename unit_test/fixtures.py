@@ -0,0 +1,44 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+# Test data, decompressed in-process rather than by running xz for every
+# test that needs it.
+
+import os
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        # python 2 without backports.lzma
+        lzma = None
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def read(name):
+    'contents of the xz-compressed file name in unit_test/data as text'
+    path = os.path.join(directory, name)
+    if lzma is None:
+        from plumbum.cmd import xz
+        return xz('-d', '-c', path)
+    f = lzma.open(path)
+    try:
+        return f.read().decode('utf-8')
+    finally:
+        f.close()
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import unittest
+
+from gpspixtrax import geodesy
+
+class Test_geodesy(unittest.TestCase):
+    lats = [55.6788497222222 + x * 0.001 for x in range(40)]
+    lons = [12.5798347222222 - x * 0.0007 for x in range(40)]
+    lats2 = [70.0833613888889 - x * 0.01 for x in range(40)]
+    lons2 = [16.0796983333333 + x * 0.02 for x in range(40)]
+
+    def assertListsAlmostEqual(self, first, second):
+        self.assertEquals(len(first), len(second))
+        for x, y in zip(first, second):
+            self.assertAlmostEqual(x, y, places=9)
+
+    def check_batch(self):
+        self.assertListsAlmostEqual(
+            geodesy.haversines(self.lats, self.lons, self.lats2, self.lons2),
+            [geodesy.haversine(*x) for x in
+             zip(self.lats, self.lons, self.lats2, self.lons2)])
+        self.assertListsAlmostEqual(
+            geodesy.bearings(self.lats, self.lons, self.lats2, self.lons2),
+            [geodesy.bearing(*x) for x in
+             zip(self.lats, self.lons, self.lats2, self.lons2)])
+        distances = [x * 0.5 for x in range(40)]
+        points = [geodesy.project(self.lats[0], self.lons[0], 1.2, x)
+                  for x in distances]
+        lats, lons = geodesy.projects(self.lats[0], self.lons[0], 1.2, distances)
+        self.assertListsAlmostEqual(lats, [x[0] for x in points])
+        self.assertListsAlmostEqual(lons, [x[1] for x in points])
+        seconds = [x % 3 * 10 for x in range(40)]
+        speeds = geodesy.speeds(distances, seconds)
+        self.assertListsAlmostEqual(
+            speeds, [s and abs(d / (s / 3600.0)) for d, s in zip(distances, seconds)])
+        self.assertEquals(type(speeds[0]), int)
+        self.assertEquals(type(speeds[1]), float)
+        self.assertEquals(type(speeds[3]), int)
+
+    def test_batch_numpy(self):
+        self.check_batch()
+
+    @mock.patch('gpspixtrax.geodesy.numpy', None)
+    def test_batch_python(self):
+        self.check_batch()
+
+    @mock.patch('gpspixtrax.geodesy.numpy', None)
+    def test_fallback_exact(self):
+        # without numpy the batch results are the scalar results
+        self.assertEquals(
+            geodesy.haversines(self.lats, self.lons, self.lats2, self.lons2),
+            [geodesy.haversine(*x) for x in
+             zip(self.lats, self.lons, self.lats2, self.lons2)])
+
+    def test_scalars(self):
+        self.assertEquals(geodesy.haversines(1.0, 2.0, 1.0, 2.0), [0.0])
+        self.assertEquals(geodesy.bearings(0.0, 0.0, 1.0, 0.0), [0.0])
+        self.assertEquals(geodesy.projects(0.0, 0.0, 0.0, 0.0), ([0.0], [0.0]))
+        self.assertEquals(geodesy.haversines([], [], 1.0, 2.0), [])
+        self.assertEquals(geodesy.projects(1.0, 2.0, 0.0, []), ([], []))
+        self.assertRaises(ValueError, geodesy.haversines, [1.0], [1.0, 2.0], 0, 0)
+
+    def test_known(self):
+        # one degree of latitude on this sphere
+        self.assertAlmostEqual(geodesy.haversine(0, 0, 1, 0), 111.19492664, places=6)
+        self.assertAlmostEqual(geodesy.bearing(0, 0, 0, 1), 90.0)
@@ -15,15 +15,16 @@
 #  limitations under the License.
 #
 
+import functools
 import mock
 import os
 import unittest
 
-from plumbum.cmd import xz
-
 from gpspixtrax import exiftool
 from gpspixtrax import gpspixtrax
 
+import fixtures
+
 class Test_gpspixtrax(unittest.TestCase):
     def assertNoHalfHourTimezone(self, imagedata):
         for slice in imagedata:
@@ -33,9 +34,7 @@ class Test_gpspixtrax(unittest.TestCase):
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_process(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/selectdata.json.xz')
+        I.return_value = fixtures.read('selectdata.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         # 12 subdirectories for 12 days
@@ -51,105 +50,116 @@ class Test_gpspixtrax(unittest.TestCase):
             for tag in ('gpstime', 'localtime', 'pseudolocaltime'):
                 self.assertEqual(set(tag in i for i in slice), set((True,)))
             for tag in ('tzoffset', 'tzseconds'):
-                self.assertEqual(
-                    set(tag in i for i in slice if i.GPSStatus == 'A'),
-                    set((True,)))
-                self.assertEqual(
-                    set(tag in i for i in slice if i.GPSStatus == 'V'),
-                    set((False,)))
+                self.assertEqual(set(tag in i for i in slice), set((False,)))
+        # every timestamp had the fixed EXIF format
+        self.assertEqual(G.timeparser.fallbacks, 0)
 
         G.sortslices()
         for slice in imagedata:
             filenames = [os.path.basename(x.SourceFile) for x in slice]
             self.assertEquals(filenames, sorted(filenames))
 
+        G.offsets()
+        for slice in imagedata:
+            for tag in ('tzoffset', 'tzseconds', 'tzconfidence', 'gpsStampAge'):
+                self.assertEqual(set(tag in i for i in slice), set((True,)))
+        # the clock was reset once, from UTC+5 to UTC-2
+        self.assertEqual(set(x.tzoffset for x in imagedata[0]), set((5,)))
+        self.assertEqual(set(x.tzoffset for x in imagedata[1]), set((-2,)))
+        self.assertEqual(set(x.tzconfidence for x in imagedata[3]
+                             if x.GPSStatus == 'A'), set((1.0,)))
+
         G.pass2()
         G.pass3()
         self.assertNoHalfHourTimezone(imagedata)
 
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_sort_key(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        G = gpspixtrax.GPSPixTrax(imagedata)
+        G.parsetime()
+        expected = [sorted(x, key=functools.cmp_to_key(G.imagecmp))
+                    for x in imagedata]
+        G.sortslices()
+        self.assertEqual([[x.SourceFile for x in s] for s in imagedata],
+                         [[x.SourceFile for x in s] for s in expected])
+
+    @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.imagekey')
+    def test_sort_already_sorted(self, K):
+        K.side_effect = lambda x: x
+        imagedata = [mock.MagicMock(), mock.MagicMock()]
+        imagedata[0].__iter__.return_value = iter([2, 1])
+        imagedata[1].__iter__.return_value = iter([1, 2])
+        G = gpspixtrax.GPSPixTrax(imagedata)
+        G.sortslices()
+        imagedata[0].reorder.assert_called_once_with([1, 0])
+        self.assertEqual(imagedata[1].reorder.called, False)
+        # lists are reordered by the keys already made, each made once
+        K.reset_mock()
+        imagedata = [[2, 3, 1], [1, 2]]
+        gpspixtrax.GPSPixTrax(imagedata).sortslices()
+        self.assertEqual(imagedata, [[1, 2, 3], [1, 2]])
+        self.assertEqual(K.call_count, 5)
+
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_end_inactive(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/initialoffset.json.xz')
+        I.return_value = fixtures.read('initialoffset.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         G = gpspixtrax.GPSPixTrax(imagedata)
         G.parsetime()
-        for tag in ('tzoffset', 'tzseconds'):
-            # one has tz info, the others do not
-            self.assertEqual(set(tag in i for i in imagedata[0]),
-                             set((False, True)))
         G.sortslices()
-        G.pass2()
+        G.offsets()
         for tag in ('tzoffset', 'tzseconds'):
             # tz info has been copied from the one known good image
             self.assertEqual(set(tag in i for i in imagedata[0]), set((True,)))
+        fix = [x for x in imagedata[0] if x.GPSStatus == 'A'][0]
+        for image in imagedata[0]:
+            self.assertEqual(image.tzseconds, fix.tzseconds)
+            # less sure the further from the fix by the camera clock
+            self.assertTrue(0 < image.tzconfidence <= fix.tzconfidence)
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_no_active(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/nooffset.json.xz')
+        I.return_value = fixtures.read('nooffset.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         G = gpspixtrax.GPSPixTrax(imagedata)
         G.parsetime()
-        for tag in ('tzoffset', 'tzseconds'):
-            # no valid GPS stamps, so nothing to trust yet
-            self.assertEqual(set(tag in i for i in imagedata[0]), set((False,)))
         G.sortslices()
-        G.pass2()
-        for tag in ('tzoffset', 'tzseconds'):
-            # no valid GPS stamps to copy, so nothing to trust yet
-            self.assertEqual(set(tag in i for i in imagedata[0]), set((False,)))
-        G.pass3()
+        G.offsets()
         for tag in ('tzoffset', 'tzseconds', 'gpsStampAge'):
-            # now that we know no valid GPS stamps nearby, just guess
+            # no valid GPS stamps in the trip, so just guess
             self.assertEqual(set(tag in i for i in imagedata[0]), set((True,)))
+        # guesses are never more than half sure
+        self.assertTrue(max(x.tzconfidence for x in imagedata[0]) <= 0.5)
         self.assertNoHalfHourTimezone(imagedata)
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_too_far_apart(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/farapart.json.xz')
+        I.return_value = fixtures.read('farapart.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         G = gpspixtrax.GPSPixTrax(imagedata)
         G.parsetime()
-        for tag in ('tzoffset', 'tzseconds'):
-            # one has tz info, the others do not
-            self.assertEqual(set(tag in i for i in imagedata[0]),
-                             set((False, True)))
         G.sortslices()
-        G.pass2()
+        G.offsets()
         for tag in ('tzoffset', 'tzseconds'):
-            # GPS stamp too far away to trust
-            self.assertEqual(set(tag in i for i in imagedata[0]),
-                             set((False, True)))
-        G.pass3()
-        for tag in ('tzoffset', 'tzseconds'):
-            # localtime and gps time close enough together to guess
             self.assertEqual(set(tag in i for i in imagedata[0]), set((True,)))
+        # GPS stamp too far away to be sure of
+        self.assertTrue(min(x.tzconfidence for x in imagedata[0]) < 0.5)
         self.assertNoHalfHourTimezone(imagedata)
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_disjoint_clocks(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/disjointclockinvalid.json.xz')
+        I.return_value = fixtures.read('disjointclockinvalid.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         G = gpspixtrax.GPSPixTrax(imagedata)
         G.parsetime()
-        for tag in ('tzoffset', 'tzseconds'):
-            self.assertEqual(tag in imagedata[0][0], False)
         G.sortslices()
-        G.pass2()
-        for tag in ('tzoffset', 'tzseconds'):
-            self.assertEqual(tag in imagedata[0][0], False)
-        G.pass3()
+        G.offsets()
         for tag in ('tzoffset', 'tzseconds', 'gpsStampAge'):
             # localtime and gps time not close enough together to guess
             self.assertEqual(tag in imagedata[0][0], False)
@@ -157,9 +167,7 @@ class Test_gpspixtrax(unittest.TestCase):
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_parse_too_far_apart(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/farapart.json.xz')
+        I.return_value = fixtures.read('farapart.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         # hack the data to have the same timestamp but incomparable filenames that would
@@ -179,13 +187,55 @@ class Test_gpspixtrax(unittest.TestCase):
 
     @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.parsetime')
     @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.sortslices')
+    @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.offsets')
     @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.pass2')
     @mock.patch('gpspixtrax.gpspixtrax.GPSPixTrax.pass3')
-    def test_parse(self, P3, P2, S, T):
+    def test_parse(self, P3, P2, O, S, T):
         imagedata = mock.Mock()
         G = gpspixtrax.GPSPixTrax(imagedata)
         G.parse()
         T.assert_called_once_with()
         S.assert_called_once_with()
+        O.assert_called_once_with()
         P2.assert_called_once_with()
         P3.assert_called_once_with()
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def fetch(self, name, I):
+        I.return_value = fixtures.read(name)
+        return exiftool.fetchdata(mock.Mock())
+
+    def test_update(self):
+        for name in ('selectdata.json.xz', 'farapart.json.xz',
+                     'disjointclockinvalid.json.xz'):
+            full = self.fetch(name)
+            gpspixtrax.GPSPixTrax(full).parse()
+            n = len(full)
+            # start with every other slice, then add the rest out of order
+            raw = self.fetch(name)
+            G = gpspixtrax.GPSPixTrax(raw[0::2])
+            G.parse()
+            for images in reversed(raw[1::2]):
+                start, stop = G.update([images])
+                self.assertTrue(stop - start <= 3)
+            self.assertEqual(G.imagedata, full)
+            # replacing a slice with the same images changes nothing
+            self.assertEqual(G.update([self.fetch(name)[n // 2]]),
+                             (max(0, n // 2 - 1), n // 2 + 1))
+            self.assertEqual(G.imagedata, full)
+            self.assertEqual(G.update([]), (0, 0))
+
+    def test_update_removed(self):
+        data = self.fetch('selectdata.json.xz')
+        directory = os.path.dirname(data[4][0].SourceFile)
+        G = gpspixtrax.GPSPixTrax(data)
+        G.parse()
+        # a changed slice from the middle of the archive
+        changed = self.fetch('selectdata.json.xz')[7][0:-20]
+        # from the slice that followed the removed one to the changed one
+        self.assertEqual(G.update([changed], removed=[directory]), (4, 7))
+        expected = self.fetch('selectdata.json.xz')
+        del expected[4]
+        expected[6] = expected[6][0:-20]
+        gpspixtrax.GPSPixTrax(expected).parse()
+        self.assertEqual(G.imagedata, expected)
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime, timedelta
+import json
+import mock
+import unittest
+
+from dateutil import tz
+from lxml import etree
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import imagetable
+from gpspixtrax import kml
+
+import fixtures
+
+class Test_ImageTable(unittest.TestCase):
+    records = [
+        {'SourceFile': '1/a.jpg', 'GPSStatus': 'A', 'GPSAltitude': 85},
+        {'SourceFile': '1/b.jpg', 'GPSStatus': 'V', 'GPSAltitude': -0.6},
+        {'SourceFile': '2/a.jpg', 'GPSStatus': 'V'},
+    ]
+
+    def test_slices(self):
+        T = imagetable.ImageTable.fromrecords(self.records)
+        self.assertEquals(len(T), 3)
+        self.assertEquals([len(x) for x in T.slices], [2, 1])
+        self.assertEquals(T.todata(), [self.records[0:2], self.records[2:]])
+        self.assertEquals(
+            imagetable.ImageTable.fromslices(T.todata()).todata(), T.todata())
+        self.assertEquals(imagetable.ImageTable.fromrecords([]).slices, [])
+
+    def test_row(self):
+        T = imagetable.ImageTable.fromrecords(self.records)
+        image = T.slices[0][1]
+        self.assertEquals(image.GPSAltitude, -0.6)
+        self.assertEquals(image['GPSStatus'], 'V')
+        self.assertEquals(image, self.records[1])
+        self.assertEquals('GPSAltitude' in T.slices[1][0], False)
+        self.assertRaises(KeyError, lambda: T.slices[1][0].GPSAltitude)
+        self.assertRaises(KeyError, lambda: image.b)
+        def assign():
+            image.b = 4
+        self.assertRaises(KeyError, assign)
+        image['b'] = 3
+        self.assertEquals(image.b, 3)
+        image.b = 4
+        self.assertEquals(T.slices[0][1]['b'], 4)
+        self.assertEquals('b' in T.slices[0][0], False)
+        self.assertEquals(image.get('c', 5), 5)
+        del image['b']
+        self.assertEquals('b' in image, False)
+
+    def test_types(self):
+        T = imagetable.ImageTable.fromrecords(self.records)
+        image = T.slices[0][0]
+        self.assertEquals(T.columns['GPSAltitude'].kind, imagetable.NUMBER)
+        self.assertEquals(type(image.GPSAltitude), int)
+        self.assertEquals(type(T.slices[0][1].GPSAltitude), float)
+        now = datetime(2013, 6, 7, 14, 50, 39, 35000, tzinfo=tz.tzutc())
+        image['gpstime'] = now
+        image['localtime'] = now.replace(tzinfo=None)
+        image['durationGPS'] = timedelta(-1, 3, 4)
+        self.assertEquals(T.columns['gpstime'].kind, imagetable.DATETIME)
+        self.assertEquals(T.columns['durationGPS'].kind, imagetable.TIMEDELTA)
+        self.assertEquals(image.gpstime, now)
+        self.assertEquals(image.gpstime.tzinfo, tz.tzutc())
+        self.assertEquals(image.localtime.tzinfo, None)
+        self.assertEquals(image.durationGPS, timedelta(-1, 3, 4))
+        # mixed values fall back to a plain list column
+        T.slices[0][1]['gpstime'] = 'unknown'
+        self.assertEquals(T.columns['gpstime'].kind, imagetable.OBJECT)
+        self.assertEquals(image.gpstime, now)
+        self.assertEquals(T.slices[0][1].gpstime, 'unknown')
+
+    def test_sort(self):
+        T = imagetable.ImageTable.fromrecords(
+            [{'SourceFile': '1/%s.jpg' %x, 'n': x} for x in (3, 1, 2)])
+        images = T.slices[0]
+        images.sort(key=lambda x: x.n)
+        self.assertEquals([x.n for x in images], [1, 2, 3])
+        images.sort(cmp=lambda x, y: y.n - x.n)
+        self.assertEquals([x.SourceFile for x in images],
+                          ['1/3.jpg', '1/2.jpg', '1/1.jpg'])
+        self.assertEquals(images[-1].n, 1)
+        self.assertRaises(IndexError, lambda: images[3])
+        images.reorder([1, 2, 0])
+        self.assertEquals([x.n for x in images], [2, 1, 3])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_parse(self, I):
+        for name in ('selectdata', 'farapart', 'initialoffset', 'nooffset',
+                     'disjointclockinvalid', 'alldata'):
+            I.return_value = fixtures.read(name + '.json.xz')
+            imagedata = exiftool.fetchdata(mock.Mock())
+            T = imagetable.ImageTable.fromrecords(json.loads(I.return_value))
+            gpspixtrax.GPSPixTrax(imagedata).parse()
+            gpspixtrax.GPSPixTrax(T.slices).parse()
+            self.assertEquals(T.todata(), imagedata, name)
+            for images, rows in zip(imagedata, T.slices):
+                self.assertEquals(
+                    etree.tostring(kml.KMLPaths(rows).KMLPaths('foo')),
+                    etree.tostring(kml.KMLPaths(images).KMLPaths('foo')))
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_update(self, I):
+        for name in ('selectdata', 'farapart', 'disjointclockinvalid'):
+            I.return_value = fixtures.read(name + '.json.xz')
+            full = exiftool.fetchdata(mock.Mock())
+            gpspixtrax.GPSPixTrax(full).parse()
+            records = json.loads(I.return_value)
+            raw = imagetable.ImageTable.fromrecords(records).slices
+            # rows are made afresh on each access, so slices are found
+            # by position rather than by the identity of their rows
+            G = gpspixtrax.GPSPixTrax(raw[0::2])
+            G.parse()
+            for images in reversed(raw[1::2]):
+                G.update([images])
+            self.assertEquals([list(x) for x in G.imagedata], full, name)
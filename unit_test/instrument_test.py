@@ -0,0 +1,93 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import mock
+import unittest
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import instrument
+
+import fixtures
+
+class Test_instrument(unittest.TestCase):
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def fetch(self, name, I):
+        I.return_value = fixtures.read(name)
+        return exiftool.fetchdata(mock.Mock())
+
+    def test_parse(self):
+        stats = instrument.Stats(profile=True, trace=True)
+        with stats.stage('exiftool') as stage:
+            imagedata = self.fetch('selectdata.json.xz')
+            stage['items'] = sum(len(x) for x in imagedata)
+        gpspixtrax.GPSPixTrax(imagedata, stats=stats).parse()
+        plain = self.fetch('selectdata.json.xz')
+        gpspixtrax.GPSPixTrax(plain).parse()
+        # counting changes nothing
+        self.assertEqual(imagedata, plain)
+
+        self.assertEqual(list(stats.stages.keys()),
+                         ['exiftool', 'parsetime', 'sortslices', 'offsets',
+                          'pass2', 'pass3'])
+        for name, record in stats.stages.items():
+            self.assertEqual(record['items'], 3654)
+            self.assertTrue(record['seconds'] >= 0)
+            self.assertTrue(record['cpu'] >= 0)
+            self.assertTrue(record['profile'])
+            if instrument.tracemalloc is not None:
+                self.assertTrue(record['peak'] >= 0)
+        self.assertEqual(sorted(stats.profiles.keys()),
+                         sorted(stats.stages.keys()))
+
+        images = [x for y in plain for x in y]
+        interpolated = [x for x in images if 'fuzzlat' in x]
+        counters = stats.counters
+        self.assertEqual(counters['interpolated'], len(interpolated))
+        self.assertTrue(0 < counters['longestMissingGPS'] <= len(interpolated))
+        self.assertEqual(counters['timestampFallbacks'], 0)
+        self.assertEqual(counters['offsetSegments'], 2)
+        self.assertEqual(counters['unsolvedOffsets'], 0)
+        self.assertEqual(counters['guessedOffsets'], 0)
+        self.assertEqual(counters['votedOffsets'],
+                         len([x for x in images if x.GPSStatus == 'A']))
+        self.assertEqual(counters['votedOffsets'] + counters['nearestOffsets'],
+                         len(images))
+        data = json.loads(stats.json())
+        self.assertEqual(data['counters'], counters)
+        self.assertEqual(len(data['stages']['pass3']['profile']),
+                         instrument.PROFILELINES)
+
+    def test_counters(self):
+        stats = instrument.Stats()
+        stats.count('a')
+        stats.count('a', 3)
+        stats.maximum('b', 0)
+        stats.maximum('b', 5)
+        stats.maximum('b', 2)
+        self.assertEqual(stats.counters, {'a': 4, 'b': 5})
+
+    def test_stage_error(self):
+        stats = instrument.Stats()
+        def fail():
+            with stats.stage('fails', 2):
+                raise ValueError
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(stats.stages['fails']['items'], 2)
+        self.assertFalse('profile' in stats.stages['fails'])
+        self.assertFalse('peak' in stats.stages['fails'])
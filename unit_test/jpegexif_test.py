@@ -0,0 +1,111 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from gpspixtrax import jpegexif
+
+TAGS = ('GPSDateTime', 'GPSAltitude', 'GPSLatitude', 'GPSLongitude',
+        'GPSSpeed', 'GPSStatus', 'GPSTrack', 'GPSMeasureMode',
+        'DateTimeOriginal', 'ShotNumberSincePowerUp')
+
+class Test_jpegexif(unittest.TestCase):
+    def setUp(self):
+        self.directory = os.path.dirname(__file__) + '/data/'
+
+    def test_golden(self):
+        # same values as exiftool -n -j in exiftool_test; the shot number
+        # lives in the Sony MakerNote so is excluded here
+        self.assertEquals(
+            jpegexif.readexif(self.directory + 'dsc05521_arw.jpg', TAGS[:-1]), {
+                "SourceFile": self.directory + "dsc05521_arw.jpg",
+                "GPSDateTime": "2013:06:11 17:31:10.577Z",
+                "GPSAltitude": 11.4,
+                "GPSLatitude": 70.0833613888889,
+                "GPSLongitude": 16.0796983333333,
+                "GPSSpeed": 36.2,
+                "GPSStatus": "V",
+                "GPSTrack": 52.74,
+                "GPSMeasureMode": 3,
+                "DateTimeOriginal": "2013:06:12 07:27:01",
+            })
+        self.assertEquals(
+            jpegexif.readexif(self.directory + 'dsc05870_arw.jpg', TAGS[:-1]), {
+                "SourceFile": self.directory + "dsc05870_arw.jpg",
+                "GPSDateTime": "2013:06:12 13:49:52Z",
+                "GPSAltitude": -0.6,
+                "GPSLatitude": 70.984505,
+                "GPSLongitude": 25.9636263888889,
+                "GPSSpeed": 1.7,
+                "GPSStatus": "V",
+                "GPSTrack": 325.31,
+                "GPSMeasureMode": 3,
+                "DateTimeOriginal": "2013:06:12 20:29:38",
+            })
+        self.assertEquals(
+            jpegexif.readexif(self.directory + 'dsc08142.jpg', TAGS[:-1]), {
+                "SourceFile": self.directory + "dsc08142.jpg",
+                "GPSDateTime": "2013:06:18 06:36:57.463Z",
+                "GPSAltitude": 93.9,
+                "GPSLatitude": 58.1362883333333,
+                "GPSLongitude": 7.99556972222222,
+                "GPSSpeed": 0.8,
+                "GPSStatus": "A",
+                "GPSTrack": 130.03,
+                "GPSMeasureMode": 3,
+                "DateTimeOriginal": "2013:06:18 08:37:01",
+            })
+
+    def test_subset(self):
+        self.assertEquals(
+            jpegexif.readexif(self.directory + 'dsc08142.jpg', ('GPSStatus',)),
+            {"SourceFile": self.directory + "dsc08142.jpg", "GPSStatus": "A"})
+
+    def test_makernote_fallback(self):
+        for name in ('dsc05521_arw.jpg', 'dsc05870_arw.jpg', 'dsc08142.jpg'):
+            self.assertEquals(jpegexif.readexif(self.directory + name, TAGS), None)
+
+    def test_unsupported(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            for name, contents in (('empty.jpg', b''),
+                                   ('text.jpg', b'not an image'),
+                                   ('noexif.jpg', b'\xff\xd8\xff\xd9'),
+                                   ('truncated.jpg',
+                                    open(self.directory + 'dsc08142.jpg',
+                                         'rb').read()[0:200])):
+                filename = os.path.join(tmpdir, name)
+                open(filename, 'wb').write(contents)
+                self.assertEquals(jpegexif.readexif(filename, TAGS[:-1]), None)
+            self.assertEquals(
+                jpegexif.readexif(os.path.join(tmpdir, 'missing.jpg'), TAGS), None)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_timestamp(self):
+        self.assertEquals(jpegexif.timestamp(17, 31, 10.577), '17:31:10.577')
+        self.assertEquals(jpegexif.timestamp(13, 49, 52), '13:49:52')
+        self.assertEquals(jpegexif.timestamp(0, 0, 0), '00:00:00')
+
+    def test_number(self):
+        self.assertEquals(jpegexif.number(3.0), 3)
+        self.assertEquals(isinstance(jpegexif.number(3.0), int), True)
+        self.assertEquals(jpegexif.number(-0.6), -0.6)
+        self.assertEquals(jpegexif.number(70.08336138888889), 70.0833613888889)
@@ -15,19 +15,20 @@
 #  limitations under the License.
 #
 
+import io
 import mock
-import os
 import unittest
 
 from lxml import etree
 
-from plumbum.cmd import xz
-
 from gpspixtrax import ddict
 from gpspixtrax import exiftool
 from gpspixtrax import gpspixtrax
+from gpspixtrax import instrument
 from gpspixtrax import kml
 
+import fixtures
+
 class Test_KMLPaths(unittest.TestCase):
     def assert_no_repeats(self, xml):
         coordinates = str(xml.Document.Placemark.LineString.coordinates).split()
@@ -37,12 +38,13 @@ class Test_KMLPaths(unittest.TestCase):
     def test_empty(self):
         K = kml.KMLPaths([])
         self.assertEquals(K.coordinateString(kml.MODE.valid), '')
+        output = io.BytesIO()
+        K.writeKMLPaths(output, 'foo')
+        self.assertEqual(output.getvalue(), etree.tostring(K.KMLPaths('foo')))
 
     @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
     def test_all(self, I):
-        directory = os.path.dirname(__file__)
-        I.return_value = xz(
-            '-d', '-c', directory + '/data/selectdata.json.xz')
+        I.return_value = fixtures.read('selectdata.json.xz')
         filelist = mock.Mock()
         imagedata = exiftool.fetchdata(filelist)
         G = gpspixtrax.GPSPixTrax(imagedata)
@@ -69,3 +71,82 @@ class Test_KMLPaths(unittest.TestCase):
             self.assert_no_repeats(k)
             k = K.KMLPaths('foo')
             self.assert_no_repeats(k)
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_stream(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        gpspixtrax.GPSPixTrax(imagedata).parse()
+        for slice in imagedata:
+            K = kml.KMLPaths(slice)
+            output = io.BytesIO()
+            K.writeKMLPaths(output, 'foo')
+            self.assertEqual(output.getvalue(),
+                             etree.tostring(K.KMLPaths('foo')))
+            output = io.BytesIO()
+            K.writeKMLPath(output, 'foo', kml.MODE.gps)
+            self.assertEqual(output.getvalue(),
+                             etree.tostring(K.KMLPath('foo', kml.MODE.gps)))
+            for mode in kml.MODE.values():
+                self.assertEqual(''.join(K.coordinateChunks(mode, 3)),
+                                 K.coordinateString(mode))
+
+    def test_classify(self):
+        slice = [
+            ddict.ddict(GPSStatus='V', GPSMeasureMode=2, GPSLongitude=1.0,
+                        GPSLatitude=2.0, projlon=3.0, projlat=4.0),
+            ddict.ddict(GPSStatus='A', GPSMeasureMode=3, GPSLongitude=1.5,
+                        GPSLatitude=2.5, GPSAltitude=10),
+            ddict.ddict(GPSStatus='V', GPSMeasureMode=2, GPSLongitude=1.5,
+                        GPSLatitude=2.5, fuzzlon=5.0, fuzzlat=6.0,
+                        projlon=7.0, projlat=8.0),
+            ddict.ddict(GPSStatus='A', GPSMeasureMode=2, GPSLongitude=1.25,
+                        GPSLatitude=2.75),
+        ]
+        K = kml.KMLPaths(slice)
+        strings = K.coordinateStrings(kml.MODE.values())
+        self.assertEqual(strings, {
+            kml.MODE.valid: '1.5,2.5,10 1.25,2.75',
+            kml.MODE.validated: '1.5,2.5,10 1.5,2.5 1.25,2.75',
+            kml.MODE.gps: '1.0,2.0 1.5,2.5,10 1.5,2.5 1.25,2.75',
+            kml.MODE.projected: '3.0,4.0 1.5,2.5,10 7.0,8.0 1.25,2.75',
+            kml.MODE.interpolated: '1.5,2.5,10 5.0,6.0 1.25,2.75',
+        })
+        for mode in kml.MODE.values():
+            self.assertEqual(K.coordinateString(mode), strings[mode])
+        # GPS coordinates made once per image, not once per mode
+        with mock.patch.object(K, 'gpscoord', wraps=K.gpscoord) as G:
+            lists = K.coordinateLists(
+                (kml.MODE.valid, kml.MODE.gps, kml.MODE.projected))
+            self.assertEqual(G.call_count, 4)
+        self.assertEqual(lists[kml.MODE.valid], ['1.5,2.5,10', '1.25,2.75'])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_simplify(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        gpspixtrax.GPSPixTrax(imagedata).parse()
+        for slice in imagedata:
+            K = kml.KMLPaths(slice)
+            K.KMLPaths('foo')
+            self.assertEqual(set(x[0] == x[1] for x in K.vertices.values()),
+                             set((True,)))
+            S = kml.KMLPaths(slice, tolerance=10)
+            s = S.KMLPaths('foo')
+            self.assert_no_repeats(s)
+            self.assertEqual(sorted(S.vertices.keys()),
+                             sorted(x[2] for x in kml.STYLES))
+            for mode, (before, after) in S.vertices.items():
+                self.assertEqual(before, K.vertices[mode][0])
+                self.assertTrue(after <= before)
+                self.assertEqual(
+                    len(S.coordinateString(mode).split()), after)
+            output = io.BytesIO()
+            stats = instrument.Stats()
+            kml.KMLPaths(slice, tolerance=10,
+                         stats=stats).writeKMLPaths(output, 'foo')
+            self.assertEqual(output.getvalue(), etree.tostring(s))
+            # counted for each path written
+            self.assertEqual(stats.counters, {
+                'pathVertices': sum(x[0] for x in S.vertices.values()),
+                'keptVertices': sum(x[1] for x in S.vertices.values())})
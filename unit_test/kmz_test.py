@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import io
+import mock
+import unittest
+import zipfile
+
+from lxml import objectify
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import kml
+from gpspixtrax import kmz
+
+import fixtures
+
+class Test_kmz(unittest.TestCase):
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_tiles(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        gpspixtrax.GPSPixTrax(imagedata).parse()
+        T = kmz.KMZTiles(imagedata, maxvertices=50)
+        tiles = list(T.tiles())
+        self.assertTrue(len(tiles) > 5)
+        self.assertEqual(tiles[0], T.root)
+        modes = [x[2] for x in kml.STYLES]
+        self.assertEqual(T.root.vertices(), sum(
+            len(x) for slice in imagedata
+            for x in kml.KMLPaths(slice).coordinateLists(modes).values()))
+        for tile in tiles:
+            if not tile.children:
+                continue
+            self.assertTrue(tile.vertices() > 50)
+            for child in tile.children:
+                self.assertEqual(child.key[:-1], tile.key)
+                self.assertTrue(tile.south <= child.south < child.north <= tile.north)
+                self.assertTrue(tile.west <= child.west < child.east <= tile.east)
+            # every point of the parent is in some child
+            self.assertTrue(sum(x.vertices() for x in tile.children) >=
+                            tile.vertices())
+
+        output = io.BytesIO()
+        T.write(output, 'foo')
+        z = zipfile.ZipFile(output)
+        names = z.namelist()
+        self.assertEqual(names, [x.filename for x in tiles])
+        self.assertEqual(names[0], 'doc.kml')
+        self.assertEqual(set(x.compress_type for x in z.infolist()),
+                         set((zipfile.ZIP_DEFLATED,)))
+        for tile in tiles:
+            doc = objectify.fromstring(z.read(tile.filename)).Document
+            lod = doc.Region.Lod
+            self.assertEqual(lod.minLodPixels,
+                             0 if tile is T.root else kmz.MINLODPIXELS)
+            self.assertEqual(lod.maxLodPixels,
+                             kmz.MAXLODPIXELS if tile.children else -1)
+            links = [str(x.Link.href) for x in doc.findall(
+                '{%s}NetworkLink' %kml.KMLNS)]
+            self.assertEqual(links, [x.filename for x in tile.children])
+            lines = doc.findall('.//{%s}LineString' %kml.KMLNS)
+            vertices = sum(len(str(x.coordinates).split()) for x in lines)
+            if tile.children:
+                # simplified for display at a lower level of detail
+                self.assertTrue(vertices < tile.vertices())
+            else:
+                self.assertEqual(vertices, tile.vertices())
+
+    def test_empty(self):
+        T = kmz.KMZTiles([[]])
+        output = io.BytesIO()
+        T.write(output, 'foo')
+        z = zipfile.ZipFile(output)
+        self.assertEqual(z.namelist(), ['doc.kml'])
+        doc = objectify.fromstring(z.read('doc.kml')).Document
+        self.assertEqual(doc.name, 'foo')
+        self.assertEqual(doc.findall('{%s}Placemark' %kml.KMLNS), [])
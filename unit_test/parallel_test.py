@@ -0,0 +1,98 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import mock
+import unittest
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import imagetable
+from gpspixtrax import instrument
+from gpspixtrax import parallel
+
+import fixtures
+
+class Test_parallel(unittest.TestCase):
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def fetch(self, name, size, I):
+        I.return_value = fixtures.read(name)
+        imagedata = exiftool.fetchdata(mock.Mock())
+        if size:
+            # many short slices to put lots of state across boundaries
+            imagedata = [images[i:i+size] for images in imagedata
+                         for i in range(0, len(images), size)]
+        return imagedata
+
+    def assertSameResults(self, name, size=None):
+        serial = self.fetch(name, size)
+        gpspixtrax.GPSPixTrax(serial).parse()
+        imagedata = self.fetch(name, size)
+        parallel.ParallelGPSPixTrax(imagedata, processes=2).parse()
+        self.assertEqual(len(imagedata), len(serial))
+        for images, expected in zip(imagedata, serial):
+            # same keys with exactly the same values
+            self.assertEqual(images, expected)
+
+    def test_selectdata(self):
+        self.assertSameResults('selectdata.json.xz')
+
+    def test_boundaries(self):
+        for size in (1, 2, 3, 7, 20):
+            self.assertSameResults('selectdata.json.xz', size)
+        for name in ('farapart.json.xz', 'initialoffset.json.xz',
+                     'nooffset.json.xz', 'disjointclockinvalid.json.xz'):
+            self.assertSameResults(name)
+            self.assertSameResults(name, 3)
+
+    def test_pool(self):
+        imagedata = self.fetch('selectdata.json.xz', None)
+        pool = mock.Mock()
+        pool.map.side_effect = lambda f, data: [f(x) for x in data]
+        G = parallel.ParallelGPSPixTrax(imagedata, pool=pool)
+        G.parse()
+        self.assertEqual(pool.map.call_count, 2)
+        self.assertEqual([x[0][0] for x in pool.map.call_args_list],
+                         [parallel._pass2, parallel._pass3])
+        # only the fields the passes read, once for both passes
+        data = pool.map.call_args_list[0][0][1]
+        self.assertTrue(pool.map.call_args_list[1][0][1] is data)
+        self.assertEqual([len(x) for x in data],
+                         [len(parallel.TIMES + parallel.FIELDS)] * len(data))
+        self.assertEqual(data[0][0][0], 0)
+        self.assertEqual(set(type(x) for x in data[0][0]), set([int]))
+
+    def test_imagetable(self):
+        serial = self.fetch('selectdata.json.xz', 20)
+        gpspixtrax.GPSPixTrax(serial).parse()
+        table = imagetable.ImageTable.fromslices(
+            self.fetch('selectdata.json.xz', 20))
+        pool = mock.Mock()
+        pool.map.side_effect = lambda f, data: [f(x) for x in data]
+        parallel.ParallelGPSPixTrax(table.slices, pool=pool).parse()
+        self.assertEqual(table.todata(), serial)
+
+    def test_stats(self):
+        for size in (None, 3, 20):
+            stats = instrument.Stats()
+            gpspixtrax.GPSPixTrax(self.fetch('selectdata.json.xz', size),
+                                  stats=stats).parse()
+            pstats = instrument.Stats()
+            parallel.ParallelGPSPixTrax(self.fetch('selectdata.json.xz', size),
+                                        processes=2, stats=pstats).parse()
+            # what the workers interpolate is counted as well
+            self.assertTrue(stats.counters['interpolated'] > 0)
+            self.assertEqual(pstats.counters, stats.counters)
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import unittest
+
+from gpspixtrax import geodesy
+from gpspixtrax import simplify
+
+class Test_simplify(unittest.TestCase):
+    def test_segmentdistance(self):
+        # one thousandth of a degree north of a segment along the equator
+        north = geodesy.haversine(0, 0, 0.001, 0)
+        # to within a centimeter
+        self.assertAlmostEqual(
+            simplify.segmentdistance((0.5, 0.001), (0, 0), (1, 0)), north, 5)
+        # beyond either end, distance to that end
+        self.assertEqual(
+            simplify.segmentdistance((-0.001, 0), (0, 0), (1, 0)), north)
+        self.assertAlmostEqual(
+            simplify.segmentdistance((1.001, 0), (0, 0), (1, 0)), north)
+        # on the segment, and degenerate segment
+        self.assertAlmostEqual(
+            simplify.segmentdistance((0.25, 0), (0, 0), (1, 0)), 0)
+        self.assertEqual(
+            simplify.segmentdistance((0, 0.001), (0, 0), (0, 0)), north)
+
+    def test_collinear(self):
+        # along a meridian, so a great circle
+        points = [(8, 58 + i * 0.0001, 20) for i in range(1000)]
+        self.assertEqual(simplify.simplify(points, 1), [0, 999])
+
+    def test_tolerance(self):
+        # zigzag about 11 meters either side of a line along the equator
+        points = [(i * 0.001, (i % 2) * 0.0002 - 0.0001) for i in range(101)]
+        self.assertEqual(simplify.simplify(points, 5), list(range(101)))
+        self.assertEqual(simplify.simplify(points, 30), [0, 100])
+        # a corner always survives
+        points = [(0, 0), (0.0001, 0), (0.0002, 0), (0.0002, 0.0001),
+                  (0.0002, 0.0002)]
+        self.assertEqual(simplify.simplify(points, 5), [0, 2, 4])
+
+    def test_short(self):
+        for points in ([], [(0, 0)], [(0, 0), (1, 1)]):
+            self.assertEqual(simplify.simplify(points, 100),
+                             list(range(len(points))))
+        points = [(0, 0), (0.5, 0), (1, 0)]
+        self.assertEqual(simplify.simplify(points, None), [0, 1, 2])
+        self.assertEqual(simplify.simplify(points, 0), [0, 1, 2])
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime, timedelta
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from gpspixtrax import ddict
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import snapshot
+
+import fixtures
+
+class Test_snapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'trip.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameImages(self, imagedata, expected):
+        self.assertEqual(len(imagedata), len(expected))
+        for images, original in zip(imagedata, expected):
+            self.assertEqual(images, original)
+            for image, x in zip(images, original):
+                # ints stay ints, aware times stay aware
+                self.assertEqual(dict((k, type(v)) for k, v in image.items()),
+                                 dict((k, type(v)) for k, v in x.items()))
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_roundtrip(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        G = gpspixtrax.GPSPixTrax(imagedata)
+        G.parse()
+        G.savesnapshot(self.path)
+        S = snapshot.Snapshot(self.path)
+        self.assertEqual(len(S), sum(len(x) for x in imagedata))
+        self.assertEqual([len(x) for x in S.slices],
+                         [len(x) for x in imagedata])
+        # random access without decoding the rest
+        self.assertEqual(S.slices[3][-1], imagedata[3][-1])
+        self.assertEqual([S.extras(x) for x in range(len(S))],
+                         [{}] * len(S))
+        self.assertSameImages(S.imagedata(), imagedata)
+        S.close()
+
+    def test_extras(self):
+        imagedata = [[
+            ddict.ddict(SourceFile=u'a/b.jpg', GPSStatus=u'A',
+                        GPSAltitude=12, GPSLatitude=-1.5,
+                        localtime=datetime(2013, 1, 2, 3, 4, 5, 6),
+                        durationGPS=timedelta(seconds=-3),
+                        note=u'not a field', GPSSpeed=u'fast',
+                        ShotNumberSincePowerUp=2**60),
+        ], [], [
+            ddict.ddict(SourceFile=u'a/\xe5.jpg', GPSStatus=u'V'),
+        ]]
+        snapshot.write(self.path, imagedata)
+        S = snapshot.Snapshot(self.path)
+        self.assertEqual(sorted(S.extras(0).keys()),
+                         ['GPSSpeed', 'ShotNumberSincePowerUp', 'note'])
+        self.assertEqual(S.extras(1), {})
+        self.assertSameImages(S.imagedata(), imagedata)
+        self.assertRaises(IndexError, S.image, 2)
+        S.close()
+
+    def test_extras_times(self):
+        zone = snapshot.tz.tzoffset(None, 7200)
+        aware = datetime(2013, 6, 18, 9, 30, 1, 5, tzinfo=zone)
+        imagedata = [[
+            ddict.ddict(SourceFile=u'a/b.jpg', gpstime=aware,
+                        taken=datetime(2013, 6, 18, 7, 30),
+                        stale=timedelta(seconds=-1.5),
+                        nested={u'when': datetime(2013, 6, 18)}),
+        ]]
+        snapshot.write(self.path, imagedata)
+        S = snapshot.Snapshot(self.path)
+        image = S.image(0)
+        self.assertSameImages(S.imagedata(), imagedata)
+        self.assertEqual(image.gpstime.utcoffset(), timedelta(hours=2))
+        self.assertEqual(image.taken.tzinfo, None)
+        S.close()
+        imagedata[0][0]['bad'] = object()
+        try:
+            snapshot.write(self.path, imagedata)
+            self.fail('SnapshotError not raised')
+        except snapshot.SnapshotError as e:
+            self.assertTrue(str(e).startswith('cannot store bad '))
+
+    def test_bad_file(self):
+        open(self.path, 'wb').write(b'x' * 200)
+        self.assertRaises(snapshot.SnapshotError, snapshot.Snapshot, self.path)
+        snapshot.write(self.path, [])
+        data = open(self.path, 'rb').read()
+        open(self.path, 'wb').write(data[0:8] + b'\x63' + data[9:])
+        self.assertRaises(snapshot.SnapshotError, snapshot.Snapshot, self.path)
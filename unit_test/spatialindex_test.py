@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import io
+import json
+import mock
+import unittest
+
+from gpspixtrax import exiftool
+from gpspixtrax import geodesy
+from gpspixtrax import gpspixtrax
+from gpspixtrax import spatialindex
+
+import fixtures
+
+class Test_spatialindex(unittest.TestCase):
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def setUp(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        self.imagedata = exiftool.fetchdata(mock.Mock())
+        self.G = gpspixtrax.GPSPixTrax(self.imagedata)
+        self.G.parse()
+
+    def test_positions(self):
+        S = self.G.spatialindex()
+        expected = 0
+        for slice in self.imagedata:
+            for image in slice:
+                if image.GPSStatus == 'A' or 'fuzzlat' in image or 'projlat' in image:
+                    expected += 1
+        self.assertEqual(len(S), expected)
+        # pass3 sets fuzz and proj positions together
+        sources = set(p.source for p in S.positions)
+        self.assertEqual(sources, set(('gps', 'fuzz')))
+        for p in S.positions:
+            if p.source == 'gps':
+                self.assertEqual(p.image.GPSStatus, 'A')
+                self.assertEqual(p.lat, p.image.GPSLatitude)
+            elif p.source == 'fuzz':
+                self.assertEqual(p.lon, p.image.fuzzlon)
+        S = self.G.spatialindex(sources=('proj', 'gps'))
+        self.assertEqual(set(p.source for p in S.positions),
+                         set(('gps', 'proj')))
+        S = self.G.spatialindex(sources=('gps',))
+        self.assertEqual(set(p.source for p in S.positions), set(('gps',)))
+
+    def brute(self, S, lat, lon, meters):
+        found = [(1000 * geodesy.haversine(lat, lon, p.lat, p.lon), p)
+                 for p in S.positions]
+        return sorted([x for x in found if x[0] <= meters],
+                      key=lambda x: x[0])
+
+    def test_queries(self):
+        S = self.G.spatialindex()
+        for p in S.positions[::37]:
+            for meters in (50, 500, 5000):
+                self.assertEqual(S.radius(p.lat, p.lon, meters),
+                                 self.brute(S, p.lat, p.lon, meters))
+            nearest = S.knearest(p.lat, p.lon, 10)
+            self.assertEqual(len(nearest), 10)
+            self.assertEqual([x[0] for x in nearest],
+                             [x[0] for x in self.brute(S, p.lat, p.lon, 1e8)[0:10]])
+            south, west = p.lat - 0.05, p.lon - 0.1
+            north, east = p.lat + 0.05, p.lon + 0.1
+            self.assertEqual(
+                sorted(x.file for x in S.bbox(south, west, north, east)),
+                sorted(x.file for x in S.positions
+                       if south <= x.lat <= north and west <= x.lon <= east))
+        self.assertEqual(len(S.knearest(0, 0, len(S) + 10)), len(S))
+        self.assertEqual(S.knearest(0, 0, 0), [])
+
+    def test_antimeridian(self):
+        S = spatialindex.GridIndex()
+        for i, lon in enumerate((179.999, -179.999, 0)):
+            S.add(spatialindex.Position(str(i), 0.0, lon, 'gps', None))
+        self.assertEqual([p.file for p in S.bbox(-1, 179, 1, -179)],
+                         ['0', '1'])
+        self.assertEqual(sorted(p.file for _, p in S.radius(0, 180, 1000)),
+                         ['0', '1'])
+        # near the pole, every longitude
+        S.add(spatialindex.Position('3', 89.9999, 90, 'gps', None))
+        self.assertEqual([p.file for _, p in S.radius(89.9999, -90, 100)],
+                         ['3'])
+
+    def test_save_load(self):
+        S = self.G.spatialindex()
+        f = io.StringIO() if str is not bytes else io.BytesIO()
+        S.save(f)
+        f.seek(0)
+        L = spatialindex.GridIndex.load(f)
+        self.assertEqual(len(L), len(S))
+        p = S.positions[100]
+        self.assertEqual([(d, x.file) for d, x in L.radius(p.lat, p.lon, 500)],
+                         [(d, x.file) for d, x in S.radius(p.lat, p.lon, 500)])
+        self.assertEqual(L.positions[0].image, None)
+        bad = json.dumps({'version': 99})
+        self.assertRaises(ValueError, spatialindex.GridIndex.load,
+                          io.StringIO(u'' + bad))
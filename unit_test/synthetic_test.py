@@ -0,0 +1,74 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import mock
+import unittest
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import synthetic
+
+class Output(list):
+    write = list.append
+
+class Test_synthetic(unittest.TestCase):
+    def test_trip(self):
+        records = list(synthetic.trip(images=2000, days=4, perdirectory=300,
+                                      dropout=0.3, zones=(-5, 2)))
+        self.assertEqual(len(records), 2000)
+        self.assertEqual(records, list(synthetic.trip(
+            images=2000, days=4, perdirectory=300, dropout=0.3,
+            zones=(-5, 2))))
+        self.assertNotEqual(records, list(synthetic.trip(
+            images=2000, days=4, perdirectory=300, dropout=0.3,
+            zones=(-5, 2), seed=2)))
+        self.assertEqual(sorted(records[0].keys()),
+                         sorted(['SourceFile'] + [x[1:] for x in exiftool.TAGS]))
+        directories = [x['SourceFile'].split('/')[0] for x in records]
+        self.assertEqual(sorted(set(directories)),
+                         ['20130607', '20130607-1', '20130608', '20130608-1',
+                          '20130609', '20130609-1', '20130610', '20130610-1'])
+        # directories are not revisited
+        runs = [x for i, x in enumerate(directories)
+                if i == 0 or x != directories[i-1]]
+        self.assertEqual(len(runs), len(set(runs)))
+        invalid = [x for x in records if x['GPSStatus'] == 'V']
+        self.assertTrue(0.2 < len(invalid) / 2000.0 < 0.4)
+        # a V stamp repeats the last fix
+        for i, record in enumerate(records[1:]):
+            last = records[i]
+            if record['GPSStatus'] == 'V' and last['GPSStatus'] == 'A':
+                self.assertEqual(record['GPSDateTime'], last['GPSDateTime'])
+                self.assertEqual(record['GPSLatitude'], last['GPSLatitude'])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_parse(self, I):
+        output = Output()
+        synthetic.dump(synthetic.trip(images=500, days=2, zones=(-5, 2),
+                                      burst=0.2), output)
+        I.return_value = ''.join(output)
+        self.assertEqual(len(json.loads(I.return_value)), 500)
+        imagedata = exiftool.fetchdata(mock.Mock())
+        self.assertEqual([len(x) for x in imagedata], [250, 250])
+        gpspixtrax.GPSPixTrax(imagedata).parse()
+        self.assertEqual(set(x.tzoffset for x in imagedata[0]), set([5]))
+        self.assertEqual(set(x.tzoffset for x in imagedata[1]), set([-2]))
+        self.assertTrue(any('fuzzlat' in x for x in imagedata[0]))
+        # bursts put several images in the same second
+        times = [x.DateTimeOriginal for x in imagedata[0]]
+        self.assertTrue(len(set(times)) < len(times))
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime, timedelta
+import io
+import math
+import unittest
+
+from gpspixtrax import ddict
+from gpspixtrax import exiftime
+from gpspixtrax import tracklog
+
+GPX = b'''<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+ <trk><trkseg>
+  <trkpt lat="58.0" lon="8.0"><ele>10</ele><time>2013-06-18T09:00:00Z</time></trkpt>
+  <trkpt lat="58.1" lon="8.2"><ele>20</ele><time>2013-06-18T09:01:40Z</time></trkpt>
+  <trkpt lat="58.2" lon="8.2"><time>2013-06-18T09:02:00.5Z</time></trkpt>
+  <trkpt lat="59.0" lon="9.0"><time>2013-06-18T10:00:00Z</time></trkpt>
+  <trkpt lat="0" lon="0"></trkpt>
+ </trkseg></trk>
+</gpx>
+'''
+
+# the standard examples, with valid checksums
+NMEA = '''$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47
+$GPRMC,123519,A,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*6A
+$GPRMC,123520,V,4807.038,N,01131.000,E,022.4,084.4,230394,003.1,W*7D
+$GPRMC,123521,A,4807.038,S,01131.000,W,022.4,084.4,230394,003.1,W*00
+garbage
+'''
+
+def image(local, tzseconds=None):
+    image = ddict.ddict(pseudolocaltime=local.replace(tzinfo=exiftime.UTC))
+    if tzseconds is not None:
+        image['tzseconds'] = tzseconds
+    return image
+
+class Test_tracklog(unittest.TestCase):
+    def test_readgpx(self):
+        log = tracklog.TrackLog()
+        log.readgpx(io.BytesIO(GPX))
+        self.assertEqual(len(log), 4)
+        start = exiftime.epoch(datetime(2013, 6, 18, 9))
+        self.assertEqual(list(log.times),
+                         [start, start + 100, start + 120.5, start + 3600])
+        self.assertEqual(list(log.lats), [58.0, 58.1, 58.2, 59.0])
+        self.assertEqual(list(log.alts)[0:2], [10.0, 20.0])
+        self.assertTrue(math.isnan(log.alts[2]))
+
+    def test_readnmea(self):
+        log = tracklog.TrackLog()
+        log.readnmea(io.StringIO(u'' + NMEA))
+        # void fix and bad checksum dropped
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log.times[0],
+                         exiftime.epoch(datetime(1994, 3, 23, 12, 35, 19)))
+        self.assertAlmostEqual(log.lats[0], 48.1173)
+        self.assertAlmostEqual(log.lons[0], 11.5166666667)
+        self.assertEqual(log.alts[0], 545.4)
+        # GGA after RMC for the same fix
+        log = tracklog.TrackLog()
+        lines = NMEA.splitlines()
+        log.readnmea([lines[1], lines[0]])
+        self.assertEqual(log.alts[0], 545.4)
+
+    def test_sort(self):
+        log = tracklog.TrackLog()
+        log.append(2, 20, 200)
+        log.append(1, 10, 100, 5)
+        log.sort()
+        self.assertEqual(list(log.times), [1, 2])
+        self.assertEqual(list(log.lons), [100, 200])
+        self.assertEqual(log.alts[0], 5)
+
+    def test_match(self):
+        log = tracklog.TrackLog()
+        log.readgpx(io.BytesIO(GPX))
+        # camera set to UTC+2
+        local = datetime(2013, 6, 18, 11)
+        images = [
+            image(local - timedelta(seconds=1), -7200),   # before log
+            image(local, -7200),                          # first point
+            image(local + timedelta(seconds=50), -7200),  # halfway
+            image(local + timedelta(seconds=110), -7200), # no altitude
+            image(local + timedelta(seconds=50)),         # no offset
+            image(local + timedelta(seconds=1800), -7200),# gap too long
+            image(local + timedelta(seconds=3600), -7200),# last point
+            image(local + timedelta(seconds=3601), -7200),# after log
+        ]
+        # out of order slices
+        imagedata = [images[4:], images[0:4]]
+        self.assertEqual(log.match(imagedata), 4)
+        self.assertEqual([('loglat' in x) for x in images],
+                         [False, True, True, True, False, False, True, False])
+        self.assertEqual(images[1].loglat, 58.0)
+        self.assertEqual(images[1].loggap, 0)
+        self.assertAlmostEqual(images[2].loglat, 58.05)
+        self.assertAlmostEqual(images[2].loglon, 8.1)
+        self.assertAlmostEqual(images[2].logalt, 15)
+        self.assertEqual(images[2].loggap, 100)
+        self.assertAlmostEqual(images[3].loglat, 58.1 + 0.1 * 10 / 20.5)
+        self.assertFalse('logalt' in images[3])
+        self.assertEqual(images[6].loglon, 9.0)
+
+    def test_merge(self):
+        # far more points than images, in one pass
+        log = tracklog.TrackLog()
+        for i in range(100000):
+            log.append(i, i * 0.0001, 0)
+        images = [image(datetime(1970, 1, 1) + timedelta(seconds=t), 0)
+                  for t in range(0, 100000, 7)]
+        self.assertEqual(log.match([images]), len(images))
+        for x in images:
+            self.assertAlmostEqual(
+                x.loglat, exiftime.epoch(x.pseudolocaltime) * 0.0001)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from datetime import datetime, timedelta
+import unittest
+
+from gpspixtrax import ddict
+from gpspixtrax import exiftime
+from gpspixtrax import tzsolve
+
+START = datetime(2013, 6, 18, 9, tzinfo=exiftime.UTC)
+
+def image(local, tzoffset, status='A', stale=0):
+    '''image taken local seconds into the trip by a camera clock tzoffset
+    hours behind UTC, with a GPS stamp stale seconds old'''
+    pseudolocaltime = START + timedelta(seconds=local)
+    gpstime = pseudolocaltime + timedelta(hours=tzoffset, seconds=-stale)
+    return ddict.ddict(pseudolocaltime=pseudolocaltime, gpstime=gpstime,
+                       GPSStatus=status)
+
+class Test_tzsolve(unittest.TestCase):
+    def test_segments(self):
+        result, owners = tzsolve.segments([2, 2, 2, 4, 2, 2, 6, 6, 6, 6, 6])
+        self.assertEqual([x.mode for x in result], [2, 6])
+        # the single vote for 4 is outvoted
+        self.assertEqual(result[0].votes, {2: 5, 4: 1})
+        self.assertEqual(result[0].confidence(2), 5 / 6.0)
+        self.assertEqual(owners, [0] * 6 + [1] * 5)
+        # short runs before the first long one do not make a segment
+        result, owners = tzsolve.segments([4, 2, 2, 2])
+        self.assertEqual([x.mode for x in result], [2])
+        self.assertEqual(tzsolve.segments([]), ([], []))
+
+    def test_guess(self):
+        self.assertEqual(tzsolve.guess(7200 + 299, 300, 28800), 4)
+        self.assertEqual(tzsolve.guess(-7200 + 299, 300, 28800), -4)
+        self.assertEqual(tzsolve.guess(7200 + 301, 300, 28800), None)
+        self.assertEqual(tzsolve.guess(5400, 300, 28800), None)
+        self.assertEqual(tzsolve.guess(28800, 300, 28800), None)
+
+    def test_solve(self):
+        images = ([image(t * 60, 2) for t in range(5)] +
+                  [image(340, 2, 'V', stale=50), image(3600, 5, 'V')] +
+                  [image(3600 * 3 + t * 60, 5.5) for t in range(3)] +
+                  [image(3600 * 4, 5, 'V')])
+        segments, counts = tzsolve.solve(images)
+        self.assertEqual(counts, dict(voted=8, guessed=0, nearest=3,
+                                      unsolved=0))
+        self.assertEqual([x.mode for x in segments], [4, 11])
+        self.assertEqual([x.tzoffset for x in images],
+                         [2] * 7 + [5.5] * 4)
+        self.assertEqual([x.tzseconds for x in images],
+                         [7200] * 7 + [19800] * 4)
+        self.assertEqual(type(images[0].tzoffset), int)
+        self.assertEqual(images[0].tzconfidence, 1.0)
+        # 50 s stale, 100 s from the last fix
+        self.assertEqual(images[5].gpsStampAge, 50)
+        self.assertEqual(images[5].tzconfidence, 28800 / 28900.0)
+        # nearer the first segment by the camera clock
+        self.assertEqual(images[6].tzconfidence, 28800 / (28800 + 3360.0))
+        self.assertEqual(images[6].gpsStampAge, -10800)
+        self.assertEqual(images[-1].gpsStampAge, 1800)
+
+    def test_solve_void(self):
+        images = [image(0, -3, 'V'), image(60, -3, 'V', stale=30),
+                  image(120, -3, 'V', stale=3000), image(180, 1.5, 'V')]
+        segments, counts = tzsolve.solve(images)
+        self.assertEqual(counts, dict(voted=0, guessed=2, nearest=2,
+                                      unsolved=0))
+        self.assertEqual([x.tzoffset for x in images], [-3] * 4)
+        self.assertEqual(images[0].tzconfidence, 0.5)
+        # too stale to guess from, so taken from the image before
+        self.assertTrue(images[2].tzconfidence < 0.5)
+
+    def test_solve_unsolved(self):
+        images = [image(0, 1, 'V', stale=1000)]
+        images[0]['tzoffset'] = 1
+        self.assertEqual(tzsolve.solve(images),
+                         ([], dict(voted=0, guessed=0, nearest=0,
+                                   unsolved=1)))
+        for key in tzsolve.KEYS:
+            self.assertEqual(key in images[0], False)
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import datetime
+import mock
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import watch
+
+import fixtures
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+class Test_watch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_debouncer(self):
+        clock = Clock()
+        d = watch.Debouncer(quiet=2.0, maxdelay=5.0, clock=clock)
+        self.assertEqual(d.timeout(), None)
+        self.assertEqual(d.take(), [])
+        d.add('b')
+        clock.now = 1.0
+        d.add('a')
+        self.assertEqual(d.timeout(), 2.0)
+        self.assertEqual(d.take(), [])
+        clock.now = 3.0
+        self.assertEqual(d.take(), ['a', 'b'])
+        self.assertEqual(d.timeout(), None)
+        # a steady stream is released after maxdelay
+        for i in range(10):
+            clock.now = 10.0 + i
+            d.add(str(i))
+            if d.timeout() == 0:
+                break
+        self.assertEqual(clock.now, 15.0)
+        self.assertEqual(len(d.take()), 6)
+
+    def test_kmlname(self):
+        self.assertEqual(watch.kmlname('/a/b', '/a/b/c/d'), 'c_d.kml')
+        self.assertEqual(watch.kmlname('/a/b', '/a/b'), 'b.kml')
+        self.assertEqual(watch.root(['/a/b', '/a/c'], '/a/c/d'), '/a/c')
+        self.assertEqual(watch.root(['/a/b'], '/a/bc/d'), '/a/bc')
+
+    def test_walk(self):
+        os.mkdir(os.path.join(self.tmpdir, 'd'))
+        for name in ('d/b.JPG', 'd/a.arw', 'c.jpg', 'notes.txt'):
+            open(os.path.join(self.tmpdir, name), 'w').close()
+        files, directories = watch.walk([self.tmpdir])
+        self.assertEqual(files, [os.path.join(self.tmpdir, x)
+                                 for x in ('c.jpg', 'd/a.arw', 'd/b.JPG')])
+        self.assertEqual(directories,
+                         [self.tmpdir, os.path.join(self.tmpdir, 'd')])
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify')
+    def test_inotify(self):
+        i = watch.Inotify()
+        try:
+            i.watch(self.tmpdir)
+            self.assertEqual(i.read(0), [])
+            path = os.path.join(self.tmpdir, 'a.jpg')
+            open(path, 'w').close()
+            os.mkdir(os.path.join(self.tmpdir, 'd'))
+            events = i.read(1)
+            self.assertTrue((path, watch.IN_CREATE) in events)
+            self.assertTrue(any(p == path and m & watch.IN_CLOSE_WRITE
+                                for p, m in events))
+            self.assertTrue(any(m & watch.IN_ISDIR for p, m in events))
+            os.remove(path)
+            self.assertTrue((path, watch.IN_DELETE) in i.read(1))
+        finally:
+            i.close()
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def fetch(self, root, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        for images in imagedata:
+            for image in images:
+                image.SourceFile = os.path.join(root, image.SourceFile)
+        return imagedata
+
+    def test_process(self):
+        root = os.path.join(self.tmpdir, 'trip')
+        output = os.path.join(self.tmpdir, 'kml')
+        os.mkdir(output)
+        imagedata = self.fetch(root)
+        files = [x.SourceFile for y in imagedata for x in y]
+        last = imagedata[-1]
+        held = [x.SourceFile for x in last[len(last)//2:]]
+        records = dict((x.SourceFile, x) for x in last)
+        loaded = self.fetch(root)
+        del loaded[-1][len(last)//2:]
+
+        clock = Clock()
+        inotify = mock.Mock()
+        inotify.read.return_value = []
+        w = watch.Watcher([root], output, inotify=inotify, clock=clock)
+        with mock.patch('gpspixtrax.watch.walk') as W:
+            W.return_value = (files[:-len(held)], [root])
+            with mock.patch('gpspixtrax.exiftool.fetchdata') as F:
+                F.return_value = loaded
+                w.start()
+        inotify.watch.assert_called_once_with(root)
+        written = sorted(os.listdir(output))
+        self.assertEqual(written, sorted(
+            os.path.basename(os.path.dirname(x[0].SourceFile)) + '.kml'
+            for x in imagedata))
+
+        # the rest of the last directory lands
+        for path in held:
+            w.event(path, watch.IN_CLOSE_WRITE)
+        w.event(held[0] + '.xmp', watch.IN_CLOSE_WRITE)
+        self.assertEqual(w.poll(0), None)
+        for name in written:
+            os.remove(os.path.join(output, name))
+        clock.now = 3.0
+        with mock.patch('gpspixtrax.exiftool.fetchdata') as F:
+            F.return_value = [[records[x] for x in held]]
+            start, stop = w.poll(0)
+            F.assert_called_once_with(sorted(held), pool=None)
+        self.assertEqual(stop, len(imagedata))
+        self.assertEqual(len(os.listdir(output)), stop - start)
+        # the same as parsing the whole trip at once
+        full = self.fetch(root)
+        gpspixtrax.GPSPixTrax(full).parse()
+        self.assertEqual(w.G.imagedata, full)
+
+    def started(self, root, output, **kwargs):
+        'Watcher for the whole trip under root, started'
+        imagedata = self.fetch(root)
+        files = [x.SourceFile for y in imagedata for x in y]
+        inotify = mock.Mock()
+        inotify.read.return_value = []
+        w = watch.Watcher([root], output, inotify=inotify, **kwargs)
+        with mock.patch('gpspixtrax.watch.walk') as W:
+            W.return_value = (files, [root])
+            with mock.patch('gpspixtrax.exiftool.fetchdata') as F:
+                F.return_value = imagedata
+                w.start()
+        return w
+
+    def test_process_removed(self):
+        root = os.path.join(self.tmpdir, 'trip')
+        output = os.path.join(self.tmpdir, 'kml')
+        os.mkdir(output)
+        clock = Clock()
+        w = self.started(root, output, clock=clock)
+        imagedata = w.G.imagedata
+        directory = os.path.dirname(imagedata[2][0].SourceFile)
+        name = watch.kmlname(root, directory)
+        self.assertTrue(name in os.listdir(output))
+        deleted = imagedata[4][3].SourceFile
+        w.event(deleted, watch.IN_DELETE)
+        w.event(deleted + '.xmp', watch.IN_DELETE)
+        w.event(directory, watch.IN_DELETE | watch.IN_ISDIR)
+        w.event(directory, watch.IN_DELETE_SELF)
+        clock.now = 3.0
+        with mock.patch('gpspixtrax.exiftool.fetchdata') as F:
+            start, stop = w.poll(0)
+            self.assertEqual(F.called, False)
+        # from the slice before the removed one, if it interpolates
+        # across it, to the one with the deleted image
+        self.assertTrue(start <= 2 and stop == 4)
+        self.assertFalse(name in os.listdir(output))
+        self.assertEqual(w.removed, set())
+        # the same as parsing the trip without them
+        expected = self.fetch(root)
+        expected[4] = [x for x in expected[4] if x.SourceFile != deleted]
+        del expected[2]
+        gpspixtrax.GPSPixTrax(expected).parse()
+        self.assertEqual(w.G.imagedata, expected)
+
+    def test_dates(self):
+        root = os.path.join(self.tmpdir, 'trip')
+        os.mkdir(root)
+        first = datetime.date(2013, 6, 10)
+        w = self.started(root, self.tmpdir, dates=(first, None))
+        with mock.patch('gpspixtrax.watch.walk') as W:
+            W.return_value = ([], [])
+            w.event(os.path.join(root, '2013-06-01'),
+                    watch.IN_CREATE | watch.IN_ISDIR)
+            self.assertEqual(W.called, False)
+            w.event(os.path.join(root, '2013-06-11'),
+                    watch.IN_CREATE | watch.IN_ISDIR)
+            W.assert_called_once_with([os.path.join(root, '2013-06-11')],
+                                      (first, None))
+
+    def test_simplified(self):
+        root = os.path.join(self.tmpdir, 'trip')
+        output = os.path.join(self.tmpdir, 'kml')
+        os.mkdir(output)
+        log = mock.Mock()
+        w = self.started(root, output, log=log, tolerance=10)
+        message = log.call_args[0][0]
+        self.assertTrue(message.startswith('3654 images in '))
+        kept, total = [int(x) for x in
+                       message.split(', ')[1].split()[0:3:2]]
+        self.assertTrue(0 < kept < total)
@@ -0,0 +1,189 @@
+#!/usr/bin/python
+#
+# Copyright 2013 Michael K Johnson
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import mock
+import os
+import shutil
+import tempfile
+import unittest
+
+from lxml import etree
+
+from gpspixtrax import ddict
+from gpspixtrax import exiftool
+from gpspixtrax import gpspixtrax
+from gpspixtrax import writeback
+
+import fixtures
+
+UPDATED = '    1 image files updated\n'
+FAILED = ("    0 image files updated\n"
+          "    1 files weren't updated due to errors\n")
+
+class Test_writeback(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = os.path.join(self.directory, 'journal')
+        self.imagedata = [[
+            ddict.ddict(SourceFile=self.path('a.jpg'), GPSStatus='A',
+                        GPSLatitude=1.0, GPSLongitude=2.0),
+            ddict.ddict(SourceFile=self.path('b.jpg'), GPSStatus='V',
+                        GPSLatitude=9.0, GPSLongitude=9.0,
+                        fuzzlat=1.5, fuzzlon=-2.5, projlat=1.6, projlon=-2.6),
+            ddict.ddict(SourceFile=self.path('bad.jpg'), GPSStatus='V',
+                        GPSLatitude=9.0, GPSLongitude=9.0),
+        ], [
+            ddict.ddict(SourceFile=self.path('c.jpg'), GPSStatus='V',
+                        GPSLatitude=9.0, GPSLongitude=9.0,
+                        projlat=-70.5, projlon=170.25),
+            ddict.ddict(SourceFile=self.path('d.jpg'), GPSStatus='V'),
+        ]]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_changes(self):
+        C = writeback.Change
+        self.assertEqual(writeback.changes(self.imagedata, strip=True), [
+            C(self.path('b.jpg'), 1.5, -2.5, 'fuzz'),
+            C(self.path('bad.jpg'), None, None, None),
+            C(self.path('c.jpg'), None, None, None),
+        ])
+        # stale positions are left alone unless asked
+        self.assertEqual(writeback.changes(self.imagedata,
+                                           sources=('fuzz', 'proj')), [
+            C(self.path('b.jpg'), 1.5, -2.5, 'fuzz'),
+            C(self.path('c.jpg'), -70.5, 170.25, 'proj'),
+        ])
+
+    @mock.patch('gpspixtrax.exiftool.invoke_exiftool')
+    def test_changes_parsed(self, I):
+        I.return_value = fixtures.read('selectdata.json.xz')
+        imagedata = exiftool.fetchdata(mock.Mock())
+        G = gpspixtrax.GPSPixTrax(imagedata)
+        G.parse()
+        images = dict((x.SourceFile, x) for y in imagedata for x in y)
+        W = G.writeback(strip=True)
+        self.assertTrue(W.changes)
+        for change in W.changes:
+            image = images[change.file]
+            self.assertEqual(image.GPSStatus, 'V')
+            if change.lat is None:
+                self.assertFalse('fuzzlat' in image)
+            else:
+                self.assertEqual((change.lat, change.lon),
+                                 (image.fuzzlat, image.fuzzlon))
+
+    def test_exiftoolargs(self):
+        args = writeback.exiftoolargs(
+            writeback.Change('x.jpg', -1.5, 2.25, 'fuzz'), backup=False)
+        self.assertEqual(args[0:6], ['-n', '-overwrite_original',
+                                     '-GPSLatitude=1.5', '-GPSLatitudeRef=S',
+                                     '-GPSLongitude=2.25',
+                                     '-GPSLongitudeRef=E'])
+        self.assertTrue('-GPSSpeed=' in args)
+        self.assertEqual(args[-1], 'x.jpg')
+        self.assertEqual(writeback.exiftoolargs(
+            writeback.Change('x.jpg', None, None, None)),
+            ['-n', '-GPS:all=', 'x.jpg'])
+
+    @mock.patch('gpspixtrax.writeback.Journal.flush', autospec=True)
+    @mock.patch('gpspixtrax.exiftool.ExifToolWorker')
+    def test_write_resume(self, W, F):
+        W.return_value.executemany.side_effect = lambda commands: [
+            FAILED if 'bad' in x[-1] else UPDATED for x in commands]
+        B = writeback.WriteBack(self.imagedata, journal=self.journal,
+                                strip=True)
+        self.assertEqual(B.write(workers=2, batchsize=1),
+                         {'skipped': 0, 'ok': 2, 'error': 1})
+        B.close()
+        entries = [json.loads(x) for x in open(self.journal)]
+        self.assertEqual([(os.path.basename(x['file']), x['status'])
+                          for x in entries],
+                         [('b.jpg', 'ok'), ('bad.jpg', 'error'),
+                          ('c.jpg', 'ok')])
+        self.assertTrue('errors' in entries[1]['detail'])
+        # flushed as each of the three batches finished, and at the end
+        self.assertEqual(F.call_count, 4)
+        # a half-written last line, as after a crash
+        open(self.journal, 'a').write('{"file": ')
+        W.reset_mock()
+        B = writeback.WriteBack(self.imagedata, journal=self.journal,
+                                strip=True)
+        self.assertEqual(B.pending(),
+                         [writeback.Change(self.path('bad.jpg'), None, None,
+                                           None)])
+        self.assertEqual(B.write(workers=2),
+                         {'skipped': 2, 'error': 1})
+        B.close()
+        commands = [y for x in W.return_value.executemany.call_args_list
+                    for y in x[0][0]]
+        self.assertEqual([x[-1] for x in commands], [self.path('bad.jpg')])
+
+    @mock.patch('gpspixtrax.exiftool.ExifToolWorker')
+    def test_dryrun(self, W):
+        B = writeback.WriteBack(self.imagedata, journal=self.journal,
+                                strip=True, dryrun=True)
+        self.assertEqual(B.write(), {'skipped': 0, 'dryrun': 3})
+        self.assertEqual(B.writesidecars(),
+                         {'skipped': 0, 'dryrun': 1, 'nosidecar': 2})
+        B.close()
+        self.assertEqual(W.call_count, 0)
+        self.assertEqual(sorted(os.listdir(self.directory)), [])
+
+    def test_sidecars(self):
+        open(self.path('c.jpg.xmp'), 'w').write('<x:xmpmeta/>')
+        B = writeback.WriteBack(self.imagedata, journal=self.journal,
+                                sources=('fuzz', 'proj'), strip=True)
+        self.assertEqual(B.writesidecars(),
+                         {'skipped': 0, 'ok': 1, 'error': 1, 'nosidecar': 1})
+        B.close()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['b.jpg.xmp', 'c.jpg.xmp', 'journal'])
+        root = etree.parse(self.path('b.jpg.xmp')).getroot()
+        exif = '{http://ns.adobe.com/exif/1.0/}'
+        self.assertEqual(root.find('.//%sGPSLatitude' %exif).text,
+                         '1,30.00000000N')
+        self.assertEqual(root.find('.//%sGPSLongitude' %exif).text,
+                         '2,30.00000000W')
+        self.assertEqual(open(self.path('c.jpg.xmp')).read(), '<x:xmpmeta/>')
+        # our own sidecars are replaced, others only when asked
+        B = writeback.WriteBack(self.imagedata, sources=('fuzz', 'proj'),
+                                strip=True)
+        self.assertEqual(B.writesidecars(),
+                         {'skipped': 0, 'ok': 1, 'error': 1, 'nosidecar': 1})
+        self.assertEqual(B.writesidecars(overwrite=True),
+                         {'skipped': 0, 'ok': 2, 'nosidecar': 1})
+        self.assertTrue(
+            '70,30.00000000S' in open(self.path('c.jpg.xmp')).read())
+
+    def test_sidecar_raw_jpeg(self):
+        # the two files of one shot each get their own sidecar
+        self.assertEqual(writeback.sidecar('a/DSC0001.ARW'),
+                         'a/DSC0001.ARW.xmp')
+        self.assertEqual(writeback.sidecar('a/DSC0001.JPG'),
+                         'a/DSC0001.JPG.xmp')
+
+    def test_xmpcoordinate(self):
+        self.assertEqual(writeback.xmpcoordinate(70.0833613888889, 'N', 'S'),
+                         '70,5.00168333N')
+        self.assertEqual(writeback.xmpcoordinate(-0.999999999999, 'E', 'W'),
+                         '1,0.00000000W')